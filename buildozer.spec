@@ -23,7 +23,7 @@ version = 1.0.0
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3,kivy,pillow
+requirements = python3,kivy,pillow,sqlite3
 
 # (str) Presplash of the application
 #presplash.filename = %(source.dir)s/data/presplash.png
@@ -33,6 +33,7 @@ from services.firebase_service import FirebaseService
 from services.pedometer_service import PedometerService
 from services.camera_service import CameraService
 from utils.storage_manager import StorageManager
+from utils.locks import DataDirLockedError
 from utils.error_handler import ErrorHandler, NetworkErrorHandler, GPSErrorHandler
 from utils.performance_monitor import PerformanceMonitor
 
@@ -106,8 +107,8 @@ class HealthApp(App):
         # 应用UI组件中文字体补丁
         patch_kivy_defaults()
         
-        # 初始化服务
-        self.storage = StorageManager()
+        # 初始化服务（存储在 build 中打开，数据目录可能被其他实例占用）
+        self.storage = None
         self.gps_service = GPSService()
         self.food_api = FoodAPIService()
         self.firebase = FirebaseService()
@@ -138,6 +139,16 @@ class HealthApp(App):
         # 请求权限
         self.request_permissions()
         
+        # 打开数据目录（在界面线程中，被占用时不等待）
+        try:
+            self.storage = StorageManager(run_journal=True, write_behind=True, lock_timeout=0)
+        except DataDirLockedError as e:
+            self.error_handler.handle_error(e, "数据目录正被其他应用实例使用", show_user_dialog=False)
+            return self.build_error_screen('数据目录正被另一个应用实例使用\n请关闭其他实例后重新打开应用')
+        except Exception as e:
+            self.error_handler.handle_error(e, "打开数据目录失败", show_user_dialog=False)
+            return self.build_error_screen(f'打开数据失败: {e}\n请重新打开应用')
+        
         # 初始化数据
         self.load_user_data()
         
@@ -147,6 +158,14 @@ class HealthApp(App):
         # 返回主布局
         return MainLayout()
     
+    def build_error_screen(self, message):
+        """无法打开数据目录时显示的界面"""
+        return Label(
+            text=message,
+            halign='center',
+            font_name='Chinese'
+        )
+    
     
     def request_permissions(self):
         """请求必要权限"""
@@ -196,20 +215,27 @@ class HealthApp(App):
     
     def save_user_data(self):
         """保存用户数据"""
+        if not self.storage:
+            return
         try:
             self.storage.save_user_data(self.user_data)
-            self.storage.save_daily_nutrition(self.daily_nutrition)
         except Exception as e:
             print(f"保存用户数据失败: {e}")
     
     def on_pause(self):
         """应用暂停时保存数据"""
         self.save_user_data()
+        if self.storage:
+            self.storage.flush()
         return True
     
     def on_stop(self):
         """应用停止时清理资源"""
         self.save_user_data()
+        if self.storage:
+            self.storage.compact_all_run_journals()
+            self.storage.archive_closed_months()
+            self.storage.close()
         if self.gps_service:
             self.gps_service.stop_tracking()
     
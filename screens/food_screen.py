@@ -19,11 +19,15 @@ from kivy.app import App
 from datetime import datetime
 import threading
 
+from utils.records import FoodEntry, DayNutrition
+
 class FoodEditPopup(Popup):
     """食物编辑弹窗"""
     
     def __init__(self, food_data=None, callback=None, **kwargs):
         super().__init__(**kwargs)
+        if isinstance(food_data, FoodEntry):
+            food_data = food_data.to_dict()
         self.food_data = food_data or {}
         self.callback = callback
         self.title = 'Edit Food'  # 使用英文标题避免中文字体问题
@@ -218,19 +222,19 @@ class FoodEditPopup(Popup):
             # 按照份量和份数计算
             multiplier = (serving_size / 100) * servings
             
-            food_record = {
-                'name': self.name_input.text,
-                'brand': self.brand_input.text,
-                'serving_size': serving_size,
-                'servings': servings,
-                'calories': base_calories * multiplier,
-                'protein': base_protein * multiplier,
-                'carbs': base_carbs * multiplier,
-                'fat': base_fat * multiplier,
-                'meal_type': self.meal_spinner.text,
-                'date': self.date_input.text,
-                'timestamp': datetime.now().isoformat()
-            }
+            food_record = FoodEntry(
+                name=self.name_input.text,
+                brand=self.brand_input.text,
+                serving_size=serving_size,
+                servings=servings,
+                calories=base_calories * multiplier,
+                protein=base_protein * multiplier,
+                carbs=base_carbs * multiplier,
+                fat=base_fat * multiplier,
+                meal_type=self.meal_spinner.text,
+                date=self.date_input.text,
+                timestamp=datetime.now().isoformat()
+            )
             
             if self.callback:
                 self.callback(food_record)
@@ -254,12 +258,7 @@ class FoodScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.today_foods = []
-        self.daily_nutrition = {
-            'calories': 0,
-            'protein': 0,
-            'carbs': 0,
-            'fat': 0
-        }
+        self.daily_nutrition = DayNutrition()
         
         self.build_ui()
         self.load_today_data()
@@ -615,33 +614,24 @@ class FoodScreen(Screen):
         edit_popup.open()
     
     def add_food_record(self, food_record):
-        """添加食物记录"""
+        """添加食物记录（营养汇总由存储层增量维护）"""
         try:
-            # 保存到今日列表
-            self.today_foods.append(food_record)
-            
-            # 更新营养统计
-            self.daily_nutrition['calories'] += food_record['calories']
-            self.daily_nutrition['protein'] += food_record['protein']
-            self.daily_nutrition['carbs'] += food_record['carbs']
-            self.daily_nutrition['fat'] += food_record['fat']
-            
-            # 更新显示
-            self.update_nutrition_display()
-            self.update_food_list()
-            
-            # 保存到存储
-            self.save_food_data()
+            app = App.get_running_app()
+            if app and hasattr(app, 'storage'):
+                today = datetime.now().strftime('%Y-%m-%d')
+                data = app.storage.add_food_entry(today, food_record)
+                if data is not None:
+                    self.show_day_data(data)
             
         except Exception as e:
             print(f"添加食物记录失败: {e}")
     
     def update_nutrition_display(self):
         """更新营养统计显示"""
-        self.calories_stat.text = f'热量\n{self.daily_nutrition["calories"]:.0f} kcal'
-        self.protein_stat.text = f'蛋白质\n{self.daily_nutrition["protein"]:.1f} g'
-        self.carbs_stat.text = f'碳水\n{self.daily_nutrition["carbs"]:.1f} g'
-        self.fat_stat.text = f'脂肪\n{self.daily_nutrition["fat"]:.1f} g'
+        self.calories_stat.text = f'热量\n{self.daily_nutrition.calories:.0f} kcal'
+        self.protein_stat.text = f'蛋白质\n{self.daily_nutrition.protein:.1f} g'
+        self.carbs_stat.text = f'碳水\n{self.daily_nutrition.carbs:.1f} g'
+        self.fat_stat.text = f'脂肪\n{self.daily_nutrition.fat:.1f} g'
     
     def update_food_list(self):
         """更新食物列表显示"""
@@ -651,8 +641,7 @@ class FoodScreen(Screen):
         # 按餐次分组
         meals = {'早餐': [], '午餐': [], '晚餐': [], '加餐': []}
         for food in self.today_foods:
-            meal_type = food.get('meal_type', '加餐')
-            meals[meal_type].append(food)
+            meals.setdefault(food.meal_type, []).append(food)
         
         # 显示各餐次
         for meal_type, foods in meals.items():
@@ -688,7 +677,7 @@ class FoodScreen(Screen):
         info_layout = BoxLayout(orientation='vertical', size_hint_x=0.7)
         
         name_label = Label(
-            text=f'{food_data["name"]} - {food_data.get("brand", "")}',
+            text=f'{food_data.name} - {food_data.brand}',
             size_hint_y=0.6,
             text_size=(None, None),
             halign='left',
@@ -697,7 +686,7 @@ class FoodScreen(Screen):
         info_layout.add_widget(name_label)
         
         nutrition_label = Label(
-            text=f'{food_data["calories"]:.0f}kcal | P:{food_data["protein"]:.1f}g C:{food_data["carbs"]:.1f}g F:{food_data["fat"]:.1f}g',
+            text=f'{food_data.calories:.0f}kcal | P:{food_data.protein:.1f}g C:{food_data.carbs:.1f}g F:{food_data.fat:.1f}g',
             size_hint_y=0.4,
             font_size='12sp',
             color=[0.7, 0.7, 0.7, 1],
@@ -739,28 +728,16 @@ class FoodScreen(Screen):
     def edit_food_item(self, food_data):
         """编辑食物项目"""
         def update_callback(updated_food):
-            # 找到并更新原记录
-            for i, food in enumerate(self.today_foods):
-                if food.get('timestamp') == food_data.get('timestamp'):
-                    # 更新营养统计（减去原来的，加上新的）
-                    self.daily_nutrition['calories'] -= food['calories']
-                    self.daily_nutrition['protein'] -= food['protein']
-                    self.daily_nutrition['carbs'] -= food['carbs']
-                    self.daily_nutrition['fat'] -= food['fat']
-                    
-                    self.daily_nutrition['calories'] += updated_food['calories']
-                    self.daily_nutrition['protein'] += updated_food['protein']
-                    self.daily_nutrition['carbs'] += updated_food['carbs']
-                    self.daily_nutrition['fat'] += updated_food['fat']
-                    
-                    # 更新记录
-                    self.today_foods[i] = updated_food
-                    break
-            
-            # 更新显示
-            self.update_nutrition_display()
-            self.update_food_list()
-            self.save_food_data()
+            try:
+                app = App.get_running_app()
+                if app and hasattr(app, 'storage'):
+                    today = datetime.now().strftime('%Y-%m-%d')
+                    data = app.storage.update_food_entry(today, food_data.timestamp, updated_food)
+                    if data is not None:
+                        self.show_day_data(data)
+                        
+            except Exception as e:
+                print(f"修改食物记录失败: {e}")
         
         edit_popup = FoodEditPopup(
             food_data=food_data,
@@ -777,7 +754,7 @@ class FoodScreen(Screen):
         )
         
         content = BoxLayout(orientation='vertical', spacing=10, padding=10)
-        content.add_widget(Label(text=f'确定要删除"{food_data["name"]}"吗？',
+        content.add_widget(Label(text=f'确定要删除"{food_data.name}"吗？',
             font_name='Chinese'
         ))
         
@@ -803,58 +780,32 @@ class FoodScreen(Screen):
         """执行删除操作"""
         popup.dismiss()
         
-        # 从列表中移除
-        for i, food in enumerate(self.today_foods):
-            if food.get('timestamp') == food_data.get('timestamp'):
-                # 更新营养统计
-                self.daily_nutrition['calories'] -= food['calories']
-                self.daily_nutrition['protein'] -= food['protein']
-                self.daily_nutrition['carbs'] -= food['carbs']
-                self.daily_nutrition['fat'] -= food['fat']
-                
-                # 移除记录
-                self.today_foods.pop(i)
-                break
-        
-        # 更新显示
-        self.update_nutrition_display()
-        self.update_food_list()
-        self.save_food_data()
-    
-    def load_today_data(self):
-        """加载今日数据"""
         try:
             app = App.get_running_app()
             if app and hasattr(app, 'storage'):
                 today = datetime.now().strftime('%Y-%m-%d')
-                data = app.storage.load_daily_food_data(today)
-                
-                self.today_foods = data.get('foods', [])
-                self.daily_nutrition = data.get('nutrition', {
-                    'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0
-                })
-                
-                self.update_nutrition_display()
-                self.update_food_list()
-                
+                data = app.storage.delete_food_entry(today, food_data.timestamp)
+                if data is not None:
+                    self.show_day_data(data)
+                    
         except Exception as e:
-            print(f"加载今日数据失败: {e}")
+            print(f"删除食物记录失败: {e}")
     
-    def save_food_data(self):
-        """保存食物数据"""
+    def load_today_data(self):
+        """加载今日数据"""
         try:
             app = App.get_running_app()
             if app and hasattr(app, 'storage'):
                 today = datetime.now().strftime('%Y-%m-%d')
-                data = {
-                    'foods': self.today_foods,
-                    'nutrition': self.daily_nutrition,
-                    'date': today
-                }
-                print(f"🍎 食物屏幕：保存 {today} 的数据，共 {len(self.today_foods)} 个食物")
-                print(f"📊 食物屏幕：营养数据 - 卡路里: {self.daily_nutrition['calories']}")
-                app.storage.save_daily_food_data(today, data)
-                print(f"✅ 食物屏幕：数据保存成功")
+                self.show_day_data(app.storage.load_daily_food_data(today))
                 
         except Exception as e:
-            print(f"❌ 保存食物数据失败: {e}")
+            print(f"加载今日数据失败: {e}")
+    
+    def show_day_data(self, data):
+        """显示存储层返回的当天数据（使用保存的营养汇总，旧数据缺少汇总时按条目计算）"""
+        self.today_foods = [FoodEntry.from_dict(food) for food in data.get('foods', [])]
+        self.daily_nutrition = App.get_running_app().storage.get_day_nutrition(data)
+        
+        self.update_nutrition_display()
+        self.update_food_list()
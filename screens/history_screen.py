@@ -15,6 +15,8 @@ from kivy.app import App
 from datetime import datetime, timedelta
 import calendar
 
+from utils.track_metrics import analyze_route, run_summary
+
 class HistoryScreen(Screen):
     """历史记录屏幕"""
     
@@ -37,7 +39,7 @@ class HistoryScreen(Screen):
         ))
         
         # 筛选按钮
-        filter_btn = Button(
+        self.filter_btn = filter_btn = Button(
             text='本月',
             size_hint_x=0.3,
             background_color=[0.2, 0.6, 1, 1]
@@ -131,6 +133,9 @@ class HistoryScreen(Screen):
         # 获取该月的日历
         cal = calendar.monthcalendar(year, month)
         
+        # 一次查询当月有记录的日期
+        dates_with_data = self.get_dates_with_data(year, month)
+        
         for week in cal:
             for day in week:
                 if day == 0:
@@ -144,7 +149,7 @@ class HistoryScreen(Screen):
                     date_str = f"{year:04d}-{month:02d}-{day:02d}"
                     
                     # 检查是否有记录
-                    has_data = self.has_data_for_date(date_str)
+                    has_data = date_str in dates_with_data
                     
                     btn = Button(
                         text=str(day),
@@ -156,27 +161,22 @@ class HistoryScreen(Screen):
                     btn.bind(on_press=lambda x, date=date_str: self.select_date(date))
                     self.calendar_grid.add_widget(btn)
     
-    def has_data_for_date(self, date_str):
-        """检查指定日期是否有数据"""
+    def get_dates_with_data(self, year, month):
+        """获取指定月份有记录的日期集合"""
         try:
             app = App.get_running_app()
             if not app or not hasattr(app, 'storage'):
-                return False
-            
-            # 检查跑步记录
-            run_data = app.storage.load_daily_run_data(date_str)
-            if run_data.get('runs'):
-                return True
-            
-            # 检查饮食记录
-            food_data = app.storage.load_daily_food_data(date_str)
-            if food_data.get('foods'):
-                return True
+                return set()
             
-            return False
+            return app.storage.dates_with_data(year, month)
             
         except:
-            return False
+            return set()
+    
+    def has_data_for_date(self, date_str):
+        """检查指定日期是否有数据"""
+        year, month = int(date_str[:4]), int(date_str[5:7])
+        return date_str in self.get_dates_with_data(year, month)
     
     def prev_month(self, instance):
         """上一月"""
@@ -239,7 +239,7 @@ class HistoryScreen(Screen):
             # 加载饮食记录
             food_data = app.storage.load_daily_food_data(date_str)
             foods = food_data.get('foods', [])
-            nutrition = food_data.get('nutrition', {})
+            nutrition = app.storage.get_day_nutrition(food_data).to_dict()
             
             if foods:
                 # 饮食记录标题
@@ -396,7 +396,7 @@ class HistoryScreen(Screen):
         """显示跑步详情"""
         popup = Popup(
             title='跑步详情',
-            size_hint=(0.8, 0.7)
+            size_hint=(0.85, 0.85)
         )
         
         content = BoxLayout(orientation='vertical', spacing=10, padding=10)
@@ -414,7 +414,7 @@ class HistoryScreen(Screen):
         pace_min = int(avg_pace)
         pace_sec = int((avg_pace - pace_min) * 60)
         
-        info_grid = GridLayout(cols=2, spacing=10, size_hint_y=0.6)
+        info_grid = GridLayout(cols=2, spacing=10, size_hint_y=0.7)
         
         info_grid.add_widget(Label(text='距离:', halign='left',
             font_name='Chinese'
@@ -444,8 +444,55 @@ class HistoryScreen(Screen):
             font_name='Chinese'
         ))
         
+        # 轨迹按需加载（列表中只保存跑步摘要）
+        track = self.load_run_track(run)
+        info_grid.add_widget(Label(text='轨迹点数:', halign='left',
+            font_name='Chinese'
+        ))
+        info_grid.add_widget(Label(text=f'{len(track)}', halign='left',
+            font_name='Chinese'
+        ))
+        
+        # 轨迹指标（保存时已计算；早期记录按轨迹现算）
+        metrics = self.get_run_metrics(run, track)
+        if metrics:
+            moving = metrics['moving_time']
+            info_grid.add_widget(Label(text='移动时间:', halign='left',
+                font_name='Chinese'
+            ))
+            info_grid.add_widget(Label(
+                text=f'{int(moving // 3600):02d}:{int(moving % 3600 // 60):02d}:{int(moving % 60):02d}',
+                halign='left', font_name='Chinese'
+            ))
+            
+            info_grid.add_widget(Label(text='最大速度:', halign='left',
+                font_name='Chinese'
+            ))
+            info_grid.add_widget(Label(text=f"{metrics['max_speed'] * 3.6:.1f} km/h", halign='left',
+                font_name='Chinese'
+            ))
+            
+            info_grid.add_widget(Label(text='累计爬升:', halign='left',
+                font_name='Chinese'
+            ))
+            info_grid.add_widget(Label(text=f"{metrics['elevation_gain']:.0f} m", halign='left',
+                font_name='Chinese'
+            ))
+        
         content.add_widget(info_grid)
         
+        # 每公里分段配速
+        if metrics and metrics['splits']:
+            lines = []
+            for i, split in enumerate(metrics['splits'], 1):
+                split_pace = split['duration'] / 60 / (split['distance'] / 1000)
+                label = f'{i}km' if split['distance'] >= 999 else f"{split['distance'] / 1000:.2f}km"
+                lines.append(f"{label}  {int(split_pace)}'{int((split_pace % 1) * 60):02d}\"")
+            rows = ['   '.join(lines[i:i + 4]) for i in range(0, len(lines), 4)]
+            content.add_widget(Label(text='分段配速:\n' + '\n'.join(rows), size_hint_y=0.25,
+                font_name='Chinese'
+            ))
+        
         # 关闭按钮
         close_btn = Button(text='关闭', size_hint_y=0.15,
             font_name='Chinese'
@@ -456,6 +503,38 @@ class HistoryScreen(Screen):
         popup.content = content
         popup.open()
     
+    def get_run_metrics(self, run, track):
+        """获取跑步的轨迹指标（移动时间、最大速度、爬升、分段）"""
+        if run.get('moving_time') is not None:
+            return {
+                'moving_time': run.get('moving_time', 0),
+                'max_speed': run.get('max_speed', 0),
+                'elevation_gain': run.get('elevation_gain', 0),
+                'splits': run.get('splits') or []
+            }
+        
+        if len(track) < 2:
+            return None
+        
+        try:
+            return run_summary(analyze_route(track))
+        except Exception as e:
+            print(f"计算轨迹指标失败: {e}")
+            return None
+    
+    def load_run_track(self, run):
+        """加载跑步轨迹"""
+        try:
+            app = App.get_running_app()
+            if not app or not hasattr(app, 'storage'):
+                return []
+            
+            return app.storage.get_run_track(run)
+            
+        except Exception as e:
+            print(f"加载跑步轨迹失败: {e}")
+            return []
+    
     def show_filter_options(self, instance):
         """显示筛选选项"""
         popup = Popup(
@@ -476,18 +555,68 @@ class HistoryScreen(Screen):
             btn = Button(text=text, size_hint_y=0.25,
             font_name='Chinese'
         )
-            btn.bind(on_press=lambda x, d=days: self.apply_filter(d, popup))
+            btn.bind(on_press=lambda x, d=days, t=text: self.apply_filter(d, popup, t))
             content.add_widget(btn)
         
         popup.content = content
         popup.open()
     
-    def apply_filter(self, days, popup):
-        """应用筛选"""
+    def apply_filter(self, days, popup, title=None):
+        """应用筛选：按时间范围显示趋势汇总（读取存储层的日/周汇总表）"""
         popup.dismiss()
         
-        # 这里可以实现筛选逻辑
-        # 暂时只是切换到当前月份
         self.current_date = datetime.now()
         self.month_label.text = self.current_date.strftime('%Y年%m月')
         self.update_calendar()
+        
+        if title:
+            self.filter_btn.text = title
+        
+        self.details_layout.clear_widgets()
+        
+        try:
+            app = App.get_running_app()
+            if not app or not hasattr(app, 'storage'):
+                return
+            
+            end_date = self.current_date.strftime('%Y-%m-%d')
+            start_date = (self.current_date - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+            
+            # 短范围按天，长范围按周
+            granularity = 'day' if days <= 31 else 'week'
+            
+            periods, distances = app.storage.get_rollup('run_distance', granularity, start_date, end_date)
+            _, run_counts = app.storage.get_rollup('run_count', granularity, start_date, end_date)
+            _, calories = app.storage.get_rollup('food_calories', granularity, start_date, end_date)
+            
+            self.details_title.text = f'{start_date} 至 {end_date} 趋势'
+            
+            summary = Label(
+                text=f'跑步 {sum(run_counts):.0f}次 | {sum(distances)/1000:.2f}km | ' +
+                     f'摄入 {sum(calories):.0f}kcal',
+                size_hint_y=None,
+                height=30,
+                font_size='16sp',
+                color=[0.8, 0.8, 1, 1],
+                font_name='Chinese'
+            )
+            self.details_layout.add_widget(summary)
+            
+            # 只列出有数据的周期，最近的在前
+            for i in reversed(range(len(periods))):
+                if not run_counts[i] and not calories[i]:
+                    continue
+                
+                item = Label(
+                    text=f'{periods[i]}:  跑步 {run_counts[i]:.0f}次 {distances[i]/1000:.2f}km | ' +
+                         f'摄入 {calories[i]:.0f}kcal',
+                    size_hint_y=None,
+                    height=25,
+                    font_size='12sp',
+                    color=[0.7, 0.7, 0.7, 1],
+                    font_name='Chinese'
+                )
+                self.details_layout.add_widget(item)
+                
+        except Exception as e:
+            print(f"加载趋势汇总失败: {e}")
@@ -12,75 +12,166 @@ from kivy.uix.gridlayout import GridLayout
 from kivy.uix.popup import Popup
 from kivy.uix.textinput import TextInput
 from kivy.clock import Clock
-from kivy.graphics import Line, Color, Ellipse
+from kivy.graphics import Line, Color, Ellipse, InstructionGroup
 from kivy.uix.widget import Widget
 from kivy.app import App
+from array import array
 from datetime import datetime
-import math
+
+from utils.records import RunRecord
+from utils.track_metrics import haversine_distance, route_distance_source
+from utils.pace_estimator import PaceEstimator
+from utils.route_simplify import DISPLAY_TOLERANCE, StreamSimplifier
+
+# 地图路线每条 Line 最多包含的点数：新定位只重新赋值最后一段
+ROUTE_CHUNK_POINTS = 256
 
 class MapWidget(Widget):
-    """地图显示组件"""
+    """地图显示组件
+    
+    路线保存在扁平的 array('f') 缓冲区中（相对起点的经度差、纬度差交替存放），
+    画布上的路线按固定点数分成多条 Line（相邻两段共用端点）：新定位只投影
+    一个点并重新赋值最后一段，开销与路线总长无关；组件尺寸、位置或缩放
+    比例变化时才重新投影整条路线。
+    显示的路线经过流式简化，误差不超过 tolerance 像素；缩放比例变化时
+    按新的容差从完整缓冲区重新简化。
+    """
+    
+    # 默认缩放比例（屏幕像素/度）
+    DEFAULT_SCALE = 100000
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.route_points = []
+        self.origin = None              # 起点 (纬度, 经度)，双精度保存
+        self.route_buffer = array('f')  # 相对起点的偏移量 [经度差, 纬度差, ...]
         self.current_location = None
+        self.scale = self.DEFAULT_SCALE
+        self.tolerance = DISPLAY_TOLERANCE
+        self.simplifier = StreamSimplifier(self.tolerance / self.scale)
+        
+        self.route_group = InstructionGroup()
+        self.route_chunks = []          # 各段 Line，只有最后一段会变化
+        self.tail_points = []           # 最后一段的屏幕坐标 [x, y, ...]
+        
+        with self.canvas:
+            Color(0, 1, 0, 1)  # 绿色路线
+        self.canvas.add(self.route_group)
+        with self.canvas:
+            Color(1, 0, 0, 1)  # 红色当前位置
+            self.location_marker = Ellipse(pos=self.center, size=(0, 0))
+        
+        self.bind(pos=self.reproject, size=self.reproject)
+    
+    @property
+    def point_count(self):
+        """路线点数"""
+        return len(self.route_buffer) // 2
         
     def update_location(self, lat, lon):
-        """更新当前位置"""
+        """更新当前位置（只投影新增的点）"""
+        if self.origin is None:
+            self.origin = (lat, lon)
+        
+        dlon = lon - self.origin[1]
+        dlat = lat - self.origin[0]
+        self.route_buffer.append(dlon)
+        self.route_buffer.append(dlat)
         self.current_location = (lat, lon)
-        self.route_points.append((lat, lon))
-        self.draw_route()
         
-    def draw_route(self):
-        """绘制跑步路线"""
-        self.canvas.clear()
+        x, y = self.offset_to_screen(dlon, dlat)
+        if self.simplifier.add(dlon, dlat):
+            self.append_route_point(x, y)
+        else:
+            # 新点仍在容差内，只移动折线末端
+            self.tail_points[-2:] = [x, y]
+            self.route_chunks[-1].points = self.tail_points
+        self.draw_marker(x, y)
+    
+    def add_route_chunk(self, points):
+        """在路线末尾新增一段 Line"""
+        self.tail_points = points
+        line = Line(points=points, width=3)
+        self.route_group.add(line)
+        self.route_chunks.append(line)
+    
+    def append_route_point(self, x, y):
+        """路线末尾追加一个点：最后一段已满时从其端点开始新的一段"""
+        if not self.route_chunks:
+            self.add_route_chunk([x, y])
+        elif len(self.tail_points) >= 2 * ROUTE_CHUNK_POINTS:
+            self.add_route_chunk(self.tail_points[-2:] + [x, y])
+        else:
+            self.tail_points += [x, y]
+            self.route_chunks[-1].points = self.tail_points
+    
+    def clear_route_chunks(self):
+        """移除画布上的全部路线段"""
+        self.route_group.clear()
+        self.route_chunks = []
+        self.tail_points = []
         
-        if len(self.route_points) < 2:
+    def draw_route(self):
+        """按当前尺寸和缩放比例重新投影整条（简化后的）路线"""
+        buffer = self.simplifier.vertices
+        cx, cy, scale = self.center_x, self.center_y, self.scale
+        
+        points = [0.0] * len(buffer)
+        for i in range(0, len(buffer), 2):
+            points[i] = cx + buffer[i] * scale
+            points[i + 1] = cy + buffer[i + 1] * scale
+        
+        # 按段重建，相邻两段共用一个端点
+        self.clear_route_chunks()
+        chunk_size = 2 * ROUTE_CHUNK_POINTS
+        start = 0
+        while start < len(points):
+            self.add_route_chunk(points[start:start + chunk_size])
+            if start + chunk_size >= len(points):
+                break
+            start += chunk_size - 2
+        
+        if self.current_location:
+            self.draw_marker(*self.gps_to_screen(*self.current_location))
+    
+    def reproject(self, *args):
+        """组件位置或尺寸变化时重新投影"""
+        self.draw_route()
+    
+    def set_scale(self, scale):
+        """设置缩放比例（屏幕像素/度），按新的容差重新简化并投影"""
+        if scale <= 0 or scale == self.scale:
             return
-            
-        with self.canvas:
-            # 绘制路线
-            Color(0, 1, 0, 1)  # 绿色路线
-            points = []
-            
-            # 将GPS坐标转换为屏幕坐标
-            for lat, lon in self.route_points:
-                x, y = self.gps_to_screen(lat, lon)
-                points.extend([x, y])
-            
-            if len(points) >= 4:
-                Line(points=points, width=3)
-            
-            # 绘制当前位置
-            if self.current_location:
-                Color(1, 0, 0, 1)  # 红色当前位置
-                x, y = self.gps_to_screen(*self.current_location)
-                Ellipse(pos=(x-5, y-5), size=(10, 10))
+        self.scale = scale
+        self.simplifier = StreamSimplifier(self.tolerance / scale)
+        self.simplifier.extend(self.route_buffer)
+        self.draw_route()
+    
+    def draw_marker(self, x, y):
+        """移动当前位置标记"""
+        self.location_marker.pos = (x - 5, y - 5)
+        self.location_marker.size = (10, 10)
+    
+    def offset_to_screen(self, dlon, dlat):
+        """相对起点的偏移量转屏幕坐标"""
+        return self.center_x + dlon * self.scale, self.center_y + dlat * self.scale
     
     def gps_to_screen(self, lat, lon):
         """GPS坐标转屏幕坐标（简化实现）"""
         # 这里是简化的坐标转换，实际应用需要更复杂的地图投影
-        if not self.route_points:
+        if self.origin is None:
             return self.center_x, self.center_y
-            
-        # 计算相对于第一个点的偏移
-        first_lat, first_lon = self.route_points[0]
         
-        # 简单的线性映射
-        lat_offset = (lat - first_lat) * 100000  # 放大倍数
-        lon_offset = (lon - first_lon) * 100000
-        
-        x = self.center_x + lon_offset
-        y = self.center_y + lat_offset
-        
-        return x, y
+        # 相对于第一个点的偏移做简单的线性映射
+        return self.offset_to_screen(lon - self.origin[1], lat - self.origin[0])
     
     def clear_route(self):
         """清除路线"""
-        self.route_points = []
+        self.origin = None
+        self.route_buffer = array('f')
+        self.simplifier.reset()
         self.current_location = None
-        self.canvas.clear()
+        self.clear_route_chunks()
+        self.location_marker.size = (0, 0)
 
 class RunScreen(Screen):
     """跑步追踪主屏幕"""
@@ -97,6 +188,9 @@ class RunScreen(Screen):
         self.current_speed = 0
         self.average_speed = 0
         
+        # 当前速度按每次定位的实际时间在线平滑估计
+        self.pace_estimator = PaceEstimator()
+        
         # GPS数据
         self.last_location = None
         self.locations_history = []
@@ -261,6 +355,8 @@ class RunScreen(Screen):
         self.total_distance = 0
         self.pause_time = 0
         self.locations_history = []
+        self.last_location = None
+        self.pace_estimator.reset()
         
         # 清除地图
         self.map_widget.clear_route()
@@ -308,6 +404,9 @@ class RunScreen(Screen):
         self.start_button.text = '暂停'
         self.start_button.background_color = [1, 1, 0, 1]  # 黄色
         
+        # 暂停期间的时间不计入当前配速
+        self.pace_estimator.reset()
+        
         # 重新开始GPS追踪
         self.start_gps_tracking()
         
@@ -387,11 +486,17 @@ class RunScreen(Screen):
         self.on_location_update(lat, lon, 0)
         return True
     
-    def on_location_update(self, lat, lon, altitude, accuracy=999, status='unknown'):
-        """GPS位置更新回调（包含GPS状态）"""
+    def on_location_update(self, lat, lon, altitude, accuracy=999, status='unknown', timestamp=None,
+                           moved=True):
+        """GPS位置更新回调（包含GPS状态，timestamp 为收到定位的时间）
+        
+        moved 为False时该时刻没有移动（位移在定位精度范围内）：只按该时间更新速度。
+        """
         if not self.is_running or self.is_paused:
             return
         
+        timestamp = timestamp or datetime.now()
+        
         # 更新GPS状态显示
         self.gps_status = status
         self.location_accuracy = accuracy
@@ -406,18 +511,18 @@ class RunScreen(Screen):
                 self.switch_to_gps_mode()
         
         # 如果使用GPS模式，处理GPS数据
-        if not self.use_pedometer:
+        if not self.use_pedometer and not moved:
+            # 原地不动：距离不变，速度随时间下降
+            self.current_speed = self.pace_estimator.update(timestamp, 0.0) * 3.6
+        elif not self.use_pedometer:
             current_location = (lat, lon)
             
-            # 计算距离
+            # 计算距离和当前速度（km/h）
+            distance = 0
             if self.last_location:
                 distance = self.calculate_distance(self.last_location, current_location)
                 self.total_distance += distance
-                
-                # 计算速度（km/h）
-                if len(self.locations_history) > 0:
-                    time_diff = 2  # 假设2秒间隔
-                    self.current_speed = (distance / 1000) / (time_diff / 3600)
+            self.current_speed = self.pace_estimator.update(timestamp, distance) * 3.6
             
             # 更新地图
             self.map_widget.update_location(lat, lon)
@@ -427,9 +532,10 @@ class RunScreen(Screen):
             self.locations_history.append({
                 'lat': lat,
                 'lon': lon,
-                'timestamp': datetime.now(),
+                'timestamp': timestamp,
                 'distance': self.total_distance,
                 'accuracy': accuracy,
+                'altitude': altitude,
                 'source': 'gps'
             })
     
@@ -438,21 +544,8 @@ class RunScreen(Screen):
         lat1, lon1 = loc1
         lat2, lon2 = loc2
         
-        # 使用Haversine公式
-        R = 6371000  # 地球半径（米）
-        
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lon = math.radians(lon2 - lon1)
-        
-        a = (math.sin(delta_lat/2) * math.sin(delta_lat/2) + 
-             math.cos(lat1_rad) * math.cos(lat2_rad) * 
-             math.sin(delta_lon/2) * math.sin(delta_lon/2))
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        
-        distance = R * c
-        return distance
+        # 与跑步结束后的轨迹分析使用同一Haversine公式
+        return haversine_distance(lat1, lon1, lat2, lon2)
     
     def update_display(self, dt):
         """更新显示数据"""
@@ -491,12 +584,14 @@ class RunScreen(Screen):
                 pace_sec = int((pace_seconds - pace_min) * 60)
                 self.avg_pace_label.text = f'平均: {pace_min}\'{pace_sec:02d}"/km'
                 
-                # 当前配速
-                if self.current_speed > 0:
-                    current_pace = 60 / self.current_speed
+                # 当前配速按当前时间估计（停止或定位中断时显示 --）
+                current_pace = self.pace_estimator.pace_at(datetime.now())
+                if current_pace > 0:
                     curr_min = int(current_pace)
                     curr_sec = int((current_pace - curr_min) * 60)
                     self.pace_label.text = f'配速: {curr_min}\'{curr_sec:02d}"/km'
+                else:
+                    self.pace_label.text = '配速: --\'--"/km'
         
         return True
     
@@ -515,15 +610,16 @@ class RunScreen(Screen):
             avg_pace = (total_seconds / 60) / (self.total_distance / 1000)
         
         # 构建记录数据
-        run_record = {
-            'date': self.start_time.strftime('%Y-%m-%d'),
-            'start_time': self.start_time.isoformat(),
-            'duration': total_seconds,
-            'distance': self.total_distance,
-            'average_pace': avg_pace,
-            'route': self.locations_history,
-            'calories': int(self.total_distance * 0.05),  # 简单估算卡路里
-        }
+        run_record = RunRecord(
+            date=self.start_time.strftime('%Y-%m-%d'),
+            start_time=self.start_time.isoformat(),
+            duration=total_seconds,
+            distance=self.total_distance,
+            distance_source=route_distance_source(self.locations_history),
+            average_pace=avg_pace,
+            route=self.locations_history,
+            calories=int(self.total_distance * 0.05),  # 简单估算卡路里
+        )
         
         try:
             # 保存到本地存储
@@ -544,13 +640,13 @@ class RunScreen(Screen):
         content.add_widget(Label(text='跑步完成！', font_size='20sp',
             font_name='Chinese'
         ))
-        content.add_widget(Label(text=f'距离: {record["distance"]/1000:.2f} km',
+        content.add_widget(Label(text=f'距离: {record.distance/1000:.2f} km',
             font_name='Chinese'
         ))
-        content.add_widget(Label(text=f'时间: {record["duration"]//60:.0f}:{record["duration"]%60:.0f}',
+        content.add_widget(Label(text=f'时间: {record.duration//60:.0f}:{record.duration%60:.0f}',
             font_name='Chinese'
         ))
-        content.add_widget(Label(text=f'卡路里: {record["calories"]} kcal',
+        content.add_widget(Label(text=f'卡路里: {record.calories} kcal',
             font_name='Chinese'
         ))
         
@@ -599,6 +695,7 @@ class RunScreen(Screen):
             
         print("📱 GPS信号弱，切换到步数计数模式")
         self.use_pedometer = True
+        self.pace_estimator.reset()
         
         # 启动步数计数器
         try:
@@ -619,6 +716,7 @@ class RunScreen(Screen):
             
         print("📡 GPS信号恢复，切换到GPS模式")
         self.use_pedometer = False
+        self.pace_estimator.reset()
         
         # 停止步数计数器
         try:
@@ -637,7 +735,12 @@ class RunScreen(Screen):
         if not self.is_running or self.is_paused or not self.use_pedometer:
             return
         
+        now = datetime.now()
         self.step_count = steps
+        
+        # 当前速度按两次步数回调之间的估算距离计算
+        delta = max(estimated_distance - self.pedometer_distance, 0)
+        self.current_speed = self.pace_estimator.update(now, delta) * 3.6
         self.pedometer_distance = estimated_distance
         
         # 使用步数估算的总距离
@@ -647,7 +750,7 @@ class RunScreen(Screen):
         self.locations_history.append({
             'steps': steps,
             'estimated_distance': estimated_distance,
-            'timestamp': datetime.now(),
+            'timestamp': now,
             'source': 'pedometer'
         })
     
@@ -285,19 +285,8 @@ class TodayScreen(Screen):
                     foods = food_data.get('foods', [])
                     print(f"🍎 今日模块：昨天加载到 {len(foods)} 个食物记录")
                 
-                # 重新计算营养数据
-                nutrition = {
-                    'calories': 0,
-                    'protein': 0,
-                    'carbs': 0,
-                    'fat': 0
-                }
-                
-                for food in foods:
-                    nutrition['calories'] += food.get('calories', 0)
-                    nutrition['protein'] += food.get('protein', 0)
-                    nutrition['carbs'] += food.get('carbs', 0)
-                    nutrition['fat'] += food.get('fat', 0)
+                # 营养汇总由存储层维护（旧数据缺少汇总时按条目计算）
+                nutrition = app.storage.get_day_nutrition(food_data).to_dict()
                 
                 print(f"📊 今日模块：营养数据 - 卡路里: {nutrition['calories']}, 蛋白质: {nutrition['protein']}")
                 self.update_nutrition_display(nutrition)
@@ -4,11 +4,16 @@ Firebase服务
 处理数据同步和云端存储
 """
 
-import json
 import requests
 import threading
 from datetime import datetime
 
+from utils import json_codec
+from utils.records import RunRecord
+
+# 请求体由 json_codec 编码后以字节发送
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
 class FirebaseService:
     """Firebase服务类"""
     
@@ -75,10 +80,11 @@ class FirebaseService:
             
             params = {'key': self.config['apiKey']}
             
-            response = self.session.post(auth_url, json=payload, params=params)
+            response = self.session.post(auth_url, data=json_codec.dumps_bytes(payload),
+                                         headers=JSON_HEADERS, params=params)
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_codec.loads(response.content)
                 self.user_token = data.get('idToken')
                 self.user_id = data.get('localId')
                 
@@ -110,10 +116,11 @@ class FirebaseService:
             
             params = {'key': self.config['apiKey']}
             
-            response = self.session.post(auth_url, json=payload, params=params)
+            response = self.session.post(auth_url, data=json_codec.dumps_bytes(payload),
+                                         headers=JSON_HEADERS, params=params)
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_codec.loads(response.content)
                 self.user_token = data.get('idToken')
                 self.user_id = data.get('localId')
                 
@@ -143,7 +150,8 @@ class FirebaseService:
             url = f"{self.base_url}/users/{self.user_id}.json"
             params = {'auth': self.user_token}
             
-            response = self.session.put(url, json=user_data, params=params)
+            response = self.session.put(url, data=json_codec.dumps_bytes(user_data),
+                                        headers=JSON_HEADERS, params=params)
             
             return response.status_code == 200
             
@@ -151,11 +159,30 @@ class FirebaseService:
             print(f"同步用户数据失败: {e}")
             return False
     
+    def get_run_url(self, date, run_id):
+        """单次跑步记录在云端的地址（按日期和跑步ID组织）"""
+        return f"{self.base_url}/runs/{self.user_id}/{date}/{run_id}.json"
+    
     def sync_run_data(self, run_record):
-        """同步跑步数据"""
+        """同步跑步数据
+        
+        每次跑步按跑步ID单独写入（PUT），重复同步同一条记录只会覆盖，
+        不会在云端产生重复记录。记录需要先经 StorageManager.save_run_record
+        保存（分配跑步ID），没有ID的记录不同步。
+        """
         try:
+            run_record = RunRecord.coerce(run_record).to_dict()
+            if not run_record.get('run_id'):
+                print("同步跑步数据失败: 记录没有跑步ID，请先保存到本地")
+                return False
+            
             if not self.is_online or not self.user_id:
-                # 添加到离线队列
+                # 添加到离线队列（同一跑步只保留最新一份）
+                self.offline_queue = [
+                    item for item in self.offline_queue
+                    if not (item['type'] == 'run_data' and
+                            item['data'].get('run_id') == run_record['run_id'])
+                ]
                 self.offline_queue.append({
                     'type': 'run_data',
                     'data': run_record,
@@ -163,29 +190,32 @@ class FirebaseService:
                 })
                 return False
             
-            # 按日期组织数据
-            date = run_record.get('date', datetime.now().strftime('%Y-%m-%d'))
-            url = f"{self.base_url}/runs/{self.user_id}/{date}.json"
+            date = run_record.get('date') or datetime.now().strftime('%Y-%m-%d')
             params = {'auth': self.user_token}
             
-            # 获取现有数据
-            response = self.session.get(url, params=params)
+            response = self.session.put(self.get_run_url(date, run_record['run_id']),
+                                        data=json_codec.dumps_bytes(run_record),
+                                        headers=JSON_HEADERS, params=params)
             
-            if response.status_code == 200:
-                existing_data = response.json() or {'runs': []}
-            else:
-                existing_data = {'runs': []}
+            return response.status_code == 200
             
-            # 添加新记录
-            existing_data['runs'].append(run_record)
+        except Exception as e:
+            print(f"同步跑步数据失败: {e}")
+            return False
+    
+    def delete_run_data(self, date, run_id):
+        """删除云端的一次跑步记录（记录不存在时同样视为成功）"""
+        try:
+            if not self.is_online or not self.user_id:
+                return False
             
-            # 保存更新后的数据
-            response = self.session.put(url, json=existing_data, params=params)
+            params = {'auth': self.user_token}
+            response = self.session.delete(self.get_run_url(date, run_id), params=params)
             
             return response.status_code == 200
             
         except Exception as e:
-            print(f"同步跑步数据失败: {e}")
+            print(f"删除云端跑步数据失败: {e}")
             return False
     
     def sync_food_data(self, food_data, date):
@@ -204,7 +234,8 @@ class FirebaseService:
             url = f"{self.base_url}/foods/{self.user_id}/{date}.json"
             params = {'auth': self.user_token}
             
-            response = self.session.put(url, json=food_data, params=params)
+            response = self.session.put(url, data=json_codec.dumps_bytes(food_data),
+                                        headers=JSON_HEADERS, params=params)
             
             return response.status_code == 200
             
@@ -224,7 +255,7 @@ class FirebaseService:
             response = self.session.get(url, params=params)
             
             if response.status_code == 200:
-                return response.json()
+                return json_codec.loads(response.content)
             else:
                 return None
                 
@@ -243,10 +274,17 @@ class FirebaseService:
             
             response = self.session.get(url, params=params)
             
-            if response.status_code == 200:
-                return response.json()
-            else:
+            if response.status_code != 200:
                 return None
+            
+            data = json_codec.loads(response.content) or {}
+            
+            # 旧格式的整天列表在 runs 下，新格式按跑步ID为键
+            runs = list(data.pop('runs', None) or [])
+            runs.extend(run for run in data.values() if isinstance(run, dict))
+            runs.sort(key=lambda run: run.get('start_time') or '')
+            
+            return {'date': date, 'runs': runs}
                 
         except Exception as e:
             print(f"从云端加载跑步数据失败: {e}")
@@ -264,7 +302,7 @@ class FirebaseService:
             response = self.session.get(url, params=params)
             
             if response.status_code == 200:
-                return response.json()
+                return json_codec.loads(response.content)
             else:
                 return None
                 
@@ -5,10 +5,11 @@
 """
 
 import requests
-import json
 import time
 from datetime import datetime
 
+from utils import json_codec
+
 class FoodAPIService:
     """食物API服务类"""
     
@@ -39,7 +40,7 @@ class FoodAPIService:
             response = self.session.get(url, timeout=10)
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_codec.loads(response.content)
                 
                 if data.get('status') == 1:  # 找到产品
                     product = data.get('product', {})
@@ -84,7 +85,7 @@ class FoodAPIService:
             response = self.session.get(url, params=params, timeout=10)
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_codec.loads(response.content)
                 products = data.get('products', [])
                 
                 results = []
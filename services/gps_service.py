@@ -8,6 +8,8 @@ import threading
 import time
 from datetime import datetime
 
+from utils.gps_filter import default_location_filter
+
 class GPSService:
     """GPS定位服务类"""
     
@@ -23,6 +25,9 @@ class GPSService:
         self.last_location_time = None
         self.weak_signal_threshold = 20  # GPS精度阈值（米）
         
+        # 定位过滤（剔除跳点、平滑漂移），为None时直接传出原始定位
+        self.location_filter = default_location_filter()
+        
         # Android GPS支持
         self.gps_provider = None
         self.init_android_gps()
@@ -55,6 +60,10 @@ class GPSService:
         self.location_callback = callback
         self.is_tracking = True
         
+        # 每次追踪从头开始过滤
+        if self.location_filter:
+            self.location_filter.reset()
+        
         if self.gps_provider:
             try:
                 # 配置GPS参数
@@ -94,16 +103,24 @@ class GPSService:
                 lat = base_lat + 0.001 * math.sin(angle)
                 lon = base_lon + 0.001 * math.cos(angle)
                 
+                now = datetime.now()
+                filtered = self.filter_location(lat, lon, 5.0, now)
+                if filtered is None:
+                    step += 1
+                    time.sleep(2)
+                    continue
+                lat, lon, moved = filtered
+                
                 self.current_location = {
                     'latitude': lat,
                     'longitude': lon,
                     'altitude': 50.0,
                     'accuracy': 5.0,
-                    'timestamp': datetime.now()
+                    'timestamp': now
                 }
                 
                 if self.location_callback:
-                    self.location_callback(lat, lon, 50.0)
+                    self.location_callback(lat, lon, 50.0, timestamp=now, moved=moved)
                 
                 step += 1
                 time.sleep(2)  # 2秒更新一次
@@ -145,6 +162,13 @@ class GPSService:
             else:
                 self.gps_status = 'good'
             
+            # 被过滤掉的跳点不传给使用者（信号状态仍然更新）；
+            # 没有移动的定位照常传出，使用者据此更新速度
+            filtered = self.filter_location(lat, lon, accuracy, self.last_location_time)
+            if filtered is None:
+                return
+            lat, lon, moved = filtered
+            
             self.current_location = {
                 'latitude': lat,
                 'longitude': lon,
@@ -154,12 +178,40 @@ class GPSService:
                 'signal_status': self.gps_status
             }
             
+            # 收到定位的时间随回调一起传出，界面线程据此计算速度
             if self.location_callback:
-                self.location_callback(lat, lon, altitude, accuracy, self.gps_status)
+                self.location_callback(lat, lon, altitude, accuracy, self.gps_status,
+                                       timestamp=self.last_location_time, moved=moved)
                 
         except Exception as e:
             print(f"GPS位置更新失败: {e}")
     
+    def set_location_filter(self, location_filter):
+        """替换定位过滤器（None 表示不过滤）"""
+        self.location_filter = location_filter
+        if location_filter:
+            location_filter.reset()
+    
+    def filter_location(self, lat, lon, accuracy, timestamp):
+        """对一次定位执行过滤，返回 (纬度, 经度, 是否移动)，被丢弃时返回None"""
+        if not self.location_filter:
+            return lat, lon, True
+        
+        try:
+            fix = self.location_filter.process({
+                'lat': lat,
+                'lon': lon,
+                'accuracy': accuracy,
+                'timestamp': timestamp
+            })
+        except Exception as e:
+            print(f"定位过滤失败，使用原始定位: {e}")
+            return lat, lon, True
+        
+        if fix is None:
+            return None
+        return fix['lat'], fix['lon'], fix.get('moved', True)
+    
     def on_gps_status(self, stype, status):
         """GPS状态回调"""
         print(f"GPS状态: {stype} = {status}")
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+性能对比脚本（不是单元测试）
+
+    python tests/benchmarks.py json      各JSON编解码器在含路线的每日文档上的速度
+    python tests/benchmarks.py metrics   轨迹分析两种实现在5万点轨迹上的耗时
+    python tests/benchmarks.py gps       带噪声的模拟轨迹过滤前后的距离
+
+不带参数时全部运行
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import make_noisy_track, make_sample_day, make_sample_track
+from utils import json_codec
+from utils.gps_filter import replay
+from utils.track_metrics import analyze_track, np
+
+
+def benchmark_json(repeat=20):
+    """比较各编解码器的编码/解码耗时，返回 {名称: (编码毫秒, 解码毫秒, 字节数)}"""
+    sample = make_sample_day()
+    results = {}
+
+    for codec in json_codec.available_codecs():
+        encoded = codec.dumps_bytes(sample)
+        encode_time = min(timeit.repeat(lambda: codec.dumps_bytes(sample), number=1, repeat=repeat))
+        decode_time = min(timeit.repeat(lambda: codec.loads(encoded), number=1, repeat=repeat))
+        results[codec.name] = (encode_time * 1000, decode_time * 1000, len(encoded))
+
+    # 对照：原先的缩进格式输出
+    baseline = json.dumps(sample, ensure_ascii=False, indent=2).encode('utf-8')
+    encode_time = min(timeit.repeat(
+        lambda: json.dumps(sample, ensure_ascii=False, indent=2),
+        number=1, repeat=repeat
+    ))
+    results['json(indent=2)'] = (encode_time * 1000, None, len(baseline))
+
+    return results
+
+
+def benchmark_metrics(points=50000, repeat=5):
+    """比较轨迹分析两种实现的耗时（毫秒）"""
+    track = make_sample_track(points)
+    results = {}
+    implementations = [('python', False)]
+    if np is not None:
+        implementations.insert(0, ('numpy', True))
+
+    for name, use_numpy in implementations:
+        elapsed = min(timeit.repeat(lambda: analyze_track(*track, use_numpy=use_numpy),
+                                    number=1, repeat=repeat))
+        results[name] = elapsed * 1000
+    return results
+
+
+def print_json():
+    print(f"默认编解码器: {json_codec.codec_name()}")
+    for name, (encode_ms, decode_ms, size) in benchmark_json().items():
+        decode_text = f'{decode_ms:8.2f} ms' if decode_ms is not None else '        -'
+        print(f"{name:16s} 编码 {encode_ms:8.2f} ms  解码 {decode_text}  大小 {size / 1024:8.1f} KB")
+
+
+def print_metrics():
+    for name, elapsed in benchmark_metrics().items():
+        print(f"{name:8s} {elapsed:8.2f} ms")
+
+
+def print_gps():
+    for noise in (3.0, 6.0, 10.0):
+        fixes, truth = make_noisy_track(noise=noise)
+        accepted, raw, filtered = replay(fixes)
+        print(f"噪声 {noise:4.1f} m  真实 {truth:8.1f} m  原始 {raw:8.1f} m  "
+              f"过滤后 {filtered:8.1f} m  丢弃 {len(fixes) - len(accepted)} 个定位")
+
+
+BENCHMARKS = {'json': print_json, 'metrics': print_metrics, 'gps': print_gps}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+测试共用的数据构造和临时目录
+"""
+
+import math
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from array import array
+from datetime import datetime, timedelta
+
+from utils.track_metrics import EARTH_RADIUS
+
+
+class TempDirTestCase(unittest.TestCase):
+    """每个测试使用独立的临时目录（self.temp_dir），数据目录为其中的 data 子目录
+
+    临时目录在 tearDown 之后删除，子类在 tearDown 中关闭 StorageManager 即可。
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        self.data_dir = os.path.join(self.temp_dir, 'data')
+        self.backup_dir = os.path.join(self.temp_dir, 'backups')
+
+
+def make_run(date, distance, **fields):
+    """构造一条跑步记录，fields 覆盖或补充字段"""
+    run = {'date': date, 'start_time': f'{date}T07:00:00',
+           'distance': distance, 'duration': 600, 'calories': 50}
+    run.update(fields)
+    return run
+
+
+def make_route(points=5, lon=116.4, lon_step=0.0):
+    """构造每秒一个点、向北约11米的路线（lon_step 为每点经度增量）"""
+    return [{'lat': 39.9 + i * 0.0001, 'lon': lon + i * lon_step, 'timestamp': 1700000000 + i,
+             'distance': i * 11.1, 'accuracy': 5.0} for i in range(points)]
+
+
+def make_noisy_track(seconds=1800, speed=3.0, noise=4.0, jump_every=120, seed=1, turn_every=0):
+    """生成带噪声和跳点的模拟定位（匀速，返回 (定位列表, 真实距离)）
+
+    turn_every 为0时沿直线向北，否则每隔约 turn_every 秒左转或右转90度。
+    跳点的精度标为噪声的3倍。
+    """
+    rng = random.Random(seed)
+    scale = math.pi / 180 * EARTH_RADIUS
+    lat0, lon0 = 39.9042, 116.4074
+    fixes = []
+
+    t = 0.0
+    true_east = true_north = 0.0
+    heading = 0.0
+    while t < seconds:
+        north = true_north + rng.gauss(0, noise)
+        east = true_east + rng.gauss(0, noise)
+        accuracy = noise
+        if jump_every and rng.random() < 1.0 / jump_every:
+            # 多路径反射等造成的远距离跳点
+            east += rng.choice((-1, 1)) * rng.uniform(80, 300)
+            accuracy = noise * 3
+        fixes.append({
+            'lat': lat0 + north / scale,
+            'lon': lon0 + east / (scale * math.cos(math.radians(lat0))),
+            'accuracy': accuracy,
+            'timestamp': 1700000000.0 + t
+        })
+        dt = rng.choice((1.0, 1.0, 1.0, 2.0))
+        true_east += speed * dt * math.sin(heading)
+        true_north += speed * dt * math.cos(heading)
+        if turn_every and int((t + dt) // turn_every) > int(t // turn_every):
+            heading += rng.choice((-1, 1)) * math.pi / 2
+        t += dt
+
+    return fixes, speed * (fixes[-1]['timestamp'] - fixes[0]['timestamp'])
+
+
+def make_sample_track(points=50000, interval=1.0):
+    """生成基准测试用的轨迹列（约3.3米/秒，中途停留一分钟，缓坡起伏）"""
+    times = array('d')
+    lats = array('d')
+    lons = array('d')
+    altitudes = array('d')
+    lat, lon = 39.9042, 116.4074
+
+    for i in range(points):
+        times.append(1700000000.0 + i * interval)
+        if not 600 <= i < 660:
+            lat += 2.2e-5 * math.cos(i / 900.0)
+            lon += 2.9e-5 * math.sin(i / 900.0)
+        lats.append(lat)
+        lons.append(lon)
+        altitudes.append(50.0 + 20.0 * math.sin(i / 1500.0) + (i % 7) * 0.1)
+
+    return times, lats, lons, altitudes
+
+
+def make_sample_day(points=3600, foods=12):
+    """生成基准测试用的每日文档（一次一小时跑步的完整路线 + 一天的饮食）"""
+    start = datetime(2024, 5, 1, 6, 30)
+    route = [{
+        'lat': 39.9042 + i * 1e-5,
+        'lon': 116.4074 + i * 1.3e-5,
+        'timestamp': (start + timedelta(seconds=i)).isoformat(),
+        'distance': i * 2.8,
+        'accuracy': 5.0,
+        'source': 'gps'
+    } for i in range(points)]
+
+    runs = {'date': '2024-05-01', 'runs': [{
+        'run_id': 'b3f1c2d4e5f60718293a4b5c6d7e8f90',
+        'date': '2024-05-01',
+        'start_time': start.isoformat(),
+        'duration': float(points),
+        'distance': points * 2.8,
+        'average_pace': 5.95,
+        'calories': int(points * 2.8 * 0.05),
+        'route': route,
+        'schema_version': 1
+    }]}
+
+    food_day = {'date': '2024-05-01', 'foods': [{
+        'name': f'食物{i}', 'brand': '品牌', 'serving_size': 100.0, 'servings': 1.5,
+        'calories': 180.0 + i, 'protein': 6.2, 'carbs': 25.1, 'fat': 4.4,
+        'meal_type': '午餐', 'timestamp': (start + timedelta(hours=i)).isoformat(),
+        'schema_version': 1
+    } for i in range(foods)]}
+
+    return {'runs': runs, 'foods': food_day}
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+备份管理测试
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+import unittest
+import zipfile
+
+from helpers import TempDirTestCase
+from utils.backup_manager import MANIFEST_NAME, BackupError, BackupManager
+from utils.storage_manager import StorageManager
+
+PAYLOAD = b'{"total_runs": 99}'
+
+
+class BackupRestoreTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.data_dir, 'runs'))
+        os.makedirs(self.backup_dir)
+        with open(os.path.join(self.data_dir, 'statistics.json'), 'wb') as f:
+            f.write(b'{"total_runs": 1}')
+        self.manager = BackupManager(self.data_dir)
+
+    def make_archive(self, member_name):
+        """构造一个清单中含有指定路径的归档"""
+        name = 'health_app_backup_20260101_000000_000000.zip'
+        manifest = {'files': {member_name: {
+            'size': len(PAYLOAD), 'mtime_ns': 0, 'archive': name,
+            'sha256': hashlib.sha256(PAYLOAD).hexdigest()
+        }}}
+        path = os.path.join(self.backup_dir, name)
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr(member_name, PAYLOAD)
+            zf.writestr(MANIFEST_NAME, json.dumps(manifest))
+        return path
+
+    def test_round_trip(self):
+        """备份后恢复得到相同内容，原数据目录被移到一旁"""
+        archive = self.manager.create_backup(self.backup_dir)
+        with open(os.path.join(self.data_dir, 'statistics.json'), 'wb') as f:
+            f.write(b'{"total_runs": 2}')
+
+        old_dir = self.manager.restore_backup(archive)
+        with open(os.path.join(self.data_dir, 'statistics.json'), 'rb') as f:
+            self.assertEqual(f.read(), b'{"total_runs": 1}')
+        self.assertTrue(os.path.isdir(old_dir))
+
+    def test_rejects_paths_outside_staging_dir(self):
+        """清单中跳出暂存目录的路径被拒绝，数据目录保持原样，目录外没有写入文件"""
+        outside = os.path.join(self.temp_dir, 'evil.json')
+        for member in ('../evil.json', 'runs/../../evil.json', '..'):
+            archive = self.make_archive(member)
+            with self.assertRaises(BackupError):
+                self.manager.restore_backup(archive)
+
+            self.assertFalse(os.path.exists(outside))
+            self.assertFalse(os.path.exists(self.data_dir + '.restoring'))
+            with open(os.path.join(self.data_dir, 'statistics.json'), 'rb') as f:
+                self.assertEqual(f.read(), b'{"total_runs": 1}')
+            os.remove(archive)
+
+    def test_snapshot_keeps_content_at_snapshot_time(self):
+        """快照之后原子替换或追加的内容不会进入本次备份"""
+        journal = os.path.join(self.data_dir, 'runs', 'runs_2026-10-17.jsonl')
+        with open(journal, 'w') as f:
+            f.write('{"seq": 1}\n')
+
+        snapshot_dir = self.manager.create_snapshot()
+        with open(journal, 'a') as f:
+            f.write('{"seq": 2}\n')
+        tmp_path = os.path.join(self.data_dir, 'statistics.json.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(b'{"total_runs": 2}')
+        os.replace(tmp_path, os.path.join(self.data_dir, 'statistics.json'))
+
+        archive = self.manager.create_backup(self.backup_dir, source_dir=snapshot_dir)
+        with zipfile.ZipFile(archive) as zf:
+            self.assertEqual(zf.read('statistics.json'), b'{"total_runs": 1}')
+            self.assertEqual(zf.read('runs/runs_2026-10-17.jsonl'), b'{"seq": 1}\n')
+
+        shutil.rmtree(snapshot_dir)
+        self.manager.remove_stale_snapshots()
+        self.assertEqual(self.manager.sibling_dirs('.snapshot_'), [])
+
+    def test_keeps_only_latest_before_restore_copy(self):
+        """多次恢复后只保留最近一次被替换下来的数据目录"""
+        archive = self.manager.create_backup(self.backup_dir)
+        first = self.manager.restore_backup(archive)
+        second = self.manager.restore_backup(archive)
+
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.isdir(second))
+        self.assertEqual(self.manager.sibling_dirs('.before_restore_'), [second])
+
+
+class StorageBackupTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageManager(data_dir=self.data_dir)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_saves_proceed_while_archive_is_written(self):
+        """写入归档期间不持有根目录锁：其他线程的保存可以完成，且不进入本次备份"""
+        self.storage.save_run_record({'date': '2026-10-16', 'distance': 1000})
+        saved = []
+
+        def progress(done, total):
+            if saved:
+                return
+            thread = threading.Thread(target=lambda: saved.append(
+                self.storage.save_run_record({'date': '2026-10-17', 'distance': 2000})))
+            thread.start()
+            thread.join(timeout=10)
+            saved.append(thread.is_alive())
+
+        archive = self.storage.backup_data(self.backup_dir, progress_callback=progress)
+        self.assertEqual(saved, [True, False])
+        self.assertEqual(self.storage.get_user_statistics()['total_runs'], 2)
+
+        with zipfile.ZipFile(archive) as zf:
+            names = zf.namelist()
+        self.assertIn('runs/runs_2026-10-16.json', names)
+        self.assertNotIn('runs/runs_2026-10-17.json', names)
+        self.assertEqual(BackupManager(self.data_dir).sibling_dirs('.snapshot_'), [])
+
+
+    def test_before_restore_copy_removed_on_reopen(self):
+        """恢复前的旧数据目录保留到下次打开数据目录时删除，也可以直接删除"""
+        self.storage.save_run_record({'date': '2026-10-16', 'distance': 1000})
+        archive = self.storage.backup_data(self.backup_dir)
+        manager = BackupManager(self.data_dir)
+
+        self.assertTrue(self.storage.restore_data(archive))
+        copies = manager.sibling_dirs('.before_restore_')
+        self.assertEqual(len(copies), 1)
+
+        # 同一进程中已有实例在用（恢复刚完成），不删除
+        StorageManager(data_dir=self.data_dir).close()
+        self.assertEqual(manager.sibling_dirs('.before_restore_'), copies)
+
+        self.storage.close()
+        self.storage = StorageManager(data_dir=self.data_dir)
+        self.assertEqual(manager.sibling_dirs('.before_restore_'), [])
+        self.assertEqual(self.storage.get_user_statistics()['total_runs'], 1)
+
+        self.assertTrue(self.storage.restore_data(archive))
+        copies = manager.sibling_dirs('.before_restore_')
+        self.assertEqual(len(copies), 1)
+        self.assertEqual(self.storage.remove_before_restore_copies(), copies)
+        self.assertEqual(manager.sibling_dirs('.before_restore_'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+GPS定位过滤回放测试：用带噪声和跳点的模拟轨迹检查跳点剔除和距离误差
+"""
+
+import unittest
+
+from helpers import make_noisy_track
+from utils.gps_filter import replay
+from utils.track_metrics import haversine_distance
+
+# 过滤后距离与真实距离的相对误差上限
+MAX_DISTANCE_ERROR = 0.08
+
+NOISE_LEVELS = (3.0, 6.0, 10.0)
+SEEDS = range(1, 6)
+
+
+class GPSFilterReplayTest(unittest.TestCase):
+
+    def test_distance_error_within_bound(self):
+        """直线和转弯轨迹在各噪声水平下，过滤后距离误差都在上限内"""
+        for noise in NOISE_LEVELS:
+            for turn_every in (0, 60):
+                for seed in SEEDS:
+                    with self.subTest(noise=noise, turn_every=turn_every, seed=seed):
+                        fixes, truth = make_noisy_track(noise=noise, seed=seed,
+                                                        turn_every=turn_every)
+                        _, raw, filtered = replay(fixes)
+                        self.assertGreater(raw, truth * 2)
+                        self.assertLess(abs(filtered / truth - 1), MAX_DISTANCE_ERROR)
+
+    def test_rejects_jumps(self):
+        """常见精度下所有跳点（精度标为噪声3倍的定位）都不会输出"""
+        for noise in (3.0, 6.0):
+            for seed in SEEDS:
+                with self.subTest(noise=noise, seed=seed):
+                    fixes, _ = make_noisy_track(noise=noise, seed=seed, jump_every=30)
+                    jumps = [fix for fix in fixes if fix['accuracy'] > noise]
+                    self.assertTrue(jumps)
+
+                    accepted, _, _ = replay(fixes)
+                    self.assertEqual([fix for fix in accepted if fix['accuracy'] > noise], [])
+
+    def test_stationary_jitter(self):
+        """原地不动时抖动累加出的距离远小于原始定位"""
+        for noise in NOISE_LEVELS:
+            with self.subTest(noise=noise):
+                fixes, _ = make_noisy_track(seconds=600, speed=0.0, noise=noise, jump_every=0)
+                _, raw, filtered = replay(fixes)
+                self.assertLess(filtered, raw / 10)
+                self.assertLess(filtered, 250)
+
+    def test_recovers_from_bad_first_fix(self):
+        """第一个定位本身是跳点时，连续丢弃若干次后重新开始，终点仍与真实位置一致"""
+        fixes, _ = make_noisy_track(noise=3.0, jump_every=0)
+        bad = dict(fixes[0], lon=fixes[0]['lon'] + 0.005, timestamp=fixes[0]['timestamp'] - 1)
+
+        accepted, _, _ = replay([bad] + fixes)
+        end = fixes[-1]
+        self.assertLess(haversine_distance(accepted[-1]['lat'], accepted[-1]['lon'],
+                                           end['lat'], end['lon']), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+GPS定位服务测试：定位经过滤后传给使用者，停下后配速随之更新
+"""
+
+import math
+import random
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from services.gps_service import GPSService
+from utils.pace_estimator import PaceEstimator
+from utils.track_metrics import EARTH_RADIUS, haversine_distance
+
+START = 1700000000.0
+
+
+def make_fixes(run_seconds=120, stand_seconds=60, speed=3.0, noise=3.0, seed=1):
+    """先匀速向北跑 run_seconds 秒，再原地站 stand_seconds 秒的每秒定位"""
+    rng = random.Random(seed)
+    scale = math.pi / 180 * EARTH_RADIUS
+    fixes = []
+    for t in range(run_seconds + stand_seconds):
+        north = speed * min(t, run_seconds) + rng.gauss(0, noise)
+        east = rng.gauss(0, noise)
+        fixes.append((START + t, 39.9042 + north / scale,
+                      116.4074 + east / (scale * math.cos(math.radians(39.9042)))))
+    return fixes
+
+
+class RunnerCallback:
+    """与跑步界面相同的处理：移动的定位累加距离，没有移动的定位只更新速度"""
+
+    def __init__(self):
+        self.estimator = PaceEstimator()
+        self.last_location = None
+        self.calls = 0
+
+    def __call__(self, lat, lon, altitude, accuracy=999, status='unknown', timestamp=None,
+                 moved=True):
+        self.calls += 1
+        distance = 0.0
+        if moved:
+            if self.last_location:
+                distance = haversine_distance(self.last_location[0], self.last_location[1],
+                                              lat, lon)
+            self.last_location = (lat, lon)
+        self.estimator.update(timestamp, distance)
+
+
+class GPSServiceTest(unittest.TestCase):
+
+    def feed(self, service, fixes):
+        """按定位时间回放（服务用收到定位的时间作为时间戳）"""
+        with mock.patch('services.gps_service.datetime') as clock:
+            for timestamp, lat, lon in fixes:
+                clock.now.return_value = datetime.fromtimestamp(timestamp)
+                service.on_location_update(lat=lat, lon=lon, altitude=50, accuracy=3.0)
+
+    def test_pace_stops_after_standing_still(self):
+        """跑步后原地站立：抖动的定位仍然回调，配速变为0（界面显示 --）"""
+        service = GPSService()
+        callback = RunnerCallback()
+        service.location_callback = callback
+        fixes = make_fixes()
+
+        self.feed(service, fixes[:120])
+        self.assertGreater(callback.estimator.pace, 0)
+
+        self.feed(service, fixes[120:])
+        self.assertEqual(callback.calls, len(fixes))
+        self.assertEqual(callback.estimator.pace, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
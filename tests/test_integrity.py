@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+完整性检查与修复测试
+"""
+
+import os
+import threading
+import unittest
+
+from helpers import TempDirTestCase, make_route
+from utils import json_codec
+from utils.integrity import check_run_day
+from utils.storage_manager import StorageManager
+
+DATE = '2026-10-17'
+
+
+class IntegrityTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageManager(data_dir=self.data_dir)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def runs_file(self, date=DATE):
+        return os.path.join(self.storage.runs_dir, f'runs_{date}.json')
+
+    def quarantined_files(self):
+        found = []
+        for root, _, filenames in os.walk(self.storage.quarantine_dir):
+            found.extend(os.path.join(root, name) for name in filenames)
+        return found
+
+    def test_track_written_under_day_lock(self):
+        """当天文档锁被占用时，保存还没有写出轨迹文件（不会出现无人引用的轨迹）"""
+        run = {'run_id': 'run-1', 'date': DATE, 'distance': 44, 'route': make_route()}
+        track_file = self.storage.get_track_file('run-1')
+
+        with self.storage.document_lock('runs', DATE):
+            thread = threading.Thread(target=self.storage.save_run_record, args=(run,))
+            thread.start()
+            thread.join(timeout=0.5)
+            self.assertTrue(thread.is_alive())
+            self.assertFalse(os.path.exists(track_file))
+        thread.join(timeout=10)
+
+        self.assertTrue(os.path.exists(track_file))
+        report = self.storage.verify(quarantine=True, workers=0)
+        self.assertEqual(report['issues'], [])
+        self.assertEqual(report['quarantined'], [])
+
+    def test_repair_copies_only_changed_files(self):
+        """修复没有改动文件时不复制到隔离目录，改动时保留原文件"""
+        self.storage.save_run_record({'run_id': 'run-1', 'date': DATE, 'distance': 1000})
+        self.storage.flush()
+
+        issue = {'code': 'bad_entry', 'repairable': True, 'kind': 'runs',
+                 'path': self.runs_file(), 'date': DATE}
+        self.assertEqual(self.storage.repair_files([issue], 'unchanged'), [])
+        self.assertEqual(self.quarantined_files(), [])
+
+        data = json_codec.load_file(self.runs_file())
+        data['date'] = '2026-01-01'
+        self.storage.writer.write_json(self.runs_file(), data)
+
+        report = self.storage.verify(repair=True, workers=0)
+        self.assertEqual(report['repaired'], [self.runs_file()])
+        self.assertEqual(json_codec.load_file(self.runs_file())['date'], DATE)
+        self.assertEqual(len(self.quarantined_files()), 1)
+
+
+    def test_route_distance_checked_only_for_gps(self):
+        """步数估算的距离每次切换都从0开始：混合来源的路线不报累计距离减少，纯GPS路线仍然检查"""
+        # GPS 0 -> 11 米，步数 0 -> 5 米，切回GPS后接在步数估算值之后
+        route = make_route(6)
+        for i in (2, 3):
+            del route[i]['distance']
+            route[i].update(source='pedometer', estimated_distance=(i - 2) * 5.0)
+        for i in (4, 5):
+            route[i]['distance'] = 5.0 + (i - 4) * 11.1
+
+        def route_codes(run):
+            issues, _ = check_run_day({'date': DATE, 'runs': [run]}, DATE)
+            return [issue['code'] for issue in issues]
+
+        run = {'run_id': 'run-1', 'date': DATE, 'distance': 16.1, 'route': route}
+        self.assertEqual(route_codes(run), [])
+        self.assertEqual(route_codes(dict(run, distance_source='mixed')), [])
+
+        gps_route = make_route(6)
+        gps_route[4]['distance'] -= 40
+        self.assertEqual(route_codes(dict(run, route=gps_route)), ['route_order'])
+        self.assertEqual(route_codes(dict(run, route=gps_route, distance_source='gps')),
+                         ['route_order'])
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+JSON编解码测试：各实现对日期时间和未知类型的处理一致
+"""
+
+import unittest
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+
+from utils import json_codec
+
+
+@dataclass
+class Point:
+    lat: float
+    lon: float
+
+
+class JSONCodecTest(unittest.TestCase):
+
+    def test_datetimes_use_isoformat(self):
+        """所有实现都把日期时间编码为 isoformat() 的结果"""
+        values = [datetime(2024, 5, 1, 6, 30), datetime(2024, 5, 1, 6, 30, 0, 120),
+                  datetime(2024, 5, 1, 6, 30, tzinfo=timezone(timedelta(hours=8))),
+                  date(2024, 5, 1), time(6, 30, 15)]
+        for codec in json_codec.available_codecs():
+            for value in values:
+                with self.subTest(codec=codec.name, value=value):
+                    for pretty in (False, True):
+                        decoded = codec.loads(codec.dumps({'t': value}, pretty))
+                        self.assertEqual(decoded, {'t': value.isoformat()})
+                        self.assertEqual(codec.loads(codec.dumps_bytes([value], pretty)),
+                                         [value.isoformat()])
+
+    def test_unknown_types_raise(self):
+        """其他无法编码的类型抛出 TypeError，而不是写入 str() 的结果"""
+        for codec in json_codec.available_codecs():
+            for value in (object(), {1, 2}, Point(39.9, 116.4), b'bytes'):
+                with self.subTest(codec=codec.name, value=type(value).__name__):
+                    with self.assertRaises(TypeError):
+                        codec.dumps({'value': value})
+
+
+if __name__ == '__main__':
+    unittest.main()
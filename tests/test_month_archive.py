@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+月归档测试
+"""
+
+import threading
+import unittest
+
+from helpers import TempDirTestCase
+from utils.storage_manager import StorageManager
+
+MONTH = '2020-01'
+DATES = ['2020-01-05', '2020-01-06', '2020-01-07']
+
+
+class MonthArchiveTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageManager(data_dir=self.data_dir)
+        for i, date in enumerate(DATES):
+            self.storage.save_run_record({'date': date, 'distance': 1000 + i})
+        self.storage.add_food_entry(DATES[0], {'name': '米饭', 'calories': 200})
+        self.assertEqual(self.storage.archive_closed_months(), 1)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def run_distances(self, date):
+        return [run['distance'] for run in self.storage.load_daily_run_data(date)['runs']]
+
+    def test_skips_until_month_reopened(self):
+        """没有新的月份结束时不再归档；写入已归档月份后，下次归档重新打包该月"""
+        self.assertEqual(self.storage.archive_closed_months(), 0)
+        self.assertIn(MONTH, self.storage.archived_months)
+
+        self.storage.save_run_record({'date': DATES[0], 'distance': 3000})
+        self.assertNotIn(MONTH, self.storage.archived_months)
+        self.assertEqual(self.storage.archive_closed_months(), 1)
+
+        self.assertIn(MONTH, self.storage.archived_months)
+        self.assertEqual(self.run_distances(DATES[0]), [1000, 3000])
+        self.assertEqual(self.storage.load_daily_food_data(DATES[0])['nutrition']['calories'], 200)
+
+    def test_read_racing_with_unpack(self):
+        """读取判断为已归档后，归档在它读取前被展开：改读每日文件，数据完整"""
+        result = []
+        with self.storage.state_lock:
+            reader = threading.Thread(target=lambda: result.append(self.run_distances(DATES[1])))
+            reader.start()
+            reader.join(timeout=0.2)
+            self.assertTrue(reader.is_alive())
+            self.storage.ensure_month_writable(DATES[0])
+        reader.join(timeout=10)
+
+        self.assertEqual(result, [[1001]])
+        self.assertNotIn(MONTH, self.storage.archived_months)
+
+    def test_unpack_waits_for_day_locks(self):
+        """展开归档等待该月其他日期的文档锁，持有锁期间归档保持不变"""
+        with self.storage.document_lock('runs', DATES[1]):
+            writer = threading.Thread(target=self.storage.save_run_record,
+                                      args=({'date': DATES[0], 'distance': 3000},))
+            writer.start()
+            writer.join(timeout=0.5)
+            self.assertTrue(writer.is_alive())
+            self.assertIn(MONTH, self.storage.archived_months)
+        writer.join(timeout=10)
+
+        self.assertEqual(self.run_distances(DATES[0]), [1000, 3000])
+        self.assertEqual(self.run_distances(DATES[2]), [1002])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+快照 + 操作日志测试
+"""
+
+import os
+import unittest
+
+from helpers import TempDirTestCase
+from utils import json_codec
+from utils.atomic_writer import AtomicWriter
+from utils.op_log import OpLog
+from utils.records import RunRecord
+from utils.storage_manager import StorageManager
+
+
+def apply_set(state, entry):
+    state[entry['key']] = entry['value']
+
+
+class OpLogTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.temp_dir, 'index.json')
+        self.writer = AtomicWriter(fsync_mode='never')
+
+    def open_log(self, threshold=5):
+        return OpLog(self.path, self.writer, compact_threshold=threshold)
+
+    def fill(self, log, state, count):
+        for i in range(count):
+            state[f'k{i}'] = i
+            log.append({'key': f'k{i}', 'value': i}, state)
+
+    def test_append_does_not_rewrite_snapshot(self):
+        """阈值以内只追加日志，快照文件保持不变；重新加载得到相同状态"""
+        log = self.open_log()
+        state = {}
+        log.compact(state)
+        snapshot_mtime = os.stat(self.path).st_mtime_ns
+
+        self.fill(log, state, 4)
+        self.assertEqual(os.stat(self.path).st_mtime_ns, snapshot_mtime)
+        self.assertTrue(os.path.exists(log.log_path))
+
+        self.assertEqual(self.open_log().load(apply_set), state)
+
+    def test_compacts_at_threshold(self):
+        """达到阈值后写成快照并删除日志，序号继续递增"""
+        log = self.open_log()
+        state = {}
+        log.compact(state)
+        self.fill(log, state, 7)
+
+        self.assertEqual(json_codec.load_file(self.path)['log_seq'], 5)
+        self.assertEqual(log.count, 2)
+
+        reloaded = self.open_log()
+        self.assertEqual(reloaded.load(apply_set), state)
+        self.assertEqual(reloaded.seq, 7)
+
+    def test_skips_lines_already_in_snapshot(self):
+        """快照写入后、删除日志前崩溃：日志中已包含在快照里的行不会再应用"""
+        log = self.open_log(threshold=100)
+        state = {}
+        log.compact(state)
+        self.fill(log, state, 3)
+
+        stale_log = open(log.log_path, 'rb').read()
+        log.compact(state)
+        with open(log.log_path, 'wb') as f:
+            f.write(stale_log)
+
+        applied = []
+        reloaded = self.open_log(threshold=100)
+        loaded = reloaded.load(lambda s, e: applied.append(e))
+        self.assertEqual(applied, [])
+        self.assertEqual(loaded, state)
+
+    def test_damaged_tail_is_compacted(self):
+        """崩溃时写了一半的行被跳过，加载后立即压缩，之后的追加不受影响"""
+        log = self.open_log(threshold=100)
+        state = {}
+        log.compact(state)
+        self.fill(log, state, 2)
+        with open(log.log_path, 'a') as f:
+            f.write('{"key": "k9", "va')
+
+        reloaded = self.open_log(threshold=100)
+        loaded = reloaded.load(apply_set)
+        self.assertEqual(loaded, state)
+        self.assertFalse(os.path.exists(log.log_path))
+
+        loaded['k5'] = 5
+        reloaded.append({'key': 'k5', 'value': 5}, loaded)
+        self.assertEqual(self.open_log().load(apply_set), {'k0': 0, 'k1': 1, 'k5': 5})
+
+    def test_legacy_snapshot(self):
+        """旧版快照（状态本身）照常加载"""
+        self.writer.write_json(self.path, {'run-1': '2026-10-17'})
+        self.assertEqual(self.open_log().load(apply_set), {'run-1': '2026-10-17'})
+
+
+class StorageOpLogTest(TempDirTestCase):
+
+    def test_index_and_rollups_survive_reopen(self):
+        """跑步索引和趋势汇总经日志增量保存，重新打开后与全量重建一致"""
+        storage = StorageManager(data_dir=self.data_dir)
+        run_ids = []
+        for i in range(5):
+            storage.save_run_record({'date': f'2026-10-1{i}', 'distance': 1000 + i,
+                                     'duration': 60, 'calories': 10})
+            run_ids.append(storage.load_daily_run_data(f'2026-10-1{i}')['runs'][0]['run_id'])
+        storage.delete_run(run_ids[0])
+        storage.add_food_entry('2026-10-12', {'name': '米饭', 'calories': 200})
+        self.assertTrue(os.path.exists(os.path.join(self.data_dir, 'run_index.jsonl')))
+        self.assertTrue(os.path.exists(os.path.join(self.data_dir, 'rollups.jsonl')))
+        storage.close()
+
+        reopened = StorageManager(data_dir=self.data_dir)
+        try:
+            index = dict(reopened.load_run_index())
+            rollups = reopened.load_rollups()
+            self.assertEqual(sorted(index), sorted(run_ids[1:]))
+            self.assertEqual(rollups['month']['2026-10']['run_count'], 4)
+            self.assertEqual(rollups['day']['2026-10-12']['food_calories'], 200)
+
+            self.assertEqual(reopened.rebuild_run_index(), index)
+            self.assertEqual(reopened.rebuild_rollups(), rollups)
+        finally:
+            reopened.close()
+
+    def test_assigned_id_written_back(self):
+        """保存没有ID的记录时，分配的ID写回调用方的字典和记录对象"""
+        storage = StorageManager(data_dir=self.data_dir)
+        try:
+            run = {'date': '2026-10-17', 'distance': 1000}
+            record = RunRecord(date='2026-10-17', distance=2000)
+            self.assertTrue(storage.save_run_record(run))
+            self.assertTrue(storage.save_run_record(record))
+
+            self.assertEqual(storage.get_run(run['run_id'])['distance'], 1000)
+            self.assertEqual(storage.get_run(record.run_id)['distance'], 2000)
+        finally:
+            storage.close()
+
+    def test_legacy_runs_get_ids(self):
+        """跑步ID功能之前的旧记录在打开时补充ID并写回，之后可以按ID查找和删除"""
+        os.makedirs(os.path.join(self.data_dir, 'runs'))
+        legacy = {'date': '2020-05-01', 'runs': [
+            {'date': '2020-05-01', 'distance': 3000, 'duration': 900},
+            {'date': '2020-05-01', 'distance': 5000, 'duration': 1500},
+        ]}
+        runs_file = os.path.join(self.data_dir, 'runs', 'runs_2020-05-01.json')
+        AtomicWriter(fsync_mode='never').write_json(runs_file, legacy)
+
+        storage = StorageManager(data_dir=self.data_dir)
+        try:
+            run_ids = [run['run_id'] for run in json_codec.load_file(runs_file)['runs']]
+            self.assertTrue(all(run_ids))
+            self.assertEqual(storage.get_run(run_ids[1])['distance'], 5000)
+            self.assertTrue(storage.delete_run(run_ids[0]))
+            self.assertEqual(storage.get_user_statistics()['total_runs'], 1)
+        finally:
+            storage.close()
+
+        reopened = StorageManager(data_dir=self.data_dir)
+        try:
+            self.assertEqual(dict(reopened.load_run_index()), {run_ids[1]: '2020-05-01'})
+        finally:
+            reopened.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+实时配速估计测试
+"""
+
+import unittest
+from datetime import datetime
+
+from utils.pace_estimator import PaceEstimator
+
+START = 1700000000.0
+
+
+def feed(estimator, speeds, start=START, interval=1.0):
+    """按给定的每秒速度（米/秒）依次加入定位，返回最后一次定位的时间"""
+    t = start
+    estimator.update(t, 0.0)
+    for speed in speeds:
+        t += interval
+        estimator.update(t, speed * interval)
+    return t
+
+
+class PaceEstimatorTest(unittest.TestCase):
+
+    def test_constant_speed(self):
+        """匀速时两种方式都得到该速度，配速按分钟/公里换算"""
+        for mode in ('ema', 'window'):
+            with self.subTest(mode=mode):
+                estimator = PaceEstimator(mode=mode)
+                feed(estimator, [2.5] * 30)
+                self.assertAlmostEqual(estimator.speed, 2.5)
+                self.assertAlmostEqual(estimator.pace, 1000.0 / 60.0 / 2.5)
+
+    def test_uneven_intervals(self):
+        """定位间隔不均匀时按真实时间计算速度"""
+        for mode in ('ema', 'window'):
+            with self.subTest(mode=mode):
+                estimator = PaceEstimator(mode=mode)
+                t = START
+                estimator.update(t, 0.0)
+                for dt in (1.0, 3.0, 1.0, 2.0) * 5:
+                    t += dt
+                    estimator.update(datetime.fromtimestamp(t), 3.0 * dt)
+                self.assertAlmostEqual(estimator.speed, 3.0)
+
+    def test_ema_smooths_window_follows(self):
+        """速度突变后平滑方式逐渐跟上，窗口方式在一个窗口后等于新速度"""
+        ema = PaceEstimator(mode='ema', time_constant=8.0)
+        window = PaceEstimator(mode='window', window=10.0)
+        for estimator in (ema, window):
+            feed(estimator, [2.0] * 30 + [4.0] * 12)
+
+        self.assertAlmostEqual(window.speed, 4.0)
+        self.assertGreater(ema.speed, 3.0)
+        self.assertLess(ema.speed, 4.0)
+
+    def test_gap_restarts_estimate(self):
+        """间隔超过 max_gap 时重新开始，间隔内的时间不计入速度"""
+        estimator = PaceEstimator(max_gap=30.0)
+        t = feed(estimator, [3.0] * 10)
+        estimator.update(t + 60, 500.0)
+        self.assertFalse(estimator.has_speed)
+        self.assertEqual(estimator.pace, 0)
+
+        feed(estimator, [2.0] * 20, start=t + 60)
+        self.assertAlmostEqual(estimator.speed, 2.0, places=1)
+
+    def test_stop_speed(self):
+        """低于停止速度时配速为0"""
+        estimator = PaceEstimator(mode='window')
+        feed(estimator, [0.3] * 20)
+        self.assertAlmostEqual(estimator.speed, 0.3)
+        self.assertEqual(estimator.pace, 0)
+
+    def test_pace_at_decays_without_fixes(self):
+        """没有新定位时配速按当前时间下降，超过 max_gap 后为0"""
+        for mode in ('ema', 'window'):
+            with self.subTest(mode=mode):
+                estimator = PaceEstimator(mode=mode, max_gap=30.0)
+                t = feed(estimator, [3.0] * 30)
+
+                self.assertEqual(estimator.pace_at(t + 1), estimator.pace)
+                self.assertLess(estimator.speed_at(t + 10), 3.0)
+                self.assertEqual(estimator.pace_at(t + 29), 0)
+                self.assertEqual(estimator.pace_at(t + 31), 0)
+                self.assertEqual(estimator.speed_at(t + 31), 0)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            PaceEstimator(mode='median')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+记录类型测试
+"""
+
+import unittest
+
+from utils.records import RunRecord
+
+
+class RunRecordTest(unittest.TestCase):
+
+    def test_calories_accept_strings_and_floats(self):
+        """热量与其他数值字段一样容错：字符串和小数不报错也不截断"""
+        self.assertEqual(RunRecord.from_dict({'date': '2026-10-17', 'calories': '12.5'}).calories,
+                         12.5)
+        self.assertEqual(RunRecord.from_dict({'date': '2026-10-17', 'calories': 99.9}).calories,
+                         99.9)
+        self.assertEqual(RunRecord.from_dict({'date': '2026-10-17', 'calories': 'n/a'}).calories,
+                         0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
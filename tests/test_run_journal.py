@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+跑步追加日志测试
+"""
+
+import time
+import unittest
+from unittest import mock
+
+from helpers import TempDirTestCase, make_run
+from utils.storage_manager import StorageManager
+
+DATE = '2026-10-17'
+
+
+class RunJournalTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageManager(run_journal=True, journal_compact_threshold=100,
+                                      data_dir=self.data_dir)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def saved_distances(self):
+        return sorted(run['distance'] for run in
+                      self.storage.load_daily_run_data(DATE)['runs'])
+
+    def test_clock_step_backwards_keeps_runs(self):
+        """系统时钟回拨后保存的记录不会在合并时被跳过"""
+        self.assertTrue(self.storage.save_run_record(make_run(DATE, 1000)))
+        self.assertTrue(self.storage.save_run_record(make_run(DATE, 2000)))
+        # 合并后当天文件记录了已合并的最大序号
+        self.assertTrue(self.storage.compact_run_journal(DATE))
+
+        stepped = time.time_ns() - 3600 * 10 ** 9
+        with mock.patch('time.time_ns', return_value=stepped), \
+                mock.patch('time.time', return_value=stepped / 1e9):
+            self.assertTrue(self.storage.save_run_record(make_run(DATE, 3000)))
+
+        self.assertEqual(self.saved_distances(), [1000, 2000, 3000])
+        self.assertEqual(self.storage.get_user_statistics()['total_runs'], 3)
+
+        self.assertTrue(self.storage.compact_run_journal(DATE))
+        self.storage.cache.clear()
+        self.assertEqual(self.saved_distances(), [1000, 2000, 3000])
+
+    def test_sequence_continues_after_compaction(self):
+        """压缩后继续追加的记录序号大于已合并的序号"""
+        self.storage.save_run_record(make_run(DATE, 1000))
+        self.storage.compact_run_journal(DATE)
+        self.storage.save_run_record(make_run(DATE, 2000))
+
+        # 模拟进程重启：内存中的序号丢失，从文件中恢复
+        self.storage.journal_seqs = {}
+        self.storage.save_run_record(make_run(DATE, 3000))
+
+        self.storage.cache.clear()
+        self.assertEqual(self.saved_distances(), [1000, 2000, 3000])
+
+    def test_leftover_journal_is_not_applied_twice(self):
+        """合并后、删除日志前崩溃，遗留的日志行不会重复应用"""
+        self.storage.save_run_record(make_run(DATE, 1000))
+        self.storage.save_run_record(make_run(DATE, 2000))
+
+        journal_file = self.storage.get_journal_file(DATE)
+        with open(journal_file, 'rb') as f:
+            journal = f.read()
+
+        self.storage.compact_run_journal(DATE)
+        with open(journal_file, 'wb') as f:
+            f.write(journal)
+
+        self.storage.cache.clear()
+        self.assertEqual(self.saved_distances(), [1000, 2000])
+
+    def test_clear_resets_journal_state(self):
+        """清除数据后，日志序号和行数从头开始"""
+        for distance in (1000, 2000, 3000):
+            self.storage.save_run_record(make_run(DATE, distance))
+        self.assertTrue(self.storage.clear_all_data())
+
+        self.storage.save_run_record(make_run(DATE, 4000))
+        self.assertEqual(self.storage.journal_seqs, {DATE: 1})
+        self.assertEqual(self.storage.journal_counts, {DATE: 1})
+        self.assertEqual(self.saved_distances(), [4000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite后端测试
+"""
+
+import os
+import threading
+import unittest
+
+from helpers import TempDirTestCase, make_run
+from utils import json_codec
+from utils.month_archive import ARCHIVE_SUFFIX, build_month_archive
+from utils.sqlite_storage import RECORD_RUN, MigrationError, SQLiteStorage, migrate_json_tree
+from utils.storage_manager import StorageManager
+
+
+class SQLiteMigrationTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('runs', 'foods', 'archive'):
+            os.makedirs(os.path.join(self.data_dir, name))
+
+    def write_json(self, relative, data):
+        with open(os.path.join(self.data_dir, relative), 'w', encoding='utf-8') as f:
+            f.write(json_codec.dumps(data))
+
+    def test_migrates_journal_and_archive(self):
+        """追加日志和月归档中的记录都迁移进数据库，累计统计按迁移结果重建"""
+        # 每日文件
+        self.write_json('runs/runs_2026-10-16.json',
+                        {'date': '2026-10-16', 'runs': [make_run('2026-10-16', 1000)]})
+
+        # 尚未合并的追加日志
+        with open(os.path.join(self.data_dir, 'runs', 'runs_2026-10-17.jsonl'), 'w') as f:
+            for seq, distance in enumerate((2000, 3000), 1):
+                f.write(json_codec.dumps({'op': 'add', 'seq': seq,
+                                          'run': make_run('2026-10-17', distance)}) + '\n')
+
+        # 月归档
+        run_days = {'2024-01-05': {'date': '2024-01-05', 'runs': [make_run('2024-01-05', 4000)]}}
+        food_days = {'2024-01-05': {'date': '2024-01-05',
+                                    'foods': [{'name': '米饭', 'calories': 200}],
+                                    'nutrition': {'calories': 200}}}
+        with open(os.path.join(self.data_dir, 'archive', f'2024-01{ARCHIVE_SUFFIX}'), 'wb') as f:
+            f.write(build_month_archive('2024-01', run_days, food_days))
+
+        # 过期的累计统计
+        self.write_json('statistics.json', {'total_runs': 1, 'total_distance': 1000})
+
+        storage = StorageManager(backend='sqlite', data_dir=self.data_dir)
+
+        self.assertEqual(len(storage.load_daily_run_data('2026-10-17')['runs']), 2)
+        self.assertEqual(len(storage.load_daily_run_data('2024-01-05')['runs']), 1)
+        self.assertEqual(len(storage.load_daily_food_data('2024-01-05')['foods']), 1)
+
+        stats = storage.get_user_statistics()
+        self.assertEqual(stats['total_runs'], 4)
+        self.assertEqual(stats['total_distance'], 10000)
+        self.assertEqual(stats['total_calories_consumed'], 200)
+        storage.close()
+
+    def test_failed_migration_is_retried(self):
+        """有文件无法迁移时不创建数据库（也不留下临时数据库），修复后再次打开重新迁移"""
+        self.write_json('runs/runs_2026-10-16.json',
+                        {'date': '2026-10-16', 'runs': [make_run('2026-10-16', 1000)]})
+        with open(os.path.join(self.data_dir, 'runs', 'runs_2026-10-17.json'), 'w') as f:
+            f.write('{"date": "2026-10-17", "runs": [')
+
+        with self.assertRaises(MigrationError):
+            StorageManager(backend='sqlite', data_dir=self.data_dir)
+        self.assertFalse(any(n.startswith('health.db') for n in os.listdir(self.data_dir)))
+
+        self.write_json('runs/runs_2026-10-17.json',
+                        {'date': '2026-10-17', 'runs': [make_run('2026-10-17', 2000)]})
+        storage = StorageManager(backend='sqlite', data_dir=self.data_dir)
+        try:
+            self.assertEqual(storage.get_user_statistics()['total_distance'], 3000)
+        finally:
+            storage.close()
+
+    def test_bad_file_rolls_back_whole_day(self):
+        """迁移中途失败的文件整体回滚，不留下该文件中已写入的记录"""
+        self.write_json('runs/runs_2026-10-17.json', {'date': '2026-10-17', 'runs': [
+            make_run('2026-10-17', 1000), 'not a run'
+        ]})
+        target = SQLiteStorage(os.path.join(self.temp_dir, 'target.db'))
+        try:
+            result = migrate_json_tree(os.path.join(self.data_dir, 'runs'),
+                                       os.path.join(self.data_dir, 'foods'), target)
+            self.assertEqual(result['failed_files'], ['runs_2026-10-17.json'])
+            self.assertEqual(result['runs'], 0)
+            self.assertEqual(target.list_dates(RECORD_RUN), [])
+        finally:
+            target.close_all()
+
+    def test_legacy_runs_get_ids(self):
+        """没有ID的旧记录迁移时分配ID，迁移后可以按ID修改"""
+        legacy = {'date': '2020-05-01', 'distance': 3000, 'duration': 900}
+        self.write_json('runs/runs_2020-05-01.json', {'date': '2020-05-01', 'runs': [legacy]})
+
+        storage = StorageManager(backend='sqlite', data_dir=self.data_dir)
+        try:
+            run_id = storage.load_daily_run_data('2020-05-01')['runs'][0]['run_id']
+            self.assertTrue(run_id)
+            self.assertEqual(storage.update_run(run_id, {'distance': 3200})['distance'], 3200)
+            self.assertEqual(storage.get_run(run_id)['distance'], 3200)
+        finally:
+            storage.close()
+
+
+class SQLiteRestoreTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageManager(backend='sqlite', data_dir=self.data_dir)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def run_dates(self):
+        return self.storage.list_run_dates()
+
+    def test_async_restore_reconnects_other_threads(self):
+        """后台线程恢复后，主线程的连接读到的是恢复后的数据库"""
+        self.storage.save_run_record(make_run('2024-05-01', 1000))
+        archive = self.storage.backup_data(self.backup_dir)
+        self.assertIsNotNone(archive)
+
+        self.storage.save_run_record(make_run('2024-05-02', 2000))
+        self.storage.save_run_record(make_run('2024-05-03', 3000))
+        # 主线程已经持有连接
+        self.assertEqual(self.run_dates(), ['2024-05-01', '2024-05-02', '2024-05-03'])
+
+        results = []
+        thread = self.storage.restore_data_async(archive, done_callback=results.append)
+        thread.join(timeout=30)
+        self.assertEqual(results, [True])
+
+        self.assertEqual(self.run_dates(), ['2024-05-01'])
+        self.assertEqual(self.storage.get_user_statistics()['total_runs'], 1)
+
+    def test_clear_all_data_reconnects_other_threads(self):
+        """清除数据后其他线程不再读到已删除的数据库"""
+        self.storage.save_run_record(make_run('2024-05-01', 1000))
+        self.assertEqual(self.run_dates(), ['2024-05-01'])
+
+        thread = threading.Thread(target=self.storage.clear_all_data)
+        thread.start()
+        thread.join(timeout=30)
+
+        self.assertEqual(self.run_dates(), [])
+        self.storage.save_run_record(make_run('2024-05-04', 1000))
+        self.assertEqual(self.run_dates(), ['2024-05-04'])
+
+
+if __name__ == '__main__':
+    unittest.main()
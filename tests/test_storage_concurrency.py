@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+StorageManager 并发测试：多线程、多实例同时写入时没有丢失更新
+"""
+
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from helpers import TempDirTestCase, make_run
+from utils import json_codec
+from utils.locks import DataDirLockedError, ProcessFileLock
+from utils.storage_manager import StorageManager
+
+THREADS = 4
+RUNS_PER_THREAD = 10
+DATES = ['2026-10-13', '2026-10-14', '2026-10-15', '2026-10-16']
+
+
+def run_threads(target, count=THREADS):
+    """启动 count 个线程执行 target(线程序号)，等待全部结束并返回其中抛出的异常"""
+    errors = []
+
+    def wrapper(index):
+        try:
+            target(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrapper, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+    return errors
+
+
+class ConcurrencyTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.instances = []
+
+    def tearDown(self):
+        for storage in self.instances:
+            storage.close()
+
+    def open_storage(self, **kwargs):
+        storage = StorageManager(data_dir=self.data_dir, **kwargs)
+        self.instances.append(storage)
+        return storage
+
+    def count_saved_runs(self, storage):
+        return sum(len(storage.load_daily_run_data(date)['runs']) for date in DATES)
+
+    def assert_consistent(self, storage, expected_runs):
+        """逐天数据、累计统计、全量重新统计和跑步索引都与预期一致"""
+        self.assertEqual(self.count_saved_runs(storage), expected_runs)
+        self.assertEqual(storage.get_user_statistics()['total_runs'], expected_runs)
+        self.assertEqual(storage.compute_statistics()['total_runs'], expected_runs)
+        self.assertEqual(len(storage.load_run_index()), expected_runs)
+
+    def test_concurrent_saves_with_backup_and_compaction(self):
+        """多线程保存的同时进行备份和日志压缩，没有记录丢失"""
+        storage = self.open_storage(run_journal=True, journal_compact_threshold=7,
+                                    write_behind=True, write_behind_delay=0.01)
+        done = threading.Event()
+
+        def saver(index):
+            for i in range(RUNS_PER_THREAD):
+                date = DATES[(index + i) % len(DATES)]
+                self.assertTrue(storage.save_run_record(make_run(date, index * 1000 + i)))
+
+        def maintenance(index):
+            # 每轮之间稍作停顿，给保存线程获取共享锁的机会
+            while not done.wait(0.05):
+                if index == 0:
+                    self.assertIsNotNone(storage.backup_data(self.backup_dir, incremental=True))
+                else:
+                    storage.compact_all_run_journals()
+
+        maintenance_errors = []
+        maintainer = threading.Thread(
+            target=lambda: maintenance_errors.extend(run_threads(maintenance, count=2)))
+        maintainer.start()
+        errors = run_threads(saver)
+        done.set()
+        maintainer.join(timeout=120)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(maintenance_errors, [])
+        self.assert_consistent(storage, THREADS * RUNS_PER_THREAD)
+
+    def test_same_day_read_modify_write(self):
+        """同一天的读-改-写互相串行（不使用追加日志）"""
+        storage = self.open_storage()
+
+        def saver(index):
+            for i in range(RUNS_PER_THREAD):
+                storage.save_run_record(make_run(DATES[0], index * 1000 + i))
+
+        self.assertEqual(run_threads(saver), [])
+        self.assertEqual(len(storage.load_daily_run_data(DATES[0])['runs']),
+                         THREADS * RUNS_PER_THREAD)
+        self.assertEqual(storage.get_user_statistics()['total_runs'], THREADS * RUNS_PER_THREAD)
+
+    def test_concurrent_food_entries(self):
+        """同一天并发添加食物条目，营养汇总与条目一致"""
+        storage = self.open_storage(write_behind=True, write_behind_delay=0.01)
+
+        def adder(index):
+            for i in range(RUNS_PER_THREAD):
+                storage.add_food_entry(DATES[0], {'name': f'食物{index}-{i}', 'calories': 10,
+                                                  'timestamp': f'{index}-{i}'})
+
+        self.assertEqual(run_threads(adder), [])
+        data = storage.load_daily_food_data(DATES[0])
+        self.assertEqual(len(data['foods']), THREADS * RUNS_PER_THREAD)
+        self.assertAlmostEqual(data['nutrition']['calories'], THREADS * RUNS_PER_THREAD * 10)
+        self.assertAlmostEqual(storage.get_user_statistics()['total_calories_consumed'],
+                               THREADS * RUNS_PER_THREAD * 10)
+
+    def test_multiple_instances_on_same_root(self):
+        """同一根目录的多个实例并发写入，持久化的统计和索引包含所有实例的更新"""
+        instances = [self.open_storage(run_journal=True),
+                     self.open_storage(write_behind=True, write_behind_delay=0.01),
+                     self.open_storage()]
+
+        def saver(index):
+            storage = instances[index % len(instances)]
+            for i in range(RUNS_PER_THREAD):
+                date = DATES[(index + i) % len(DATES)]
+                storage.save_run_record(make_run(date, index * 1000 + i))
+
+        self.assertEqual(run_threads(saver), [])
+        expected = THREADS * RUNS_PER_THREAD
+        for storage in instances:
+            self.assert_consistent(storage, expected)
+
+        for storage in self.instances:
+            storage.close()
+        self.instances = []
+
+        # 落盘的文件中同样包含所有更新
+        stats = json_codec.load_file(os.path.join(self.data_dir, 'statistics.json'))
+        self.assertEqual(stats['total_runs'], expected)
+
+        reopened = self.open_storage()
+        self.assert_consistent(reopened, expected)
+
+    def test_failed_constructor_releases_root(self):
+        """构造失败（后端名称错误、加载出错）后数据根目录被释放，可以再次打开"""
+        with self.assertRaises(ValueError):
+            StorageManager(backend='mongo', data_dir=self.data_dir)
+        with mock.patch.object(StorageManager, 'load_statistics', side_effect=OSError('磁盘错误')):
+            with self.assertRaises(OSError):
+                StorageManager(data_dir=self.data_dir)
+
+        file_lock = ProcessFileLock(os.path.abspath(self.data_dir) + '.lock')
+        file_lock.acquire(timeout=0)
+        file_lock.release()
+
+        storage = self.open_storage()
+        storage.save_run_record(make_run(DATES[0], 1000))
+        self.assert_consistent(storage, 1)
+
+    def test_locked_root_fails_fast(self):
+        """数据目录被占用时，lock_timeout=0 立即抛出 DataDirLockedError，不等待"""
+        os.makedirs(self.data_dir)
+        file_lock = ProcessFileLock(os.path.abspath(self.data_dir) + '.lock')
+        file_lock.acquire(timeout=0)
+        try:
+            started = time.time()
+            with self.assertRaises(DataDirLockedError):
+                StorageManager(data_dir=self.data_dir, lock_timeout=0)
+            self.assertLess(time.time() - started, 1.0)
+        finally:
+            file_lock.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+轨迹编码测试
+"""
+
+import unittest
+
+from helpers import make_route
+from utils.track_codec import FLAG_WIDE_TIME, HEADER, pack_route, unpack_columns, unpack_route
+
+START = 1700000000
+
+
+def flags_of(data):
+    return HEADER.unpack_from(data, 0)[1]
+
+
+class TrackCodecTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        """打包后解包得到相同的坐标、时间和距离，普通轨迹的时间列仍为32位"""
+        route = make_route(lon_step=0.0001)
+        data = pack_route(route)
+        self.assertFalse(flags_of(data) & FLAG_WIDE_TIME)
+
+        columns = unpack_columns(data)
+        for i, point in enumerate(route):
+            self.assertAlmostEqual(columns['lat'][i], point['lat'], places=6)
+            self.assertAlmostEqual(columns['lon'][i], point['lon'], places=6)
+            self.assertEqual(columns['time'][i], point['timestamp'] * 1000)
+            self.assertAlmostEqual(columns['distance'][i], point['distance'], places=2)
+
+    def test_zero_and_missing_timestamps(self):
+        """时间为0的点夹在真实时间之间不会溢出；缺少时间的点沿用上一个点的时间"""
+        route = make_route()
+        route[2]['timestamp'] = 0
+        del route[3]['timestamp']
+        data = pack_route(route)
+        self.assertTrue(flags_of(data) & FLAG_WIDE_TIME)
+
+        times = list(unpack_columns(data)['time'])
+        self.assertEqual(times, [START * 1000, (START + 1) * 1000, 0, 0, (START + 4) * 1000])
+        self.assertEqual(len(unpack_route(data)), 5)
+
+    def test_antimeridian(self):
+        """跨越180度经线的路线不会溢出，解包后经度仍在 [-180, 180)"""
+        route = make_route(lon=179.9998, lon_step=0.0001)
+        data = pack_route(route)
+
+        lons = list(unpack_columns(data)['lon'])
+        expected = [179.9998, 179.9999, -180.0, -179.9999, -179.9998]
+        for lon, value in zip(lons, expected):
+            self.assertAlmostEqual(lon, value, places=6)
+
+    def test_out_of_range_values(self):
+        """负的精度和超出范围的纬度被截断，不会抛出异常"""
+        route = make_route()
+        route[1]['accuracy'] = -3
+        route[2]['lat'] = 95.0
+        columns = unpack_columns(pack_route(route))
+        self.assertEqual(columns['accuracy'][1], 0)
+        self.assertEqual(columns['lat'][2], 90.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+原子文件写入
+先写临时文件再重命名替换，并按时间窗口批量fsync
+"""
+
+import os
+import tempfile
+import threading
+
+from utils import json_codec
+
+
+class AtomicWriter:
+    """原子写入器
+
+    重命名替换保证进程被杀时文件要么是旧内容、要么是新内容；
+    fsync按窗口批量执行，用于抵御断电等系统级崩溃。
+    fsync_mode: 'always' 每次写入都fsync，'batch' 每个窗口一次，'never' 不fsync
+    """
+
+    def __init__(self, fsync_mode='batch', fsync_window=2.0):
+        if fsync_mode not in ('always', 'batch', 'never'):
+            raise ValueError(f"未知的fsync模式: {fsync_mode}")
+
+        self.fsync_mode = fsync_mode
+        self.fsync_window = fsync_window
+
+        self._lock = threading.Lock()
+        self._pending_files = set()
+        self._pending_dirs = set()
+        self._timer = None
+
+        self.fsync_count = 0
+
+    def write_text(self, path, text):
+        """原子写入文本文件"""
+        self.write_bytes(path, text.encode('utf-8'))
+
+    def write_bytes(self, path, data):
+        """原子写入二进制文件"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(
+            prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory
+        )
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                if self.fsync_mode == 'always':
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self._after_write(path, directory)
+
+    def write_json(self, path, data, pretty=False):
+        """原子写入JSON文件（默认紧凑格式）"""
+        self.write_bytes(path, json_codec.dumps_bytes(data, pretty))
+
+    def append_line(self, path, line):
+        """向文件追加一行（追加本身不需要重命名）"""
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            if self.fsync_mode == 'always':
+                os.fsync(f.fileno())
+
+        self._after_write(path, os.path.dirname(os.path.abspath(path)))
+
+    def remove(self, path):
+        """删除文件并登记目录待同步"""
+        os.remove(path)
+        self._after_write(None, os.path.dirname(os.path.abspath(path)))
+
+    def _after_write(self, path, directory):
+        """登记待同步的文件和目录"""
+        if self.fsync_mode == 'never':
+            return
+
+        if self.fsync_mode == 'always':
+            self._fsync_dir(directory)
+            self.fsync_count += 1
+            return
+
+        with self._lock:
+            if path:
+                self._pending_files.add(path)
+            self._pending_dirs.add(directory)
+
+            if self._timer is None:
+                self._timer = threading.Timer(self.fsync_window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """立即同步窗口内所有待同步的文件和目录"""
+        with self._lock:
+            files = self._pending_files
+            dirs = self._pending_dirs
+            self._pending_files = set()
+            self._pending_dirs = set()
+
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not files and not dirs:
+            return
+
+        for path in files:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                # 文件可能已被后续操作删除或替换
+                pass
+
+        for directory in dirs:
+            self._fsync_dir(directory)
+
+        self.fsync_count += 1
+
+    def _fsync_dir(self, directory):
+        """同步目录项（保证重命名落盘，Windows不支持时忽略）"""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
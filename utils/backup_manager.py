@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+数据备份管理
+将数据目录流式写入单个压缩归档（zip/deflate），附带逐文件哈希清单，
+支持增量备份，以及校验后原子替换的恢复
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import zipfile
+from datetime import datetime
+
+ARCHIVE_PREFIX = 'health_app_backup_'
+ARCHIVE_SUFFIX = '.zip'
+MANIFEST_NAME = 'manifest.json'
+CHUNK_SIZE = 64 * 1024
+
+# 不需要备份的文件（临时文件、SQLite的WAL辅助文件）
+EXCLUDED_SUFFIXES = ('.tmp', '-wal', '-shm')
+
+# 原地修改的文件（追加日志、SQLite数据库），快照时必须复制；
+# 其余文件都经原子重命名替换，快照中硬链接即可保留当时的内容
+IN_PLACE_SUFFIXES = ('.jsonl', '.db')
+
+SNAPSHOT_MARKER = '.snapshot_'
+BEFORE_RESTORE_MARKER = '.before_restore_'
+
+
+class BackupError(Exception):
+    """备份或恢复失败"""
+
+
+class BackupManager:
+    """数据备份管理器"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+    def list_data_files(self, source_dir=None):
+        """列出需要备份的文件（相对路径）"""
+        source_dir = source_dir or self.data_dir
+        files = []
+        for root, dirs, filenames in os.walk(source_dir):
+            dirs.sort()
+            for filename in sorted(filenames):
+                if filename.startswith('.') or filename.endswith(EXCLUDED_SUFFIXES):
+                    continue
+                full_path = os.path.join(root, filename)
+                files.append(os.path.relpath(full_path, source_dir).replace(os.sep, '/'))
+        return files
+
+    def sibling_dirs(self, marker):
+        """数据目录旁边以 <数据目录名><marker> 开头的目录（按名称即时间排序）"""
+        base = self.data_dir.rstrip('/\\')
+        parent = os.path.dirname(os.path.abspath(base))
+        prefix = os.path.basename(base) + marker
+        if not os.path.isdir(parent):
+            return []
+        return sorted(os.path.join(parent, name) for name in os.listdir(parent)
+                      if name.startswith(prefix) and os.path.isdir(os.path.join(parent, name)))
+
+    def create_snapshot(self):
+        """在数据目录旁边建立快照目录，返回其路径
+
+        调用方需独占数据目录；快照只做硬链接和少量复制，很快完成，
+        之后的压缩归档从快照读取，不再需要持有锁。
+        硬链接不可用时（例如部分外部存储）退回复制。
+        """
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        snapshot_dir = self.data_dir.rstrip('/\\') + f'{SNAPSHOT_MARKER}{timestamp}'
+        os.makedirs(snapshot_dir)
+
+        try:
+            for rel_path in self.list_data_files():
+                source = os.path.join(self.data_dir, *rel_path.split('/'))
+                target = os.path.join(snapshot_dir, *rel_path.split('/'))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+
+                if not rel_path.endswith(IN_PLACE_SUFFIXES):
+                    try:
+                        os.link(source, target)
+                        continue
+                    except OSError:
+                        pass
+                shutil.copy2(source, target)
+        except Exception:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            raise
+
+        return snapshot_dir
+
+    def remove_stale_snapshots(self):
+        """删除异常退出时遗留的快照目录（仅在没有备份进行时调用）"""
+        for path in self.sibling_dirs(SNAPSHOT_MARKER):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def remove_before_restore_copies(self):
+        """删除恢复时替换下来的旧数据目录，返回删除的路径列表"""
+        removed = []
+        for path in self.sibling_dirs(BEFORE_RESTORE_MARKER):
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+        return removed
+
+    def find_latest_archive(self, backup_dir):
+        """查找备份目录中最新的归档"""
+        if not os.path.isdir(backup_dir):
+            return None
+
+        archives = sorted(
+            name for name in os.listdir(backup_dir)
+            if name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIX)
+        )
+        return os.path.join(backup_dir, archives[-1]) if archives else None
+
+    def read_manifest(self, archive_path):
+        """读取归档中的清单"""
+        with zipfile.ZipFile(archive_path, 'r') as zf:
+            with zf.open(MANIFEST_NAME) as f:
+                return json.loads(f.read().decode('utf-8'))
+
+    def create_backup(self, backup_dir, incremental=False, progress_callback=None,
+                      source_dir=None):
+        """创建备份归档，返回归档路径
+
+        增量模式只写入自上次备份以来有变化的文件，未变化的文件在清单中
+        指向之前的归档。source_dir 为 create_snapshot 得到的快照目录，
+        默认直接读取数据目录。
+        """
+        source_dir = source_dir or self.data_dir
+        os.makedirs(backup_dir, exist_ok=True)
+
+        # 上次备份的清单（用于增量比较）
+        previous = {}
+        latest = None
+        if incremental:
+            latest = self.find_latest_archive(backup_dir)
+            if latest:
+                previous = self.read_manifest(latest).get('files', {})
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        archive_name = f'{ARCHIVE_PREFIX}{timestamp}{ARCHIVE_SUFFIX}'
+        archive_path = os.path.join(backup_dir, archive_name)
+        tmp_path = archive_path + '.tmp'
+
+        files = self.list_data_files(source_dir)
+        manifest = {
+            'created_at': datetime.now().isoformat(),
+            'incremental': bool(previous),
+            'base_archive': os.path.basename(latest) if previous else None,
+            'files': {}
+        }
+
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=6) as zf:
+                for i, rel_path in enumerate(files, 1):
+                    full_path = os.path.join(source_dir, rel_path)
+                    st = os.stat(full_path)
+                    old_entry = previous.get(rel_path)
+
+                    # 大小和修改时间未变化时沿用上次归档
+                    if (old_entry and old_entry['size'] == st.st_size and
+                            old_entry['mtime_ns'] == st.st_mtime_ns):
+                        manifest['files'][rel_path] = old_entry
+                    else:
+                        digest = self._write_member(zf, full_path, rel_path)
+                        manifest['files'][rel_path] = {
+                            'size': st.st_size,
+                            'mtime_ns': st.st_mtime_ns,
+                            'sha256': digest,
+                            'archive': archive_name
+                        }
+
+                    if progress_callback:
+                        progress_callback(i, len(files))
+
+                zf.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+
+            os.replace(tmp_path, archive_path)
+            return archive_path
+
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _write_member(self, zf, full_path, rel_path):
+        """将文件流式写入归档，同时计算SHA-256"""
+        sha = hashlib.sha256()
+        info = zipfile.ZipInfo.from_file(full_path, rel_path)
+        info.compress_type = zipfile.ZIP_DEFLATED
+
+        with open(full_path, 'rb') as src, zf.open(info, 'w') as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                dst.write(chunk)
+
+        return sha.hexdigest()
+
+    def restore_backup(self, archive_path, progress_callback=None):
+        """校验并恢复备份，原子替换数据目录，返回被替换下来的旧数据目录路径"""
+        backup_dir = os.path.dirname(os.path.abspath(archive_path))
+        manifest = self.read_manifest(archive_path)
+        files = manifest.get('files', {})
+
+        staging_dir = self.data_dir.rstrip('/\\') + '.restoring'
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+        os.makedirs(staging_dir)
+
+        try:
+            open_archives = {}
+            try:
+                for i, (rel_path, entry) in enumerate(sorted(files.items()), 1):
+                    name = entry['archive']
+                    if name not in open_archives:
+                        source = os.path.join(backup_dir, name)
+                        if not os.path.exists(source):
+                            raise BackupError(f"缺少增量备份依赖的归档: {name}")
+                        open_archives[name] = zipfile.ZipFile(source, 'r')
+
+                    self._extract_member(open_archives[name], rel_path, entry, staging_dir)
+
+                    if progress_callback:
+                        progress_callback(i, len(files))
+            finally:
+                for zf in open_archives.values():
+                    zf.close()
+
+            return self.swap_in(staging_dir)
+
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    def restore_directory(self, source_dir):
+        """从旧格式的目录备份恢复（复制到暂存目录后原子替换）"""
+        staging_dir = self.data_dir.rstrip('/\\') + '.restoring'
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+
+        try:
+            shutil.copytree(source_dir, staging_dir)
+            return self.swap_in(staging_dir)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    def _extract_member(self, zf, rel_path, entry, staging_dir):
+        """流式解压单个文件并校验哈希
+
+        清单中的路径来自归档文件，不可信：解析后必须仍位于暂存目录内，
+        拒绝 ../ 或绝对路径把文件写到数据目录之外。
+        """
+        root = os.path.realpath(staging_dir)
+        target = os.path.realpath(os.path.join(root, *rel_path.split('/')))
+        if os.path.commonpath([root, target]) != root or target == root:
+            raise BackupError(f"备份中包含非法路径: {rel_path}")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        sha = hashlib.sha256()
+        with zf.open(rel_path, 'r') as src, open(target, 'wb') as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                dst.write(chunk)
+
+        if sha.hexdigest() != entry['sha256']:
+            raise BackupError(f"备份文件校验失败: {rel_path}")
+
+    def swap_in(self, staging_dir):
+        """用暂存目录替换数据目录，返回旧数据目录的新位置
+
+        旧数据目录是完整副本，占用与数据目录相同的空间：只保留最近一次
+        恢复前的数据，更早的副本在替换成功后删除；最近一次的副本由调用方
+        在确认恢复的数据可用后用 remove_before_restore_copies 删除
+        （StorageManager 在下次打开数据目录成功后自动删除）。
+        """
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        old_dir = self.data_dir.rstrip('/\\') + f'{BEFORE_RESTORE_MARKER}{timestamp}'
+
+        if os.path.exists(self.data_dir):
+            os.replace(self.data_dir, old_dir)
+        else:
+            old_dir = None
+
+        try:
+            os.replace(staging_dir, self.data_dir)
+        except Exception:
+            # 替换失败时放回原数据
+            if old_dir:
+                os.replace(old_dir, self.data_dir)
+            raise
+
+        for path in self.sibling_dirs(BEFORE_RESTORE_MARKER):
+            if path != os.path.abspath(old_dir or ''):
+                shutil.rmtree(path, ignore_errors=True)
+
+        return old_dir
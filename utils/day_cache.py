@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+日数据文档缓存
+按 (类型, 日期) 缓存已解析的每日数据，LRU淘汰，按文件修改时间校验
+"""
+
+import marshal
+import threading
+from collections import OrderedDict
+
+
+class DayDocumentCache:
+    """每日数据文档的LRU缓存
+
+    文档以marshal序列化后的字节保存，每次命中都返回一份新的副本，
+    调用方修改返回值不会污染缓存。
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 命中统计
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """获取缓存文档，版本（文件修改时间）不一致时视为未命中"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            payload = entry[1]
+
+        return marshal.loads(payload)
+
+    def put(self, key, version, document):
+        """写入缓存"""
+        try:
+            payload = marshal.dumps(document)
+        except ValueError:
+            # 含有无法序列化的对象时不缓存
+            return
+
+        with self._lock:
+            self._entries[key] = (version, payload)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """使某个文档的缓存失效"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """获取缓存统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0
+            }
@@ -4,6 +4,7 @@
 提供统一的错误处理和用户反馈机制
 """
 
+import os
 import traceback
 import logging
 from datetime import datetime
@@ -12,17 +13,31 @@ from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.boxlayout import BoxLayout
 
+DEFAULT_LOG_DIR = 'HealthApp_Python/logs'
+
+
+def get_app_logger(log_dir):
+    """获取写入指定日志目录的日志器（每个目录一个，互不干扰）"""
+    log_dir = os.path.abspath(log_dir)
+    logger = logging.getLogger(f'HealthApp[{log_dir}]')
+    
+    if not logger.handlers:
+        os.makedirs(log_dir, exist_ok=True)
+        handler = logging.FileHandler(os.path.join(log_dir, 'app.log'), encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    
+    return logger
+
 class ErrorHandler:
     """统一错误处理器"""
     
-    def __init__(self):
+    def __init__(self, log_dir=DEFAULT_LOG_DIR):
         # 设置日志
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            filename='HealthApp_Python/logs/app.log'
-        )
-        self.logger = logging.getLogger('HealthApp')
+        self.log_dir = log_dir
+        self.logger = get_app_logger(log_dir)
         
         # 错误统计
         self.error_count = 0
@@ -155,7 +170,7 @@ class ErrorHandler:
     def export_error_report(self):
         """导出错误报告"""
         try:
-            report_path = 'HealthApp_Python/logs/error_report.txt'
+            report_path = os.path.join(self.log_dir, 'error_report.txt')
             
             with open(report_path, 'w', encoding='utf-8') as f:
                 f.write(f"健康追踪应用 - 错误报告\n")
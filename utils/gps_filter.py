@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+GPS定位过滤
+位于GPSService与其使用者之间的可替换过滤环节：速度门限剔除不可能的
+跳点，匀速模型卡尔曼滤波按定位精度平滑坐标，最小位移门限把精度范围内
+的抖动标为没有移动（抖动逐段累加会让距离偏大）。每次定位 O(1)，可以直接在GPS回调线程中运行。
+
+运行 python tests/benchmarks.py gps 用带噪声的模拟轨迹比较过滤前后的距离
+"""
+
+import math
+from datetime import datetime
+
+from utils.track_metrics import EARTH_RADIUS, haversine_distance
+
+# 跑步场景下不可能达到的速度（米/秒，约43公里/小时）
+MAX_SPEED = 12.0
+
+# 超过该间隔（秒）视为信号中断，滤波器重新开始
+MAX_GAP = 30.0
+
+# 卡尔曼滤波的加速度噪声强度（米²/秒³）：跑步的速度变化平缓，
+# 取值越大越贴近原始定位，抖动也越多
+ACCELERATION_NOISE = 0.05
+
+# 最小位移门限：与上一个输出的定位距离小于 max(MIN_DISTANCE, 精度 × MIN_DISTANCE_FACTOR)
+# 的定位标为没有移动
+MIN_DISTANCE = 3.0
+MIN_DISTANCE_FACTOR = 1.5
+
+
+def _seconds(timestamp):
+    """定位时间转换为秒"""
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+class LocationFilter:
+    """定位过滤器基类
+
+    process(fix) 接收定位字典 {'lat', 'lon', 'accuracy', 'timestamp', ...}，
+    返回（可能经过修正的）定位字典，丢弃该定位时返回None。
+    返回的定位带有 'moved': False 时表示该时刻没有移动（坐标保持上一个位置），
+    使用者不累加距离，但仍按该时间更新速度。
+    """
+
+    def process(self, fix):
+        return fix
+
+    def reset(self):
+        """开始新的追踪时清空状态"""
+
+
+class FilterChain(LocationFilter):
+    """按顺序执行多个过滤器，任一过滤器丢弃则整体丢弃"""
+
+    def __init__(self, filters):
+        self.filters = list(filters)
+
+    def process(self, fix):
+        for location_filter in self.filters:
+            fix = location_filter.process(fix)
+            if fix is None:
+                return None
+        return fix
+
+    def reset(self):
+        for location_filter in self.filters:
+            location_filter.reset()
+
+
+class SpeedGate(LocationFilter):
+    """速度门限：与上一个接受的定位相比，扣除两者精度范围后的速度超过 max_speed 的定位被丢弃
+
+    连续丢弃 max_rejects 次后认为是上一个定位本身有误，接受当前定位重新开始。
+    """
+
+    def __init__(self, max_speed=MAX_SPEED, max_rejects=5):
+        self.max_speed = max_speed
+        self.max_rejects = max_rejects
+        self.reset()
+
+    def reset(self):
+        self.last_fix = None
+        self.last_time = None
+        self.rejected = 0
+
+    def process(self, fix):
+        now = _seconds(fix['timestamp'])
+
+        if self.last_fix is not None and self.rejected < self.max_rejects:
+            dt = now - self.last_time
+            distance = haversine_distance(self.last_fix['lat'], self.last_fix['lon'],
+                                          fix['lat'], fix['lon'])
+            # 两次定位各自约两倍精度范围内的位移不算跳点
+            margin = 2 * ((fix.get('accuracy') or 0) + (self.last_fix.get('accuracy') or 0))
+            distance = max(distance - margin, 0.0)
+            if distance > 0 and (dt <= 0 or distance / dt > self.max_speed):
+                self.rejected += 1
+                return None
+
+        self.last_fix = fix
+        self.last_time = now
+        self.rejected = 0
+        return fix
+
+
+class _AxisKalman:
+    """单轴匀速模型卡尔曼滤波（状态：位置、速度）"""
+
+    __slots__ = ('position', 'velocity', 'p00', 'p01', 'p11')
+
+    def __init__(self, position, variance):
+        self.position = position
+        self.velocity = 0.0
+        self.p00 = variance
+        self.p01 = 0.0
+        self.p11 = 25.0     # 初始速度未知（标准差5米/秒）
+
+    def predict(self, dt, q):
+        """按匀速模型外推 dt 秒（q 为加速度噪声强度）"""
+        self.position += self.velocity * dt
+        self.p00 += 2 * dt * self.p01 + dt * dt * self.p11 + q * dt ** 3 / 3
+        self.p01 += dt * self.p11 + q * dt * dt / 2
+        self.p11 += q * dt
+
+    def update(self, measurement, variance):
+        """融合一次位置观测"""
+        s = self.p00 + variance
+        k0 = self.p00 / s
+        k1 = self.p01 / s
+        residual = measurement - self.position
+
+        self.position += k0 * residual
+        self.velocity += k1 * residual
+        self.p11 -= k1 * self.p01
+        self.p01 *= 1 - k0
+        self.p00 *= 1 - k0
+
+
+class KalmanFilter(LocationFilter):
+    """匀速模型卡尔曼滤波
+
+    以第一个定位为原点换算到本地平面坐标（米），东、北两个方向各自滤波；
+    观测噪声取定位精度的平方，精度差的定位对结果影响小。
+    """
+
+    def __init__(self, acceleration_noise=ACCELERATION_NOISE, min_accuracy=3.0, max_gap=MAX_GAP):
+        self.acceleration_noise = acceleration_noise
+        self.min_accuracy = min_accuracy
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self.origin = None
+        self.last_time = None
+        self.east = None
+        self.north = None
+
+    def to_local(self, lat, lon):
+        """经纬度换算为相对原点的 (东, 北) 米"""
+        lat0, lon0, cos_lat0 = self.origin
+        scale = math.pi / 180 * EARTH_RADIUS
+        return (lon - lon0) * scale * cos_lat0, (lat - lat0) * scale
+
+    def to_latlon(self, east, north):
+        """本地坐标换算回经纬度"""
+        lat0, lon0, cos_lat0 = self.origin
+        scale = math.pi / 180 * EARTH_RADIUS
+        return lat0 + north / scale, lon0 + east / (scale * cos_lat0)
+
+    def process(self, fix):
+        now = _seconds(fix['timestamp'])
+        accuracy = max(fix.get('accuracy') or 0, self.min_accuracy)
+        variance = accuracy * accuracy
+
+        if self.origin is None or now - self.last_time > self.max_gap:
+            self.origin = (fix['lat'], fix['lon'], math.cos(math.radians(fix['lat'])))
+            self.east = _AxisKalman(0.0, variance)
+            self.north = _AxisKalman(0.0, variance)
+            self.last_time = now
+            return fix
+
+        east, north = self.to_local(fix['lat'], fix['lon'])
+
+        dt = now - self.last_time
+        if dt > 0:
+            self.east.predict(dt, self.acceleration_noise)
+            self.north.predict(dt, self.acceleration_noise)
+            self.last_time = now
+
+        self.east.update(east, variance)
+        self.north.update(north, variance)
+
+        lat, lon = self.to_latlon(self.east.position, self.north.position)
+        filtered = dict(fix)
+        filtered['lat'] = lat
+        filtered['lon'] = lon
+        filtered['raw_lat'] = fix['lat']
+        filtered['raw_lon'] = fix['lon']
+        return filtered
+
+
+class DisplacementGate(LocationFilter):
+    """最小位移门限：离上一个移动定位不够远的定位标为没有移动
+
+    静止或慢速时平滑后的坐标仍在精度范围内小幅抖动，逐点累加会虚增距离；
+    只在位移超出精度范围后才作为新位置输出，距离按较长的线段累加。范围内的
+    定位保持上一个位置并带 'moved': False 输出，使用者据此知道这一时刻没有移动
+    （停下后速度、配速仍会随时间更新）。
+    """
+
+    def __init__(self, min_distance=MIN_DISTANCE, accuracy_factor=MIN_DISTANCE_FACTOR):
+        self.min_distance = min_distance
+        self.accuracy_factor = accuracy_factor
+        self.reset()
+
+    def reset(self):
+        self.last_fix = None
+
+    def process(self, fix):
+        if self.last_fix is not None:
+            distance = haversine_distance(self.last_fix['lat'], self.last_fix['lon'],
+                                          fix['lat'], fix['lon'])
+            threshold = max(self.min_distance, self.accuracy_factor * (fix.get('accuracy') or 0))
+            if distance < threshold:
+                held = dict(fix)
+                held['lat'] = self.last_fix['lat']
+                held['lon'] = self.last_fix['lon']
+                held['moved'] = False
+                return held
+
+        self.last_fix = fix
+        return fix
+
+
+def default_location_filter():
+    """默认过滤环节：先剔除跳点，再卡尔曼平滑，最后把精度范围内的抖动标为没有移动"""
+    return FilterChain([SpeedGate(), KalmanFilter(), DisplacementGate()])
+
+
+def replay(fixes, location_filter=None):
+    """用过滤器回放一段记录的定位，返回 (移动的定位列表, 过滤前距离, 过滤后距离)
+
+    fixes 为按时间排序的定位字典列表（与路线点格式相同）。
+    """
+    location_filter = location_filter or default_location_filter()
+    location_filter.reset()
+
+    accepted = []
+    for fix in fixes:
+        result = location_filter.process(dict(fix))
+        if result is not None and result.get('moved', True):
+            accepted.append(result)
+
+    def path_length(points):
+        return sum(haversine_distance(a['lat'], a['lon'], b['lat'], b['lon'])
+                   for a, b in zip(points, points[1:]))
+
+    return accepted, path_length(fixes), path_length(accepted)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+数据完整性检查
+逐个检查每日数据文件：JSON是否可解析、文档结构与记录格式、
+营养汇总与食物条目是否一致、路线时间与（GPS）距离是否单调递增。
+
+检查函数都在模块顶层且只依赖文件路径，可以直接交给进程池并行执行；
+修复在主进程中按检查结果进行。
+"""
+
+import os
+import uuid
+from datetime import datetime
+
+from utils import json_codec
+from utils.records import RunRecord, FoodEntry, DayNutrition, NUTRIENTS
+from utils.track_codec import TRACK_FORMAT, unpack_route, get_run_route
+from utils.track_metrics import route_distance_source
+from utils.month_archive import MonthArchive, ARCHIVE_SUFFIX
+
+# 需要隔离的问题（文件整体不可读，无法就地修复）
+FATAL_CODES = ('invalid_json', 'not_object', 'bad_track', 'bad_archive')
+
+# 可以就地修复的问题
+REPAIRABLE_CODES = ('date_mismatch', 'missing_list', 'bad_entry', 'missing_run_id',
+                    'nutrition_mismatch', 'journal_bad_line', 'orphan_track')
+
+
+def make_issue(code, message, index=None):
+    """构造一条问题记录"""
+    issue = {'code': code, 'message': message,
+             'repairable': code in REPAIRABLE_CODES or code in FATAL_CODES}
+    if index is not None:
+        issue['index'] = index
+    return issue
+
+
+def _timestamp(value):
+    """路线点时间转换为可比较的秒数（无法解析时返回None）"""
+    try:
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        pass
+    return None
+
+
+def check_route(route, index=None, distance_source='gps'):
+    """检查路线：时间不能倒退，坐标在有效范围内；
+    距离全部来自GPS（distance_source 为 'gps'）时累计距离不能减少
+    """
+    check_distance = distance_source == 'gps'
+    issues = []
+    backwards = shrinking = out_of_range = 0
+    last_time = last_distance = None
+
+    for point in route:
+        if not isinstance(point, dict):
+            continue
+
+        current = _timestamp(point.get('timestamp'))
+        if current is not None:
+            if last_time is not None and current < last_time:
+                backwards += 1
+            last_time = current
+
+        distance = point.get('distance')
+        if check_distance and isinstance(distance, (int, float)):
+            if last_distance is not None and distance < last_distance - 1e-6:
+                shrinking += 1
+            last_distance = distance
+
+        lat, lon = point.get('lat'), point.get('lon')
+        if isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                out_of_range += 1
+
+    if backwards:
+        issues.append(make_issue('route_order', f"路线中有 {backwards} 处时间倒退", index))
+    if shrinking:
+        issues.append(make_issue('route_order', f"路线中有 {shrinking} 处累计距离减少", index))
+    if out_of_range:
+        issues.append(make_issue('route_range', f"路线中有 {out_of_range} 个坐标超出范围", index))
+    return issues
+
+
+def load_track(tracks_dir, run):
+    """读取跑步的轨迹文件，返回 (路线, 问题列表)"""
+    path = os.path.join(tracks_dir, f"{run['run_id']}.trk")
+    if not os.path.exists(path):
+        return None, [make_issue('missing_track', f"缺少轨迹文件: {run['run_id']}.trk")]
+
+    try:
+        with open(path, 'rb') as f:
+            route = unpack_route(f.read())
+    except Exception as e:
+        issue = make_issue('bad_track', f"轨迹文件损坏: {e}")
+        issue['path'] = path
+        return None, [issue]
+
+    issues = []
+    expected = run.get('track_points')
+    if expected is not None and expected != len(route):
+        issues.append(make_issue('track_points', f"轨迹点数 {len(route)} 与记录的 {expected} 不符"))
+    return route, issues
+
+
+def check_run_day(data, date, tracks_dir=None):
+    """检查一天的跑步文档，返回 (问题列表, 引用的跑步ID列表)"""
+    if not isinstance(data, dict):
+        return [make_issue('not_object', "文档不是JSON对象")], []
+
+    issues = []
+    run_ids = []
+
+    if data.get('date', date) != date:
+        issues.append(make_issue('date_mismatch', f"文档日期 {data.get('date')} 与文件名不符"))
+
+    runs = data.get('runs')
+    if not isinstance(runs, list):
+        return issues + [make_issue('missing_list', "缺少跑步记录列表")], run_ids
+
+    for index, run in enumerate(runs):
+        if not isinstance(run, dict):
+            issues.append(make_issue('bad_entry', "跑步记录不是JSON对象", index))
+            continue
+        try:
+            record = RunRecord.from_dict(run)
+        except Exception as e:
+            issues.append(make_issue('bad_entry', f"跑步记录格式错误: {e}", index))
+            continue
+
+        if record.date and record.date != date:
+            issues.append(make_issue('date_mismatch', f"跑步日期 {record.date} 与文件名不符", index))
+        if record.distance < 0 or record.duration < 0:
+            issues.append(make_issue('bad_value', "距离或时长为负数", index))
+
+        if not record.run_id:
+            issues.append(make_issue('missing_run_id', "跑步记录没有ID", index))
+        else:
+            run_ids.append(record.run_id)
+
+        route = None
+        if record.track_format == TRACK_FORMAT and not run.get('route'):
+            if tracks_dir and record.run_id:
+                route, track_issues = load_track(tracks_dir, run)
+                for issue in track_issues:
+                    issue['index'] = index
+                issues.extend(track_issues)
+        else:
+            route = get_run_route(run)
+
+        if isinstance(route, list) and route:
+            distance_source = record.distance_source or route_distance_source(route)
+            issues.extend(check_route(route, index, distance_source))
+
+    return issues, run_ids
+
+
+def check_food_day(data, date):
+    """检查一天的饮食文档，返回问题列表"""
+    if not isinstance(data, dict):
+        return [make_issue('not_object', "文档不是JSON对象")]
+
+    issues = []
+
+    if data.get('date', date) != date:
+        issues.append(make_issue('date_mismatch', f"文档日期 {data.get('date')} 与文件名不符"))
+
+    foods = data.get('foods')
+    if not isinstance(foods, list):
+        return issues + [make_issue('missing_list', "缺少食物条目列表")]
+
+    valid = []
+    for index, food in enumerate(foods):
+        if not isinstance(food, dict):
+            issues.append(make_issue('bad_entry', "食物条目不是JSON对象", index))
+            continue
+        try:
+            entry = FoodEntry.from_dict(food)
+        except Exception as e:
+            issues.append(make_issue('bad_entry', f"食物条目格式错误: {e}", index))
+            continue
+        if any(getattr(entry, name) < 0 for name in NUTRIENTS):
+            issues.append(make_issue('bad_value', "营养值为负数", index))
+        valid.append(entry)
+
+    stored = DayNutrition.from_dict(data.get('nutrition') if isinstance(data.get('nutrition'), dict)
+                                    else None)
+    expected = DayNutrition.from_entries(valid)
+    mismatched = [name for name in NUTRIENTS
+                  if abs(getattr(stored, name) - getattr(expected, name)) > 1e-6]
+    if mismatched:
+        issues.append(make_issue('nutrition_mismatch',
+                                 f"营养汇总与食物条目不一致: {', '.join(mismatched)}"))
+
+    return issues
+
+
+def check_run_journal(path, date, tracks_dir=None):
+    """检查跑步追加日志，返回 (问题列表, 记录数, 引用的跑步ID列表)"""
+    issues = []
+    runs = []
+    bad_lines = 0
+
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json_codec.loads(line)
+            except ValueError:
+                bad_lines += 1
+                continue
+            if isinstance(entry, dict) and isinstance(entry.get('run'), dict):
+                runs.append(entry['run'])
+
+    if bad_lines:
+        issues.append(make_issue('journal_bad_line', f"追加日志中有 {bad_lines} 行无法解析"))
+
+    run_issues, run_ids = check_run_day({'date': date, 'runs': runs}, date, tracks_dir)
+    # 日志中的行号与当天记录序号无关，不保留序号
+    for issue in run_issues:
+        issue.pop('index', None)
+    return issues + run_issues, len(runs), run_ids
+
+
+def parse_data_file(path):
+    """由文件名得到 (类型, 日期或月份)，不是数据文件时返回None"""
+    name = os.path.basename(path)
+    if name.startswith('runs_') and name.endswith('.jsonl'):
+        return 'journal', name[len('runs_'):-len('.jsonl')]
+    if name.startswith('runs_') and name.endswith('.json'):
+        return 'runs', name[len('runs_'):-len('.json')]
+    if name.startswith('foods_') and name.endswith('.json'):
+        return 'foods', name[len('foods_'):-len('.json')]
+    if name.endswith(ARCHIVE_SUFFIX):
+        return 'archive', name[:-len(ARCHIVE_SUFFIX)]
+    return None
+
+
+def verify_file(task):
+    """检查单个数据文件（进程池的工作函数）
+
+    task 为 (文件路径, 轨迹目录)；返回
+    {'path', 'kind', 'date', 'issues', 'records', 'run_ids'}，
+    每条问题带有所在文件路径和日期。
+    """
+    path, tracks_dir = task
+    kind, date = parse_data_file(path)
+    result = {'path': path, 'kind': kind, 'date': date,
+              'issues': [], 'records': 0, 'run_ids': []}
+
+    try:
+        if kind == 'journal':
+            issues, result['records'], result['run_ids'] = check_run_journal(path, date, tracks_dir)
+
+        elif kind == 'archive':
+            issues = []
+            archive = MonthArchive(path)
+            try:
+                documents = archive.documents()
+                for day, data in sorted(documents['runs'].items()):
+                    day_issues, run_ids = check_run_day(data, day, tracks_dir)
+                    result['records'] += len(data.get('runs', []))
+                    result['run_ids'].extend(run_ids)
+                    issues.extend(dict(issue, date=day) for issue in day_issues)
+                for day, data in sorted(documents['foods'].items()):
+                    result['records'] += len(data.get('foods', []))
+                    issues.extend(dict(issue, date=day) for issue in check_food_day(data, day))
+            finally:
+                archive.close()
+            # 归档只读，其中的问题只报告不修复
+            for issue in issues:
+                issue['repairable'] = issue['code'] == 'bad_track'
+
+        else:
+            try:
+                data = json_codec.load_file(path)
+            except ValueError as e:
+                data = None
+                issues = [make_issue('invalid_json', f"JSON无法解析: {e}")]
+
+            if data is not None and kind == 'runs':
+                issues, result['run_ids'] = check_run_day(data, date, tracks_dir)
+                result['records'] = len(data.get('runs') or []) if isinstance(data, dict) else 0
+            elif data is not None:
+                issues = check_food_day(data, date)
+                result['records'] = len(data.get('foods') or []) if isinstance(data, dict) else 0
+
+    except Exception as e:
+        issues = [make_issue('bad_archive' if kind == 'archive' else 'invalid_json',
+                             f"文件无法读取: {e}")]
+
+    for issue in issues:
+        issue.setdefault('path', path)
+        issue.setdefault('date', date)
+        issue['kind'] = kind
+    result['issues'] = issues
+    return result
+
+
+def repair_document(kind, data, date):
+    """按检查规则修复一天的文档，返回 (修复后的文档, 修复说明列表)
+
+    只处理可就地修复的问题：日期、缺失的列表、无法解析的条目（移除）、
+    缺少ID的跑步记录（分配ID）和营养汇总（按条目重新汇总）。
+    """
+    fixes = []
+    list_key = 'runs' if kind == 'runs' else 'foods'
+
+    if data.get('date') != date:
+        data['date'] = date
+        fixes.append("修正文档日期")
+
+    items = data.get(list_key)
+    if not isinstance(items, list):
+        items = []
+        fixes.append(f"重建空的 {list_key} 列表")
+
+    kept = []
+    for item in items:
+        try:
+            if kind == 'runs':
+                record = RunRecord.from_dict(item)
+                if not record.run_id:
+                    item = dict(item, run_id=uuid.uuid4().hex)
+                    fixes.append("为跑步记录分配ID")
+                if record.date != date:
+                    item = dict(item, date=date)
+                    fixes.append("修正跑步记录日期")
+            else:
+                FoodEntry.from_dict(item)
+            kept.append(item)
+        except Exception:
+            fixes.append(f"移除无法解析的 {list_key} 条目")
+    data[list_key] = kept
+
+    if kind == 'foods':
+        expected = DayNutrition.from_entries(kept).to_dict()
+        stored = data.get('nutrition') if isinstance(data.get('nutrition'), dict) else {}
+        if any(abs(stored.get(name, 0) - expected[name]) > 1e-6 for name in NUTRIENTS):
+            data['nutrition'] = expected
+            fixes.append("按食物条目重新汇总营养")
+
+    return data, fixes
+
+
+def summarize(report):
+    """按问题类型统计数量"""
+    counts = {}
+    for issue in report.get('issues', []):
+        counts[issue['code']] = counts.get(issue['code'], 0) + 1
+    return counts
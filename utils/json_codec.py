@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+JSON编解码
+优先使用已安装的 orjson / ujson，否则使用标准库json；
+默认输出紧凑格式，需要人工查看的文件可选缩进格式；
+datetime/date/time 统一按 isoformat() 编码，其他无法编码的类型抛出 TypeError
+
+运行 python tests/benchmarks.py json 比较各编解码器在含路线的每日文档上的速度
+"""
+
+import json
+from datetime import date, time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# 解析失败时各实现抛出的异常都是 ValueError 的子类
+DecodeError = ValueError
+
+
+def encode_default(obj):
+    """JSON不支持的类型：日期时间按 isoformat() 编码，其他类型抛出 TypeError"""
+    # datetime 是 date 的子类
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    raise TypeError(f"无法编码为JSON的类型: {type(obj).__name__}")
+
+
+class JSONCodec:
+    """JSON编解码器基类（标准库实现）"""
+
+    name = 'json'
+
+    def dumps(self, obj, pretty=False):
+        """编码为文本"""
+        if pretty:
+            return json.dumps(obj, ensure_ascii=False, indent=2, default=encode_default)
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'),
+                          default=encode_default)
+
+    def dumps_bytes(self, obj, pretty=False):
+        """编码为UTF-8字节"""
+        return self.dumps(obj, pretty).encode('utf-8')
+
+    def loads(self, data):
+        """解码文本或字节"""
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson实现（直接输出字节）
+
+    orjson 原生编码 datetime 和 dataclass，这里让它们也走 encode_default，
+    与其他实现的输出和报错保持一致
+    """
+
+    name = 'orjson'
+
+    def dumps_bytes(self, obj, pretty=False):
+        option = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME |
+                  orjson.OPT_PASSTHROUGH_DATACLASS)
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=encode_default, option=option)
+
+    def dumps(self, obj, pretty=False):
+        return self.dumps_bytes(obj, pretty).decode('utf-8')
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    """ujson实现"""
+
+    name = 'ujson'
+
+    def dumps(self, obj, pretty=False):
+        return ujson.dumps(obj, ensure_ascii=False, indent=2 if pretty else 0,
+                           default=encode_default)
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+def available_codecs():
+    """列出已安装的编解码器（按优先顺序）"""
+    codecs = []
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    if ujson is not None:
+        codecs.append(UjsonCodec())
+    codecs.append(JSONCodec())
+    return codecs
+
+
+def get_codec(name=None):
+    """获取编解码器，不指定名称时返回最快的可用实现"""
+    codecs = available_codecs()
+    if name is None:
+        return codecs[0]
+
+    for codec in codecs:
+        if codec.name == name:
+            return codec
+    raise ValueError(f"JSON编解码器不可用: {name}")
+
+
+_default = get_codec()
+
+
+def set_default_codec(name):
+    """切换默认编解码器（例如排查问题时强制使用标准库）"""
+    global _default
+    _default = get_codec(name)
+    return _default
+
+
+def codec_name():
+    """当前默认编解码器名称"""
+    return _default.name
+
+
+def dumps(obj, pretty=False):
+    """编码为文本（默认紧凑格式）"""
+    return _default.dumps(obj, pretty)
+
+
+def dumps_bytes(obj, pretty=False):
+    """编码为UTF-8字节（默认紧凑格式）"""
+    return _default.dumps_bytes(obj, pretty)
+
+
+def loads(data):
+    """解码文本或字节"""
+    return _default.loads(data)
+
+
+def load_file(path):
+    """读取并解码JSON文件"""
+    with open(path, 'rb') as f:
+        return _default.loads(f.read())
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+存储锁
+进程级文件锁（防止多个进程同时写同一数据目录）、根目录读写锁
+（整体操作与按天操作互斥）和按文档的细粒度锁
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+class DataDirLockedError(Exception):
+    """数据目录已被其他进程占用"""
+
+
+class ProcessFileLock:
+    """基于锁文件的进程间互斥锁（POSIX用flock，Windows用msvcrt.locking）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self, timeout=10.0, poll_interval=0.1):
+        """获取锁，超时未获取时抛出 DataDirLockedError"""
+        if self._fd is not None:
+            return
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.time() + timeout
+
+        while True:
+            try:
+                self._try_lock(fd)
+                self._fd = fd
+                return
+            except OSError:
+                if time.time() >= deadline:
+                    os.close(fd)
+                    raise DataDirLockedError(f"数据目录正被其他进程使用: {self.path}")
+                time.sleep(poll_interval)
+
+    def _try_lock(self, fd):
+        """非阻塞地尝试加锁，失败时抛出OSError"""
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        # 两者都不可用的平台上不做进程间互斥
+
+    def release(self):
+        """释放锁"""
+        if self._fd is None:
+            return
+
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class RootLock:
+    """数据根目录的读写锁
+
+    按天的读写持有共享锁，可以并行；备份、恢复、归档等整体操作持有
+    独占锁。两者都可重入，持有独占锁的线程也可以再获取共享锁，
+    但持有共享锁时不能再获取独占锁（会死锁）。
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = {}
+        self._writer = None
+        self._writer_depth = 0
+
+    @contextmanager
+    def shared(self):
+        """共享锁（按天操作）"""
+        me = threading.get_ident()
+        with self._condition:
+            while self._writer is not None and self._writer != me:
+                self._condition.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers[me] -= 1
+                if not self._readers[me]:
+                    del self._readers[me]
+                self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        """独占锁（整体操作，等待所有按天操作结束）"""
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                self._condition.notify_all()
+
+
+class KeyedLocks:
+    """按键（如 ('foods', 日期)）分配的可重入锁"""
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        """获取某个键对应的锁"""
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = threading.RLock()
+                self._locks[key] = lock
+            return lock
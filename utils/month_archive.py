@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+按月列式归档
+将已结束月份的每日数据打包为单个文件：数值字段按列存放（可直接mmap
+成数组视图做向量求和），完整的每日文档压缩后附在文件末尾，按需解压
+"""
+
+import os
+import sys
+import mmap
+import zlib
+import struct
+from array import array
+
+from utils import json_codec
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b'COL1'
+ARCHIVE_VERSION = 1
+ARCHIVE_SUFFIX = '.col'
+
+# 头部：魔数、版本、跑步记录数、饮食天数、文档区偏移、文档区长度
+HEADER = struct.Struct('<4sHxxIIQQ')
+
+# 每次跑步一行
+RUN_COLUMNS = (
+    ('run_day', 'i'),
+    ('run_distance', 'd'),
+    ('run_duration', 'd'),
+    ('run_calories', 'd'),
+)
+
+# 每天饮食一行
+FOOD_COLUMNS = (
+    ('food_day', 'i'),
+    ('food_count', 'i'),
+    ('food_calories', 'd'),
+    ('food_protein', 'd'),
+    ('food_carbs', 'd'),
+    ('food_fat', 'd'),
+)
+
+
+def _padded(size):
+    """按8字节对齐"""
+    return (size + 7) & ~7
+
+
+def _column_layout(run_count, food_count):
+    """计算各列的 (偏移, 类型, 行数)"""
+    layout = {}
+    offset = HEADER.size
+    for columns, rows in ((RUN_COLUMNS, run_count), (FOOD_COLUMNS, food_count)):
+        for name, typecode in columns:
+            layout[name] = (offset, typecode, rows)
+            offset += _padded(array(typecode).itemsize * rows)
+    return layout, offset
+
+
+def build_month_archive(month, run_days, food_days):
+    """将一个月的每日数据打包为归档字节
+
+    run_days: {日期: 当天跑步文档}，food_days: {日期: 当天饮食文档}
+    """
+    columns = {name: array(typecode) for name, typecode in RUN_COLUMNS + FOOD_COLUMNS}
+
+    for date in sorted(run_days):
+        for run in run_days[date].get('runs', []):
+            columns['run_day'].append(int(date[8:10]))
+            columns['run_distance'].append(float(run.get('distance', 0)))
+            columns['run_duration'].append(float(run.get('duration', 0)))
+            columns['run_calories'].append(float(run.get('calories', 0)))
+
+    for date in sorted(food_days):
+        data = food_days[date]
+        nutrition = data.get('nutrition') or {}
+        columns['food_day'].append(int(date[8:10]))
+        columns['food_count'].append(len(data.get('foods', [])))
+        columns['food_calories'].append(float(nutrition.get('calories', 0)))
+        columns['food_protein'].append(float(nutrition.get('protein', 0)))
+        columns['food_carbs'].append(float(nutrition.get('carbs', 0)))
+        columns['food_fat'].append(float(nutrition.get('fat', 0)))
+
+    run_count = len(columns['run_day'])
+    food_count = len(columns['food_day'])
+    layout, docs_offset = _column_layout(run_count, food_count)
+
+    documents = zlib.compress(json_codec.dumps_bytes(
+        {'month': month, 'runs': run_days, 'foods': food_days}
+    ), 6)
+
+    parts = [HEADER.pack(MAGIC, ARCHIVE_VERSION, run_count, food_count,
+                         docs_offset, len(documents))]
+    for name, _ in RUN_COLUMNS + FOOD_COLUMNS:
+        column = columns[name]
+        if sys.byteorder == 'big':
+            column.byteswap()
+        raw = column.tobytes()
+        parts.append(raw + b'\0' * (_padded(len(raw)) - len(raw)))
+    parts.append(documents)
+
+    return b''.join(parts)
+
+
+class MonthArchive:
+    """只读的月归档
+
+    数值列通过mmap直接映射为数组视图，不解析JSON；
+    每日完整文档在首次访问时解压一次。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.month = os.path.basename(path)[:-len(ARCHIVE_SUFFIX)]
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic, version, self.run_count, self.food_count, self._docs_offset, self._docs_length = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != ARCHIVE_VERSION:
+            self.close()
+            raise ValueError(f"不是有效的月归档: {path}")
+
+        self._layout, _ = _column_layout(self.run_count, self.food_count)
+        self._documents = None
+
+    def column(self, name):
+        """获取一列数据（小端平台上是零拷贝的内存视图）"""
+        offset, typecode, rows = self._layout[name]
+        size = array(typecode).itemsize * rows
+        view = memoryview(self._mmap)[offset:offset + size]
+
+        if sys.byteorder == 'big':
+            values = array(typecode)
+            values.frombytes(view)
+            values.byteswap()
+            return values
+        return view.cast(typecode)
+
+    def sum(self, name):
+        """对一列求和"""
+        if np is not None and sys.byteorder == 'little':
+            offset, typecode, rows = self._layout[name]
+            return np.frombuffer(self._mmap, dtype='<' + typecode, count=rows, offset=offset).sum().item()
+        return sum(self.column(name))
+
+    def documents(self):
+        """解压全部每日文档 {'runs': {日期: 文档}, 'foods': {日期: 文档}}"""
+        if self._documents is None:
+            raw = self._mmap[self._docs_offset:self._docs_offset + self._docs_length]
+            self._documents = json_codec.loads(zlib.decompress(raw))
+        return self._documents
+
+    def run_dates(self):
+        """有跑步记录的日期（只读日期列，不解压文档）"""
+        return sorted({f'{self.month}-{day:02d}' for day in self.column('run_day')})
+
+    def food_dates(self):
+        """有饮食记录的日期（只读日期列，不解压文档）"""
+        return [f'{self.month}-{day:02d}' for day in self.column('food_day')]
+
+    def get_day(self, data_type, date):
+        """获取某天的文档（不存在时返回None）"""
+        return self.documents()[data_type].get(date)
+
+    def close(self):
+        """关闭映射（替换或删除归档文件前必须先关闭）"""
+        try:
+            self._mmap.close()
+        finally:
+            self._file.close()
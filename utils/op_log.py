@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+快照 + 操作日志
+整份状态只在压缩时写成快照，两次快照之间的每次修改只向日志追加一行，
+单次保存的开销与历史长度无关
+"""
+
+import os
+
+from utils import json_codec
+
+# 累计多少行日志后压缩成快照
+COMPACT_THRESHOLD = 200
+
+# 快照文件格式：{'log_seq': 快照已包含的最大日志序号, 'state': 状态}
+SNAPSHOT_KEYS = {'log_seq', 'state'}
+
+
+class OpLog:
+    """快照 + 操作日志
+
+    append() 追加一行带序号的操作，累计 compact_threshold 行后把当前状态
+    写成快照并删除日志；load() 读取快照后重放序号更大的日志行。
+    快照写入后、删除日志前崩溃时，已包含在快照中的日志行按序号跳过。
+    不加锁：调用方保证同一时间只有一个线程修改状态。
+    """
+
+    def __init__(self, snapshot_path, writer, compact_threshold=COMPACT_THRESHOLD):
+        self.snapshot_path = snapshot_path
+        self.log_path = os.path.splitext(snapshot_path)[0] + '.jsonl'
+        self.writer = writer
+        self.compact_threshold = compact_threshold
+
+        self.seq = 0
+        self.count = 0
+
+    def load(self, apply, prepare=None):
+        """读取快照并重放日志，返回状态；快照不存在时返回None（由调用方重建）
+
+        apply(state, entry) 应用一行日志；prepare(state) 在重放前补全状态结构。
+        旧版快照就是状态本身（没有序号）。
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+
+        data = json_codec.load_file(self.snapshot_path)
+        if isinstance(data, dict) and set(data) == SNAPSHOT_KEYS:
+            seq, state = data['log_seq'], data['state']
+        else:
+            seq, state = 0, data
+        if prepare:
+            state = prepare(state)
+
+        count = 0
+        damaged = False
+        for entry in self.read_log():
+            if entry is None:
+                damaged = True
+                continue
+            count += 1
+            if entry.get('seq', 0) <= seq:
+                continue
+            apply(state, entry)
+            seq = entry['seq']
+
+        self.seq = seq
+        self.count = count
+
+        # 崩溃时写了一半的行后面不能再追加，立即压缩
+        if damaged:
+            self.compact(state)
+        return state
+
+    def read_log(self):
+        """逐行读取日志，损坏的行产出None"""
+        if not os.path.exists(self.log_path):
+            return
+
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json_codec.loads(line)
+                except ValueError:
+                    print(f"跳过损坏的日志行: {self.log_path}")
+                    yield None
+
+    def append(self, entry, state):
+        """追加一次操作（state 为应用该操作后的状态，达到阈值时写成快照）"""
+        self.seq += 1
+        self.writer.append_line(self.log_path, json_codec.dumps(dict(entry, seq=self.seq)))
+
+        self.count += 1
+        if self.count >= self.compact_threshold:
+            self.compact(state)
+
+    def compact(self, state):
+        """把当前状态写成快照并删除日志（全量重建后也用它保存）"""
+        self.writer.write_json(self.snapshot_path, {'log_seq': self.seq, 'state': state})
+        if os.path.exists(self.log_path):
+            self.writer.remove(self.log_path)
+        self.count = 0
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+实时配速估计
+按每次定位的真实时间和距离增量在线估计当前速度，每次更新 O(1)：
+'ema' 按时间常数做指数平滑（适应不均匀的定位间隔），
+'window' 取最近一段时间内的平均速度（环形缓冲区）
+"""
+
+import math
+from collections import deque
+from datetime import datetime
+
+from utils.track_metrics import STOP_SPEED
+
+MODES = ('ema', 'window')
+
+
+class PaceEstimator:
+    """流式速度/配速估计器
+
+    update(时间, 距离增量) 每收到一次定位调用一次；时间可以是
+    datetime 或秒。两次定位间隔超过 max_gap（暂停、信号中断）时
+    重新开始估计，不把间隔内的时间算进速度。界面按当前时间显示时用
+    speed_at()/pace_at()：定位停止到达后速度随等待时间下降。
+    """
+
+    def __init__(self, mode='ema', time_constant=8.0, window=10.0,
+                 max_samples=64, max_gap=30.0, stop_speed=STOP_SPEED):
+        if mode not in MODES:
+            raise ValueError(f"未知的配速估计方式: {mode}")
+
+        self.mode = mode
+        self.time_constant = time_constant
+        self.window = window
+        self.max_gap = max_gap
+        self.stop_speed = stop_speed
+
+        # 窗口模式的环形缓冲区：(时间, 累计距离)
+        self.samples = deque(maxlen=max_samples)
+        self.reset()
+
+    def reset(self):
+        """清空状态（开始、恢复跑步或切换数据源时调用）"""
+        self.speed = 0.0
+        self.last_time = None
+        self.interval = 0.0
+        self.total_distance = 0.0
+        self.has_speed = False
+        self.samples.clear()
+
+    def update(self, timestamp, distance):
+        """加入一次定位（distance 为与上一次定位之间的距离，米），返回当前速度（米/秒）"""
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+
+        if self.last_time is None:
+            self.start(timestamp)
+            return self.speed
+
+        dt = timestamp - self.last_time
+        if dt <= 0:
+            # 同一时刻的重复定位或时钟回拨：距离计入，时间不变
+            self.total_distance += max(distance, 0.0)
+            if self.samples:
+                self.samples[-1] = (self.samples[-1][0], self.total_distance)
+            return self.speed
+        if dt > self.max_gap:
+            self.reset()
+            self.start(timestamp)
+            return self.speed
+
+        self.last_time = timestamp
+        self.interval = dt
+        self.total_distance += max(distance, 0.0)
+
+        if self.mode == 'ema':
+            instant = max(distance, 0.0) / dt
+            if not self.has_speed:
+                self.speed = instant
+                self.has_speed = True
+            else:
+                # 按实际间隔换算平滑系数，间隔越长新样本权重越大
+                alpha = 1.0 - math.exp(-dt / self.time_constant)
+                self.speed += alpha * (instant - self.speed)
+        else:
+            self.samples.append((timestamp, self.total_distance))
+            # 保留覆盖窗口所需的最早样本
+            while len(self.samples) > 2 and timestamp - self.samples[1][0] >= self.window:
+                self.samples.popleft()
+            first_time, first_distance = self.samples[0]
+            self.speed = (self.total_distance - first_distance) / (timestamp - first_time)
+            self.has_speed = True
+
+        return self.speed
+
+    def start(self, timestamp):
+        """以一次定位作为新的起点"""
+        self.last_time = timestamp
+        if self.mode == 'window':
+            self.samples.append((timestamp, self.total_distance))
+
+    def speed_at(self, now):
+        """按当前时间估计速度（米/秒）
+
+        超过上一次定位间隔（至少1秒）仍没有新定位时，把等待的时间按没有移动
+        计入，速度随之下降；超过 max_gap 没有定位时为0。
+        """
+        if isinstance(now, datetime):
+            now = now.timestamp()
+        if not self.has_speed or self.last_time is None:
+            return 0.0
+
+        elapsed = now - self.last_time
+        if elapsed > self.max_gap:
+            return 0.0
+        extra = elapsed - max(self.interval, 1.0)
+        if extra <= 0:
+            return self.speed
+
+        if self.mode == 'ema':
+            return self.speed * math.exp(-extra / self.time_constant)
+
+        # 窗口移到当前时间：从窗口起点之前最近的样本算起
+        start_time, start_distance = self.samples[0]
+        for sample_time, sample_distance in self.samples:
+            if sample_time > now - self.window:
+                break
+            start_time, start_distance = sample_time, sample_distance
+        return (self.total_distance - start_distance) / (now - start_time)
+
+    def pace_at(self, now):
+        """按当前时间估计配速（分钟/公里），停止或尚无估计时为0"""
+        return self.speed_to_pace(self.speed_at(now))
+
+    def speed_to_pace(self, speed):
+        """速度（米/秒）换算为配速，低于停止速度时为0"""
+        if not self.has_speed or speed < self.stop_speed:
+            return 0.0
+        return 1000.0 / 60.0 / speed
+
+    @property
+    def speed_kmh(self):
+        """当前速度（公里/小时）"""
+        return self.speed * 3.6
+
+    @property
+    def pace(self):
+        """最近一次定位时的配速（分钟/公里），停止或尚无估计时为0"""
+        return self.speed_to_pace(self.speed)
@@ -4,6 +4,7 @@
 监控应用性能并提供优化建议
 """
 
+import os
 import time
 import psutil
 import threading
@@ -13,7 +14,8 @@ from kivy.clock import Clock
 class PerformanceMonitor:
     """性能监控器"""
     
-    def __init__(self):
+    def __init__(self, log_dir='HealthApp_Python/logs'):
+        self.log_dir = log_dir
         self.is_monitoring = False
         self.stats = {
             'cpu_usage': [],
@@ -230,7 +232,8 @@ class PerformanceMonitor:
     def export_performance_report(self):
         """导出性能报告"""
         try:
-            report_path = 'HealthApp_Python/logs/performance_report.txt'
+            os.makedirs(self.log_dir, exist_ok=True)
+            report_path = os.path.join(self.log_dir, 'performance_report.txt')
             
             with open(report_path, 'w', encoding='utf-8') as f:
                 f.write(f"健康追踪应用 - 性能报告\n")
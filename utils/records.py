@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+记录数据模型
+跑步记录、食物条目和每日营养汇总的 __slots__ 类型，
+统一默认值、数值类型和格式版本，与存储用的字典互相转换
+"""
+
+# 当前记录格式版本
+SCHEMA_VERSION = 1
+
+# 营养字段
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fat')
+
+
+def _to_float(value, default=0.0):
+    """转换为浮点数（旧数据中可能是字符串或None）"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class Record:
+    """记录基类
+
+    FIELDS 为 (字段名, 默认值, 类型转换) 列表；默认值为None的字段
+    在 to_dict() 中省略。未知字段保存在 extra 中原样往返，
+    旧版本数据在 from_dict() 中按 MIGRATIONS 逐版本升级。
+    """
+
+    __slots__ = ('schema_version', 'extra')
+
+    FIELDS = ()
+
+    # {旧版本: 升级函数(dict) -> dict}
+    MIGRATIONS = {}
+
+    def __init__(self, **values):
+        self.schema_version = SCHEMA_VERSION
+        self.extra = None
+
+        for name, default, convert in self.FIELDS:
+            value = values.pop(name, default)
+            if value is not None and convert is not None:
+                value = convert(value)
+            setattr(self, name, value)
+
+        if values:
+            self.extra = values
+
+    @classmethod
+    def migrate(cls, data):
+        """将旧版本的字典升级到当前版本"""
+        version = data.get('schema_version', 0)
+        while version < SCHEMA_VERSION:
+            upgrade = cls.MIGRATIONS.get(version)
+            if upgrade:
+                data = upgrade(dict(data))
+            version += 1
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """从字典创建记录"""
+        data = cls.migrate(data)
+        values = {key: value for key, value in data.items() if key != 'schema_version'}
+        return cls(**values)
+
+    @classmethod
+    def coerce(cls, value):
+        """接受记录对象或字典，返回记录对象"""
+        if isinstance(value, cls):
+            return value
+        return cls.from_dict(value)
+
+    def to_dict(self):
+        """转换为可序列化的字典"""
+        data = {}
+        for name, _, _ in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        if self.extra:
+            data.update(self.extra)
+        data['schema_version'] = self.schema_version
+        return data
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name, _, _ in self.FIELDS
+                           if getattr(self, name) is not None)
+        return f'{type(self).__name__}({fields})'
+
+
+class RunRecord(Record):
+    """跑步记录"""
+
+    FIELDS = (
+        ('run_id', None, str),
+        ('date', '', str),
+        ('start_time', None, str),
+        ('duration', 0.0, _to_float),
+        ('distance', 0.0, _to_float),
+        ('distance_source', None, str),
+        ('average_pace', 0.0, _to_float),
+        ('calories', 0.0, _to_float),
+        ('route', None, list),
+        ('track_format', None, str),
+        ('track_points', None, int),
+        ('track_tolerance', None, _to_float),
+        ('moving_time', None, _to_float),
+        ('max_speed', None, _to_float),
+        ('elevation_gain', None, _to_float),
+        ('elevation_loss', None, _to_float),
+        ('splits', None, list),
+    )
+
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+
+    MIGRATIONS = {
+        # 版本0：早期记录用 pace 表示平均配速
+        0: lambda data: {('average_pace' if key == 'pace' else key): value
+                         for key, value in data.items()},
+    }
+
+
+class FoodEntry(Record):
+    """食物条目（营养值为按份量换算后的实际摄入量）"""
+
+    FIELDS = (
+        ('name', '', str),
+        ('brand', '', str),
+        ('serving_size', 100.0, _to_float),
+        ('servings', 1.0, _to_float),
+        ('calories', 0.0, _to_float),
+        ('protein', 0.0, _to_float),
+        ('carbs', 0.0, _to_float),
+        ('fat', 0.0, _to_float),
+        ('meal_type', '加餐', str),
+        ('date', None, str),
+        ('timestamp', None, str),
+    )
+
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+
+
+class DayNutrition:
+    """每日营养汇总"""
+
+    __slots__ = NUTRIENTS
+
+    def __init__(self, calories=0.0, protein=0.0, carbs=0.0, fat=0.0):
+        self.calories = _to_float(calories)
+        self.protein = _to_float(protein)
+        self.carbs = _to_float(carbs)
+        self.fat = _to_float(fat)
+
+    @classmethod
+    def from_dict(cls, data):
+        """从字典创建（缺少的营养字段按0处理）"""
+        data = data or {}
+        return cls(**{name: data.get(name, 0) for name in NUTRIENTS})
+
+    @classmethod
+    def from_entries(cls, entries):
+        """按食物条目重新汇总"""
+        totals = cls()
+        for entry in entries:
+            totals.add(entry)
+        return totals
+
+    def add(self, entry, sign=1):
+        """累加一个食物条目（字典或FoodEntry，sign=-1 表示扣除）"""
+        if isinstance(entry, dict):
+            entry = FoodEntry.from_dict(entry)
+        self.calories += sign * entry.calories
+        self.protein += sign * entry.protein
+        self.carbs += sign * entry.carbs
+        self.fat += sign * entry.fat
+
+    def to_dict(self):
+        """转换为字典"""
+        return {name: getattr(self, name) for name in NUTRIENTS}
+
+    def __repr__(self):
+        return (f'DayNutrition(calories={self.calories:.1f}, protein={self.protein:.1f}, '
+                f'carbs={self.carbs:.1f}, fat={self.fat:.1f})')
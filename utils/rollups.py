@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+趋势汇总表
+按日/周/月汇总跑步和饮食指标，供趋势查询使用
+"""
+
+from datetime import datetime, timedelta
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# 跑步指标与记录字段的对应关系
+RUN_METRICS = {
+    'run_count': None,
+    'run_distance': 'distance',
+    'run_duration': 'duration',
+    'run_calories': 'calories'
+}
+
+# 饮食指标与营养字段的对应关系
+FOOD_METRICS = {
+    'food_calories': 'calories',
+    'food_protein': 'protein',
+    'food_carbs': 'carbs',
+    'food_fat': 'fat'
+}
+
+METRICS = tuple(RUN_METRICS) + tuple(FOOD_METRICS)
+
+
+def empty_rollups():
+    """空的汇总表 {粒度: {周期: {指标: 值}}}"""
+    return {granularity: {} for granularity in GRANULARITIES}
+
+
+def period_key(date, granularity):
+    """日期所在周期的键：日 2024-01-31，周 2024-W05（ISO周），月 2024-01"""
+    if granularity == 'day':
+        return date
+    if granularity == 'month':
+        return date[:7]
+    if granularity == 'week':
+        year, week, _ = datetime.strptime(date, '%Y-%m-%d').isocalendar()
+        return f'{year:04d}-W{week:02d}'
+    raise ValueError(f"未知的汇总粒度: {granularity}")
+
+
+def iter_periods(start_date, end_date, granularity):
+    """按顺序产出覆盖日期范围的所有周期键"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"未知的汇总粒度: {granularity}")
+
+    current = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+
+    if granularity == 'week':
+        current -= timedelta(days=current.weekday())
+    elif granularity == 'month':
+        current = current.replace(day=1)
+
+    while current <= end:
+        yield period_key(current.strftime('%Y-%m-%d'), granularity)
+
+        if granularity == 'day':
+            current += timedelta(days=1)
+        elif granularity == 'week':
+            current += timedelta(days=7)
+        elif current.month == 12:
+            current = current.replace(year=current.year + 1, month=1)
+        else:
+            current = current.replace(month=current.month + 1)
+
+
+def add_to_rollups(rollups, date, deltas):
+    """将一天的指标增量累加到各粒度的汇总中（归零的指标和周期会被移除）"""
+    for granularity in GRANULARITIES:
+        key = period_key(date, granularity)
+        bucket = rollups[granularity].get(key, {})
+
+        for metric, delta in deltas.items():
+            if not delta:
+                continue
+            value = bucket.get(metric, 0) + delta
+            if abs(value) < 1e-9:
+                bucket.pop(metric, None)
+            else:
+                bucket[metric] = value
+
+        if bucket:
+            rollups[granularity][key] = bucket
+        else:
+            rollups[granularity].pop(key, None)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+路线简化
+Ramer–Douglas–Peucker 批量简化（保存轨迹时的有损模式）与流式简化
+（地图显示时随定位逐点进行，容差按屏幕缩放比例换算成像素）。
+两者都保证每个原始点到简化后折线的距离不超过容差。
+"""
+
+import math
+from array import array
+
+from utils.track_metrics import EARTH_RADIUS
+
+# 地图显示的默认容差（像素）
+DISPLAY_TOLERANCE = 1.5
+
+# 流式简化中一段待定点数的上限，限制每次定位的计算量
+MAX_PENDING = 64
+
+
+def segment_distance(px, py, ax, ay, bx, by):
+    """点 P 到线段 AB 的距离（平面坐标）"""
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+
+    t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+    t = min(max(t, 0.0), 1.0)
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify_indices(xs, ys, tolerance):
+    """RDP 简化，返回保留点的下标列表（升序，首尾两点总是保留）
+
+    使用显式栈而非递归，长轨迹不会超出递归深度。
+    """
+    count = len(xs)
+    if count <= 2 or tolerance <= 0:
+        return list(range(count))
+
+    keep = bytearray(count)
+    keep[0] = keep[count - 1] = 1
+    stack = [(0, count - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        ax, ay, bx, by = xs[first], ys[first], xs[last], ys[last]
+
+        max_distance = tolerance
+        index = -1
+        for i in range(first + 1, last):
+            distance = segment_distance(xs[i], ys[i], ax, ay, bx, by)
+            if distance > max_distance:
+                max_distance = distance
+                index = i
+
+        if index >= 0:
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [i for i in range(count) if keep[i]]
+
+
+def simplify_route(route, tolerance):
+    """按误差上限（米）简化路线点列表，返回新的列表
+
+    只简化连续的GPS点：以第一个GPS点为原点换算为平面坐标（米）后做RDP；
+    步数点没有坐标，全部保留，并把GPS点分成互不相连的几段分别简化。
+    保留的点原样返回（累计距离等字段不变）。
+    """
+    if not route or not tolerance or tolerance <= 0:
+        return list(route or [])
+
+    origin = next((point for point in route
+                   if point.get('source') != 'pedometer' and point.get('lat') is not None), None)
+    if origin is None:
+        return list(route)
+
+    scale = math.pi / 180 * EARTH_RADIUS
+    cos_lat0 = math.cos(math.radians(origin['lat']))
+
+    simplified = []
+    segment = []
+
+    def flush():
+        xs = array('d', ((point['lon'] - origin['lon']) * scale * cos_lat0 for point in segment))
+        ys = array('d', ((point['lat'] - origin['lat']) * scale for point in segment))
+        simplified.extend(segment[i] for i in simplify_indices(xs, ys, tolerance))
+        segment.clear()
+
+    for point in route:
+        if point.get('source') == 'pedometer' or point.get('lat') is None or point.get('lon') is None:
+            flush()
+            simplified.append(point)
+        else:
+            segment.append(point)
+    flush()
+
+    return simplified
+
+
+class StreamSimplifier:
+    """流式路线简化
+
+    每加入一个点，检查上一个保留点（锚点）之后的待定点是否都在
+    锚点到新点连线的容差范围内：是则只移动折线末端，否则把当前末端
+    固定为新的锚点。vertices 为扁平的 [x, y, ...]，最后一对是可移动的末端。
+    """
+
+    def __init__(self, tolerance, max_pending=MAX_PENDING):
+        self.tolerance = tolerance
+        self.max_pending = max_pending
+        self.reset()
+
+    def reset(self):
+        self.vertices = array('f')
+        self.pending = array('f')
+        self.anchor = None
+
+    @property
+    def vertex_count(self):
+        """简化后的点数"""
+        return len(self.vertices) // 2
+
+    def add(self, x, y):
+        """加入一个点，返回 True 表示折线增加了一个点，False 表示只是末端移动到该点"""
+        if self.anchor is None:
+            self.anchor = (x, y)
+            self.vertices.extend((x, y))
+            return True
+
+        if not self.pending:
+            self.pending.extend((x, y))
+            self.vertices.extend((x, y))
+            return True
+
+        if len(self.pending) < 2 * self.max_pending and self.covers(x, y):
+            # 所有待定点仍在容差内：末端移动到新点
+            self.pending.extend((x, y))
+            self.vertices[-2] = x
+            self.vertices[-1] = y
+            return False
+
+        # 当前末端固定为锚点，新点成为新的末端
+        self.anchor = (self.vertices[-2], self.vertices[-1])
+        self.pending = array('f', (x, y))
+        self.vertices.extend((x, y))
+        return True
+
+    def covers(self, x, y):
+        """锚点到 (x, y) 的线段是否覆盖所有待定点"""
+        ax, ay = self.anchor
+        pending = self.pending
+        tolerance = self.tolerance
+        for i in range(0, len(pending), 2):
+            if segment_distance(pending[i], pending[i + 1], ax, ay, x, y) > tolerance:
+                return False
+        return True
+
+    def extend(self, points):
+        """依次加入扁平的 [x, y, ...] 点序列"""
+        for i in range(0, len(points) - 1, 2):
+            self.add(points[i], points[i + 1])
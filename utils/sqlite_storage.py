@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite存储后端
+以单个数据库文件替代按天拆分的JSON文件，支持按日期范围的索引查询
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from utils import json_codec
+
+# 记录类型
+RECORD_RUN = 'run'
+RECORD_FOOD_DAY = 'food_day'
+
+
+class MigrationError(Exception):
+    """JSON数据迁移到SQLite失败"""
+
+
+class SQLiteStorage:
+    """SQLite存储后端（WAL模式，按记录类型和日期建立索引）"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        # SQLite同一时间只允许一个写事务，进程内先排队，避免多线程忙等重试
+        self._write_lock = threading.Lock()
+
+        # 连接代数：数据库文件被替换时加一，各线程发现代数变化后重新连接
+        self._generation = 0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.init_schema()
+
+    def get_connection(self):
+        """获取当前线程的数据库连接（连接已被 close_all 作废时重新连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.generation != self._generation:
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.generation = self._generation
+        return conn
+
+    def init_schema(self):
+        """初始化数据表和索引"""
+        conn = self.get_connection()
+        with self._write_lock, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS records ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' record_type TEXT NOT NULL,'
+                ' date TEXT NOT NULL,'
+                ' body TEXT NOT NULL,'
+                ' record_key TEXT)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_records_type_date '
+                'ON records (record_type, date)'
+            )
+
+            # 旧数据库没有记录键列，补上并从记录内容回填跑步ID
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(records)')]
+            if 'record_key' not in columns:
+                conn.execute('ALTER TABLE records ADD COLUMN record_key TEXT')
+                rows = conn.execute(
+                    'SELECT id, body FROM records WHERE record_type = ?', (RECORD_RUN,)
+                ).fetchall()
+                for record_id, body in rows:
+                    conn.execute('UPDATE records SET record_key = ? WHERE id = ?',
+                                 (json_codec.loads(body).get('run_id'), record_id))
+
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_records_type_key '
+                'ON records (record_type, record_key)'
+            )
+
+    def close(self):
+        """关闭当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def close_all(self):
+        """作废所有线程的连接（替换或删除数据库文件前调用）
+
+        连接只能在创建它的线程中关闭：当前线程的连接立即关闭，
+        其他线程的连接在下次使用时关闭并重新打开数据库文件。
+        """
+        with self._write_lock:
+            self._generation += 1
+        self.close()
+
+    def checkpoint(self):
+        """将WAL中的内容合并回主数据库文件（备份前调用）"""
+        self.get_connection().execute('PRAGMA wal_checkpoint(FULL)')
+
+    def save_run_record(self, run_record):
+        """保存跑步记录（每次跑步一行）"""
+        conn = self.get_connection()
+        with self._write_lock, conn:
+            conn.execute(
+                'INSERT INTO records (record_type, date, body, record_key) VALUES (?, ?, ?, ?)',
+                (RECORD_RUN, run_record['date'],
+                 json_codec.dumps(run_record), run_record.get('run_id'))
+            )
+        return True
+
+    def get_run(self, run_id):
+        """按跑步ID获取跑步记录（索引查找），不存在时返回None"""
+        row = self.get_connection().execute(
+            'SELECT body FROM records WHERE record_type = ? AND record_key = ?',
+            (RECORD_RUN, run_id)
+        ).fetchone()
+        return json_codec.loads(row[0]) if row else None
+
+    def delete_run(self, run_id):
+        """按跑步ID删除跑步记录，返回被删除的记录（不存在时返回None）"""
+        conn = self.get_connection()
+        with self._write_lock, conn:
+            row = conn.execute(
+                'SELECT id, body FROM records WHERE record_type = ? AND record_key = ?',
+                (RECORD_RUN, run_id)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM records WHERE id = ?', (row[0],))
+        return json_codec.loads(row[1])
+
+    def update_run(self, run_id, run_record):
+        """按跑步ID替换跑步记录（保留原行，日期可以改变），返回是否找到该记录"""
+        conn = self.get_connection()
+        with self._write_lock, conn:
+            cursor = conn.execute(
+                'UPDATE records SET date = ?, body = ? WHERE record_type = ? AND record_key = ?',
+                (run_record['date'], json_codec.dumps(run_record), RECORD_RUN, run_id)
+            )
+        return cursor.rowcount > 0
+
+    def load_daily_run_data(self, date):
+        """加载指定日期的跑步数据"""
+        rows = self.get_connection().execute(
+            'SELECT body FROM records WHERE record_type = ? AND date = ? ORDER BY id',
+            (RECORD_RUN, date)
+        ).fetchall()
+        return {'date': date, 'runs': [json_codec.loads(row[0]) for row in rows]}
+
+    def delete_run_record(self, date, run_index):
+        """按当天序号删除跑步记录，返回被删除的记录（不存在时返回None）"""
+        conn = self.get_connection()
+        rows = conn.execute(
+            'SELECT id, body FROM records WHERE record_type = ? AND date = ? ORDER BY id',
+            (RECORD_RUN, date)
+        ).fetchall()
+
+        if not 0 <= run_index < len(rows):
+            return None
+
+        record_id, body = rows[run_index]
+        with self._write_lock, conn:
+            conn.execute('DELETE FROM records WHERE id = ?', (record_id,))
+        return json_codec.loads(body)
+
+    def save_daily_food_data(self, date, food_data):
+        """保存指定日期的食物数据（每天一行）"""
+        conn = self.get_connection()
+        body = json_codec.dumps(food_data)
+        with self._write_lock, conn:
+            conn.execute(
+                'DELETE FROM records WHERE record_type = ? AND date = ?',
+                (RECORD_FOOD_DAY, date)
+            )
+            conn.execute(
+                'INSERT INTO records (record_type, date, body) VALUES (?, ?, ?)',
+                (RECORD_FOOD_DAY, date, body)
+            )
+        return True
+
+    def load_daily_food_data(self, date):
+        """加载指定日期的食物数据，不存在时返回None"""
+        row = self.get_connection().execute(
+            'SELECT body FROM records WHERE record_type = ? AND date = ?',
+            (RECORD_FOOD_DAY, date)
+        ).fetchone()
+        return json_codec.loads(row[0]) if row else None
+
+    def get_date_range_data(self, start_date, end_date, data_type='both'):
+        """获取日期范围内的数据（单次索引范围查询）"""
+        results = {'runs': [], 'foods': []}
+        conn = self.get_connection()
+
+        if data_type in ['both', 'runs']:
+            rows = conn.execute(
+                'SELECT body FROM records WHERE record_type = ? '
+                'AND date BETWEEN ? AND ? ORDER BY date, id',
+                (RECORD_RUN, start_date, end_date)
+            )
+            results['runs'] = [json_codec.loads(row[0]) for row in rows]
+
+        if data_type in ['both', 'foods']:
+            rows = conn.execute(
+                'SELECT body FROM records WHERE record_type = ? '
+                'AND date BETWEEN ? AND ? ORDER BY date',
+                (RECORD_FOOD_DAY, start_date, end_date)
+            )
+            for row in rows:
+                results['foods'].extend(json_codec.loads(row[0]).get('foods', []))
+
+        return results
+
+    def iter_records(self, record_type):
+        """按日期顺序遍历某类记录"""
+        rows = self.get_connection().execute(
+            'SELECT date, body FROM records WHERE record_type = ? ORDER BY date, id',
+            (record_type,)
+        )
+        for date, body in rows:
+            yield date, json_codec.loads(body)
+
+    def list_dates(self, record_type):
+        """列出某类记录存在的所有日期"""
+        rows = self.get_connection().execute(
+            'SELECT DISTINCT date FROM records WHERE record_type = ? ORDER BY date',
+            (record_type,)
+        )
+        return [row[0] for row in rows]
+
+    def integrity_check(self):
+        """SQLite自带的完整性检查，返回问题描述列表（没有问题时为空）"""
+        rows = self.get_connection().execute('PRAGMA integrity_check').fetchall()
+        return [row[0] for row in rows if row[0] != 'ok']
+
+    def clear(self):
+        """清除所有记录"""
+        conn = self.get_connection()
+        with self._write_lock, conn:
+            conn.execute('DELETE FROM records')
+
+
+def migrate_json_tree(runs_dir, foods_dir, sqlite_storage):
+    """一次性将按天拆分的JSON目录迁移到SQLite
+
+    只读取每日文件：追加日志和月归档需要先由 StorageManager 整理回每日文件。
+    跑步ID功能之前保存的旧记录在迁移时分配ID，迁移后可以按ID查找。
+    每个文件在各自的保存点内写入：读取或写入失败的文件整体回滚并记入
+    failed_files，不会留下半天的记录。
+    """
+    migrated = {'runs': 0, 'food_days': 0, 'failed_files': []}
+    conn = sqlite_storage.get_connection()
+
+    with conn:
+        for filename in sorted(os.listdir(runs_dir)):
+            if not (filename.startswith('runs_') and filename.endswith('.json')):
+                continue
+            conn.execute('SAVEPOINT migrate_file')
+            try:
+                data = json_codec.load_file(os.path.join(runs_dir, filename))
+                date = data.get('date') or filename[len('runs_'):-len('.json')]
+                runs = data.get('runs', [])
+                for run in runs:
+                    if not run.get('run_id'):
+                        run = dict(run, run_id=uuid.uuid4().hex)
+                    conn.execute(
+                        'INSERT INTO records (record_type, date, body, record_key) '
+                        'VALUES (?, ?, ?, ?)',
+                        (RECORD_RUN, run.get('date', date), json_codec.dumps(run),
+                         run.get('run_id'))
+                    )
+                conn.execute('RELEASE migrate_file')
+                migrated['runs'] += len(runs)
+            except Exception as e:
+                conn.execute('ROLLBACK TO migrate_file')
+                conn.execute('RELEASE migrate_file')
+                print(f"迁移跑步文件失败 {filename}: {e}")
+                migrated['failed_files'].append(filename)
+
+        for filename in sorted(os.listdir(foods_dir)):
+            if not (filename.startswith('foods_') and filename.endswith('.json')):
+                continue
+            conn.execute('SAVEPOINT migrate_file')
+            try:
+                data = json_codec.load_file(os.path.join(foods_dir, filename))
+                date = data.get('date') or filename[len('foods_'):-len('.json')]
+                conn.execute(
+                    'DELETE FROM records WHERE record_type = ? AND date = ?',
+                    (RECORD_FOOD_DAY, date)
+                )
+                conn.execute(
+                    'INSERT INTO records (record_type, date, body) VALUES (?, ?, ?)',
+                    (RECORD_FOOD_DAY, date, json_codec.dumps(data))
+                )
+                conn.execute('RELEASE migrate_file')
+                migrated['food_days'] += 1
+            except Exception as e:
+                conn.execute('ROLLBACK TO migrate_file')
+                conn.execute('RELEASE migrate_file')
+                print(f"迁移食物文件失败 {filename}: {e}")
+                migrated['failed_files'].append(filename)
+
+    migrated['migrated_at'] = datetime.now().isoformat()
+    return migrated
@@ -5,25 +5,432 @@
 """
 
 import os
-import json
+import time
+import copy
+import shutil
+import uuid
+import functools
+import threading
+from contextlib import contextmanager, ExitStack
+from array import array
 from datetime import datetime, timedelta
+from utils.atomic_writer import AtomicWriter
+from utils.day_cache import DayDocumentCache
+from utils.backup_manager import BackupManager
+from utils import integrity
+from utils.write_behind import WriteBehindQueue
+from utils.op_log import OpLog
+from utils import json_codec
+from utils.locks import ProcessFileLock, RootLock, KeyedLocks
+from utils.records import RunRecord, FoodEntry, DayNutrition, NUTRIENTS
+from utils.track_codec import TRACK_FORMAT, pack_route, unpack_route, get_run_route
+from utils.track_metrics import analyze_route, run_summary
+from utils.route_simplify import simplify_route
+from utils.month_archive import MonthArchive, ARCHIVE_SUFFIX, build_month_archive
+from utils.rollups import (RUN_METRICS, FOOD_METRICS, METRICS, GRANULARITIES,
+                           empty_rollups, iter_periods, add_to_rollups)
+
+# 按数据根目录共享的锁、缓存和派生状态（同一进程内同一根目录的实例共用）
+_roots = {}
+_roots_lock = threading.Lock()
+
+
+def get_root_state(data_dir, cache_size=64, lock_timeout=10.0):
+    """获取数据根目录共享的锁、缓存和派生状态，首次使用时获取进程级文件锁
+    
+    锁文件放在数据目录旁边（<data_dir>.lock），清除或恢复整个数据目录时不受影响。
+    累计统计、趋势汇总、各项索引、月归档和延迟写入队列也放在这里：
+    它们整份写回文件，各实例各持一份会互相覆盖对方的更新。
+    """
+    key = os.path.normcase(os.path.abspath(data_dir))
+    with _roots_lock:
+        state = _roots.get(key)
+        if state is None:
+            file_lock = ProcessFileLock(key + '.lock')
+            file_lock.acquire(timeout=lock_timeout)
+            try:
+                # 首次打开时没有进行中的备份，遗留的快照目录可以直接删除
+                BackupManager(data_dir).remove_stale_snapshots()
+            except Exception:
+                file_lock.release()
+                raise
+            state = {
+                'file_lock': file_lock,
+                'root_lock': RootLock(),
+                'document_locks': KeyedLocks(),
+                'state_lock': threading.RLock(),
+                'cache': DayDocumentCache(max_entries=cache_size),
+                'users': 0,
+                'statistics': None,
+                'rollups': None,
+                'calendar_index': None,
+                'run_index': None,
+                'rollups_log': None,
+                'run_index_log': None,
+                'archives': {},
+                'archived_months': None,
+                'journal_counts': {},
+                'journal_seqs': {},
+                'write_queue': None,
+                'sqlite': None
+            }
+            _roots[key] = state
+        state['users'] += 1
+        return state
+
+
+def release_root_state(data_dir):
+    """某个实例不再使用数据根目录
+    
+    最后一个实例释放时停止延迟写入线程、关闭数据库连接和月归档，
+    最后放开进程级文件锁。
+    """
+    key = os.path.normcase(os.path.abspath(data_dir))
+    with _roots_lock:
+        state = _roots.get(key)
+        if state is None:
+            return
+        state['users'] -= 1
+        if state['users'] > 0:
+            return
+        del _roots[key]
+    
+    try:
+        if state['write_queue']:
+            state['write_queue'].stop()
+        if state['sqlite']:
+            state['sqlite'].close_all()
+        for archive in state['archives'].values():
+            archive.close()
+        state['archives'] = {}
+    finally:
+        state['file_lock'].release()
+
+
+class SharedState:
+    """存放在根目录共享状态中的属性（同一根目录的实例读写同一份数据）"""
+    
+    def __set_name__(self, owner, name):
+        self.name = name
+    
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return instance.shared[self.name]
+    
+    def __set__(self, instance, value):
+        instance.shared[self.name] = value
+
+
+def day_locked(data_type, writable=False):
+    """在某天文档的锁内执行（方法的第一个参数是日期）
+    
+    不同日期的操作可以并行，同一日期的读-改-写互相串行。
+    writable 为 True 时先展开所在月份的归档（见 document_lock）。
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, date, *args, **kwargs):
+            with self.document_lock(data_type, date, writable=writable):
+                return method(self, date, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def state_locked(method):
+    """在共享状态锁内执行（累计统计、趋势汇总、日历索引、月归档）"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.state_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def exclusive(method):
+    """独占整个数据根目录执行（等待进行中的按天操作结束）"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.root_lock.exclusive():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class StorageManager:
-    """数据存储管理器"""
+    """数据存储管理器
+    
+    data_dir 为数据根目录；不同根目录的实例互相独立，可在同一进程中
+    并发使用（例如多个用户档案），同一根目录的实例共用锁、缓存和
+    派生状态（累计统计、汇总、索引、月归档、延迟写入队列）。
     
-    def __init__(self):
+    加锁层次：整体操作（备份、恢复、归档、清除）独占根目录；按天的
+    读-改-写持有根目录共享锁和当天文档锁；累计统计等共享状态的更新
+    在状态锁内进行。另有进程级文件锁防止其他进程同时使用该目录：
+    其他进程占用时最多等待 lock_timeout 秒，然后抛出 DataDirLockedError
+    （界面线程中打开时用0，不等待）。
+    """
+    
+    # 同一根目录的实例共用的派生状态
+    statistics = SharedState()
+    rollups = SharedState()
+    calendar_index = SharedState()
+    run_index = SharedState()
+    rollups_log = SharedState()
+    run_index_log = SharedState()
+    archives = SharedState()
+    archived_months = SharedState()
+    journal_counts = SharedState()
+    journal_seqs = SharedState()
+    write_queue = SharedState()
+    
+    def __init__(self, backend='json', run_journal=False, journal_compact_threshold=20,
+                 fsync_mode='batch', fsync_window=2.0, cache_size=64,
+                 write_behind=False, write_behind_delay=0.5, track_tolerance=None,
+                 data_dir='data', lock_timeout=10.0):
+        # 存储后端：'json'（按天JSON文件）或 'sqlite'（在占用数据根目录之前检查）
+        if backend not in ('json', 'sqlite'):
+            raise ValueError(f"未知的存储后端: {backend}")
+        
         # 数据存储路径
-        self.data_dir = 'data'
+        self.data_dir = data_dir
         self.ensure_data_dir()
         
-        # 文件路径
-        self.user_file = os.path.join(self.data_dir, 'user_data.json')
-        self.runs_dir = os.path.join(self.data_dir, 'runs')
-        self.foods_dir = os.path.join(self.data_dir, 'foods')
+        # 同一根目录共享的锁、已解析文档缓存和派生状态
+        root_state = get_root_state(self.data_dir, cache_size, lock_timeout)
+        self.shared = root_state
+        self.closed = False
+        
+        # 之后任何一步失败都要释放数据根目录，否则本进程内其他实例和其他进程都无法再打开它
+        try:
+            self.root_lock = root_state['root_lock']
+            self.document_locks = root_state['document_locks']
+            self.state_lock = root_state['state_lock']
+            
+            # 文件路径
+            self.user_file = os.path.join(self.data_dir, 'user_data.json')
+            self.runs_dir = os.path.join(self.data_dir, 'runs')
+            self.foods_dir = os.path.join(self.data_dir, 'foods')
+            self.tracks_dir = os.path.join(self.runs_dir, 'tracks')
+            self.archive_dir = os.path.join(self.data_dir, 'archive')
+            self.quarantine_dir = os.path.join(self.data_dir, 'quarantine')
+            self.sqlite_file = os.path.join(self.data_dir, 'health.db')
+            self.stats_file = os.path.join(self.data_dir, 'statistics.json')
+            self.calendar_index_file = os.path.join(self.data_dir, 'calendar_index.json')
+            self.rollups_file = os.path.join(self.data_dir, 'rollups.json')
+            self.run_index_file = os.path.join(self.data_dir, 'run_index.json')
+            self.archive_state_file = os.path.join(self.data_dir, 'archive_state.json')
+            
+            # 确保子目录存在
+            os.makedirs(self.runs_dir, exist_ok=True)
+            os.makedirs(self.foods_dir, exist_ok=True)
+            os.makedirs(self.tracks_dir, exist_ok=True)
+            os.makedirs(self.archive_dir, exist_ok=True)
+            
+            # 已归档的月份（按需打开的mmap归档）
+            with self.state_lock:
+                if self.archived_months is None:
+                    self.archived_months = self.scan_archived_months()
+            
+            # 备份与恢复
+            self.backup_manager = BackupManager(self.data_dir)
+            
+            # 已解析的每日文档缓存（LRU，同一根目录共用）
+            self.cache = root_state['cache']
+            
+            # 所有写入均先写临时文件再重命名，fsync按窗口批量执行
+            self.writer = AtomicWriter(fsync_mode=fsync_mode, fsync_window=fsync_window)
+            
+            # 延迟写入：合并短时间内对同一文件的写入，在后台线程落盘
+            # （队列按根目录共用，任一实例开启后同一根目录的写入都经过队列）
+            with self.state_lock:
+                if write_behind and self.write_queue is None:
+                    self.write_queue = WriteBehindQueue(self.writer.write_bytes,
+                                                        delay=write_behind_delay)
+            
+            # 趋势汇总和跑步索引：快照 + 操作日志，每次更新只追加一行
+            with self.state_lock:
+                if self.rollups_log is None:
+                    self.rollups_log = OpLog(self.rollups_file, self.writer)
+                    self.run_index_log = OpLog(self.run_index_file, self.writer)
+            
+            # 跑步记录追加日志：保存时只追加一行，累计到阈值后合并进当天文件
+            self.journal_compact_threshold = journal_compact_threshold
+            
+            self.backend = backend
+            self.sqlite = None
+            migrated = False
+            if backend == 'sqlite':
+                migrated = self.init_sqlite_backend()
+            
+            self.run_journal = run_journal and self.sqlite is None
+            
+            # 有损轨迹存储：保存时按误差上限（米）简化路线，None 为无损保存
+            self.track_tolerance = track_tolerance
+            
+            # 累计统计（首次运行时全量统计一次，之后随写入增量更新）
+            self.load_statistics()
+            
+            # 日/周/月趋势汇总（与累计统计一样随写入增量更新，需在首次写入前加载）
+            self.load_rollups()
+            
+            # 按月的"有数据日期"位图索引和跑步ID到日期的索引懒加载
+            # （SQLite后端的跑步ID直接使用表索引）；跑步索引尚未建立时（首次运行或
+            # 刚升级）先给没有ID的旧记录补充ID，再建立索引
+            if not self.sqlite and not os.path.exists(self.run_index_file):
+                self.backfill_run_ids()
+                self.load_run_index()
+            
+            # 刚从JSON迁移到SQLite时，按迁移后的数据重新统计
+            if migrated:
+                self.reload_derived_state()
+            
+            # 本进程首次打开数据目录成功：上次恢复前保留的旧数据目录不再需要
+            if root_state['users'] == 1:
+                self.remove_before_restore_copies()
+        except Exception:
+            self.closed = True
+            release_root_state(self.data_dir)
+            raise
+    
+    def init_sqlite_backend(self):
+        """初始化SQLite后端，首次创建数据库时自动迁移现有JSON数据，返回是否进行了迁移
+        
+        迁移失败时抛出异常（不创建数据库，下次打开时重新迁移）。
+        """
+        from utils.sqlite_storage import SQLiteStorage
+        
+        with self.state_lock:
+            # 同一根目录的实例共用一个数据库对象（连接按线程分配）
+            if self.shared['sqlite'] is not None:
+                self.sqlite = self.shared['sqlite']
+                return False
+            
+            # 数据库文件只在迁移完整结束后才出现，存在即表示已迁移
+            is_new_db = not os.path.exists(self.sqlite_file)
+            if is_new_db:
+                self.prepare_json_migration()
+                self.migrate_json_to_sqlite()
+            
+            self.sqlite = SQLiteStorage(self.sqlite_file)
+            self.shared['sqlite'] = self.sqlite
+            return is_new_db
+    
+    def prepare_json_migration(self):
+        """迁移前把JSON数据整理为只有每日文件的形式
+        
+        追加日志合并进当天文件，月归档展开回每日文件，迁移只需读取每日文件。
+        """
+        self.compact_all_run_journals()
+        self.flush()
+        for month in sorted(self.archived_months):
+            self.ensure_month_writable(f'{month}-01')
+    
+    def migrate_json_to_sqlite(self):
+        """一次性将JSON数据目录迁移到SQLite数据库（需先调用 prepare_json_migration）
+        
+        先写入临时数据库 <数据库>.migrating，全部文件迁移成功后才重命名为正式
+        数据库；中途出错或崩溃时不会留下不完整的数据库。有文件无法迁移时抛出
+        MigrationError（可先用JSON后端的 verify 修复或隔离这些文件）。
+        """
+        from utils.sqlite_storage import SQLiteStorage, MigrationError, migrate_json_tree
+        
+        temp_file = self.sqlite_file + '.migrating'
+        self.remove_migration_files(temp_file)
+        
+        target = SQLiteStorage(temp_file)
+        try:
+            result = migrate_json_tree(self.runs_dir, self.foods_dir, target)
+            if result['failed_files']:
+                raise MigrationError(f"以下文件无法迁移: {', '.join(result['failed_files'])}")
+            
+            # WAL合并回数据库文件后再重命名
+            target.checkpoint()
+        except Exception:
+            target.close_all()
+            self.remove_migration_files(temp_file)
+            raise
+        target.close_all()
+        
+        os.replace(temp_file, self.sqlite_file)
+        self.remove_migration_files(temp_file)
+        print(f"JSON数据迁移完成: {result['runs']} 条跑步记录, "
+              f"{result['food_days']} 天饮食记录")
+        return result
+    
+    def remove_migration_files(self, temp_file):
+        """删除未完成迁移留下的临时数据库（含WAL和共享内存文件）"""
+        for path in (temp_file, temp_file + '-wal', temp_file + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def write_document(self, path, data, pretty=False):
+        """写入JSON文档（默认紧凑格式；延迟写入模式下进入合并队列，由后台线程落盘）"""
+        if self.write_queue:
+            self.write_queue.submit(path, json_codec.dumps_bytes(data, pretty))
+        else:
+            self.writer.write_json(path, data, pretty)
+    
+    def get_pending_document(self, path):
+        """获取尚未落盘的文档，没有时返回None"""
+        if not self.write_queue:
+            return None
+        
+        data = self.write_queue.get_pending(path)
+        return json_codec.loads(data) if data is not None else None
+    
+    def flush(self):
+        """将延迟写入队列和窗口内尚未同步的写入立即落盘"""
+        try:
+            if self.write_queue:
+                self.write_queue.flush()
+            self.writer.flush()
+            return True
+        except Exception as e:
+            print(f"同步数据到磁盘失败: {e}")
+            return False
+    
+    def close(self):
+        """关闭存储：写完待写内容并释放数据根目录
+        
+        同一根目录的最后一个实例关闭时停止后台写入线程、关闭数据库连接和
+        月归档，并释放数据目录的进程级文件锁，之后其他进程才能打开该目录。
+        """
+        if self.closed:
+            return
+        self.closed = True
         
-        # 确保子目录存在
-        os.makedirs(self.runs_dir, exist_ok=True)
-        os.makedirs(self.foods_dir, exist_ok=True)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"关闭存储失败: {e}")
+        finally:
+            release_root_state(self.data_dir)
+    
+    @contextmanager
+    def document_lock(self, data_type, date, writable=False):
+        """某天文档的锁（同时持有根目录共享锁）
+        
+        writable 为 True 时，在获取当天的锁之前把所在月份的归档展开回每日文件
+        （展开要按日期顺序持有该月各天的锁）；之后一直持有根目录共享锁，
+        该月不会在写入前再次被归档。
+        """
+        with self.root_lock.shared():
+            if writable:
+                self.ensure_month_writable(date)
+            with self.document_locks.get((data_type, date)):
+                yield
+    
+    @classmethod
+    def for_profile(cls, profile_id, profiles_dir='profiles', **kwargs):
+        """创建指定用户档案的存储（数据位于 profiles_dir/profile_id）"""
+        return cls(data_dir=os.path.join(profiles_dir, str(profile_id)), **kwargs)
+    
+    @staticmethod
+    def list_profiles(profiles_dir='profiles'):
+        """列出已有的用户档案"""
+        if not os.path.isdir(profiles_dir):
+            return []
+        return sorted(name for name in os.listdir(profiles_dir)
+                      if os.path.isdir(os.path.join(profiles_dir, name)))
     
     def ensure_data_dir(self):
         """确保数据目录存在"""
@@ -33,9 +440,12 @@ class StorageManager:
     def load_user_data(self):
         """加载用户数据"""
         try:
+            pending = self.get_pending_document(self.user_file)
+            if pending is not None:
+                return pending
+            
             if os.path.exists(self.user_file):
-                with open(self.user_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return json_codec.load_file(self.user_file)
             else:
                 # 返回默认数据
                 return {
@@ -56,8 +466,9 @@ class StorageManager:
         try:
             user_data['updated_at'] = datetime.now().isoformat()
             
-            with open(self.user_file, 'w', encoding='utf-8') as f:
-                json.dump(user_data, f, ensure_ascii=False, indent=2)
+            with self.document_lock('user', None):
+                # 用户设置可能需要人工查看，保留缩进格式
+                self.write_document(self.user_file, user_data, pretty=True)
                 
             return True
         except Exception as e:
@@ -65,59 +476,350 @@ class StorageManager:
             return False
     
     def save_run_record(self, run_record):
-        """保存跑步记录"""
+        """保存跑步记录（RunRecord或字典）
+        
+        没有跑步ID时分配一个，并写回调用方的记录对象或字典，云同步等后续操作使用同一ID。
+        """
         try:
-            date = run_record['date']
-            runs_file = os.path.join(self.runs_dir, f'runs_{date}.json')
+            record = RunRecord.coerce(run_record)
+            if not record.run_id:
+                record.run_id = uuid.uuid4().hex
+                if isinstance(run_record, dict):
+                    run_record['run_id'] = record.run_id
             
-            # 加载现有数据
-            if os.path.exists(runs_file):
-                with open(runs_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            else:
-                data = {'date': date, 'runs': []}
-            
-            # 添加新记录
-            data['runs'].append(run_record)
-            
-            # 保存数据
-            with open(runs_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            run_record = record.to_dict()
+            date = run_record['date']
             
-            return True
+            with self.document_lock('runs', date, writable=True):
+                # 跑步摘要与轨迹分开保存，轨迹按需加载；轨迹文件与摘要在同一把锁内
+                # 写入，完整性检查不会把刚写入、尚无记录引用的轨迹当作孤立文件
+                run_record = self.split_run_track(run_record)
+                
+                if self.sqlite:
+                    saved = self.sqlite.save_run_record(run_record)
+                    if saved:
+                        self.update_run_statistics(run_record)
+                        self.mark_calendar_date(date, 'runs', True)
+                    return saved
+                
+                self.apply_run_change(date, {'op': 'add', 'run': run_record})
+                
+                self.update_run_statistics(run_record)
+                self.mark_calendar_date(date, 'runs', True)
+                self.index_run(run_record['run_id'], date)
+                
+                return True
             
         except Exception as e:
             print(f"保存跑步记录失败: {e}")
             return False
     
+    def get_track_file(self, run_id):
+        """获取跑步轨迹文件路径"""
+        return os.path.join(self.tracks_dir, f'{run_id}.trk')
+    
+    def split_run_track(self, run_record):
+        """分配跑步ID，按路线计算轨迹指标并将路线写入独立的轨迹文件，返回不含路线的摘要记录
+        
+        调用方持有当天文档锁。
+        """
+        summary = dict(run_record)
+        summary.setdefault('run_id', uuid.uuid4().hex)
+        
+        route = summary.pop('route', None)
+        if isinstance(route, list) and len(route) >= 2:
+            try:
+                summary.update(run_summary(analyze_route(route)))
+            except Exception as e:
+                print(f"计算轨迹指标失败: {e}")
+        
+        if isinstance(route, list) and route:
+            # 轨迹指标已按完整路线计算，简化只影响保存的轨迹
+            summary.pop('track_tolerance', None)
+            if self.track_tolerance:
+                route = simplify_route(route, self.track_tolerance)
+                summary['track_tolerance'] = self.track_tolerance
+            
+            self.writer.write_bytes(self.get_track_file(summary['run_id']), pack_route(route))
+            summary['track_format'] = TRACK_FORMAT
+            summary['track_points'] = len(route)
+        
+        return summary
+    
+    def load_run_track(self, run_id):
+        """按需加载指定跑步的轨迹点列表"""
+        try:
+            track_file = self.get_track_file(run_id)
+            if not os.path.exists(track_file):
+                return []
+            
+            with open(track_file, 'rb') as f:
+                return unpack_route(f.read())
+                
+        except Exception as e:
+            print(f"加载跑步轨迹失败: {e}")
+            return []
+    
+    def get_run_track(self, run_record):
+        """获取跑步记录的轨迹（兼容路线内嵌在记录中的旧数据）"""
+        if run_record.get('run_id') and not run_record.get('route'):
+            return self.load_run_track(run_record['run_id'])
+        return get_run_route(run_record)
+    
+    def delete_run_track(self, run_record):
+        """删除跑步记录对应的轨迹文件"""
+        try:
+            run_id = run_record.get('run_id')
+            if run_id and os.path.exists(self.get_track_file(run_id)):
+                self.writer.remove(self.get_track_file(run_id))
+        except Exception as e:
+            print(f"删除跑步轨迹失败: {e}")
+    
     def load_daily_run_data(self, date):
         """加载指定日期的跑步数据"""
         try:
+            if self.sqlite:
+                return self.sqlite.load_daily_run_data(date)
+            
+            # 已归档月份从归档读取（刚被展开时改读每日文件）
+            if date[:7] in self.archived_months:
+                archived, data = self.load_archived_day('runs', date)
+                if archived:
+                    return data or {'date': date, 'runs': []}
+            
             runs_file = os.path.join(self.runs_dir, f'runs_{date}.json')
+            journal_file = self.get_journal_file(date)
+            
+            # 尚未落盘的延迟写入优先
+            pending = self.get_pending_document(runs_file)
+            if pending is not None:
+                if os.path.exists(journal_file):
+                    self.apply_run_journal(pending, self.read_run_journal(date))
+                return pending
+            
+            # 优先使用缓存（文件修改时间未变化时）
+            cache_key = ('runs', date)
+            version = self.get_file_version(runs_file, journal_file)
+            cached = self.cache.get(cache_key, version)
+            if cached is not None:
+                return cached
             
-            if os.path.exists(runs_file):
-                with open(runs_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            if version[0] is not None:
+                data = json_codec.load_file(runs_file)
             else:
-                return {'date': date, 'runs': []}
+                data = {'date': date, 'runs': []}
+            
+            # 合并尚未压缩的追加日志
+            if version[1] is not None:
+                self.apply_run_journal(data, self.read_run_journal(date))
+            
+            self.cache.put(cache_key, version, data)
+            
+            return data
                 
         except Exception as e:
             print(f"加载跑步数据失败: {e}")
             return {'date': date, 'runs': []}
     
-    def save_daily_food_data(self, date, food_data):
-        """保存指定日期的食物数据"""
+    def get_file_version(self, *paths):
+        """获取文件版本（修改时间和大小），文件不存在时为None"""
+        version = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                version.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                version.append(None)
+        return tuple(version)
+    
+    def get_cache_stats(self):
+        """获取每日文档缓存的命中统计"""
+        return self.cache.get_stats()
+    
+    def get_journal_file(self, date):
+        """获取指定日期的跑步追加日志路径"""
+        return os.path.join(self.runs_dir, f'runs_{date}.jsonl')
+    
+    def append_run_journal(self, date, entry):
+        """向跑步追加日志写入一行（一次顺序追加，调用方持有当天文档锁）
+        
+        序号按天递增（接在当天已合并的最大序号之后），不依赖系统时钟，
+        时钟回拨也不会让新记录被当作已合并的旧行跳过。
+        """
+        seq = self.journal_seqs.get(date)
+        if seq is None:
+            seq = self.load_daily_run_data(date).get('journal_seq', 0)
+        seq += 1
+        entry['seq'] = seq
+        self.journal_seqs[date] = seq
+        
+        line = json_codec.dumps(entry)
+        
+        self.writer.append_line(self.get_journal_file(date), line)
+        self.cache.invalidate(('runs', date))
+        
+        count = self.journal_counts.get(date)
+        if count is None:
+            count = sum(1 for _ in self.read_run_journal(date))
+        else:
+            count += 1
+        self.journal_counts[date] = count
+        
+        # 周期性压缩
+        if count >= self.journal_compact_threshold:
+            self.compact_run_journal(date)
+    
+    def read_run_journal(self, date):
+        """逐行读取跑步追加日志（跳过崩溃时写了一半的行）"""
+        journal_file = self.get_journal_file(date)
+        if not os.path.exists(journal_file):
+            return
+        
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json_codec.loads(line)
+                except ValueError:
+                    print(f"跳过损坏的跑步日志行: {journal_file}")
+    
+    def apply_run_journal(self, data, entries):
+        """将追加日志中的操作应用到当天数据"""
+        runs = data.setdefault('runs', [])
+        # 已合并过的日志行（压缩后、删除日志前崩溃）不再重复应用
+        applied_seq = data.get('journal_seq', 0)
+        
+        for entry in entries:
+            seq = entry.get('seq', 0)
+            if seq <= applied_seq:
+                continue
+            self.apply_run_op(runs, entry)
+            data['journal_seq'] = max(data.get('journal_seq', 0), seq)
+        
+        return data
+    
+    def apply_run_op(self, runs, entry):
+        """对当天的跑步列表执行一次操作：add 追加，update/delete 按跑步ID替换或删除"""
+        op = entry.get('op')
+        if op == 'add':
+            runs.append(entry['run'])
+        elif op == 'update':
+            run_id = entry['run'].get('run_id')
+            for i, run in enumerate(runs):
+                if run.get('run_id') == run_id:
+                    runs[i] = entry['run']
+                    break
+        elif op == 'delete':
+            runs[:] = [run for run in runs if run.get('run_id') != entry['run_id']]
+    
+    def apply_run_change(self, date, entry):
+        """写入一次跑步记录的增删改（调用方持有当天文档锁）
+        
+        追加日志模式下只追加一行；否则合并进当天文件后写回，
+        其他日期的文件不受影响。
+        """
+        if self.run_journal:
+            self.append_run_journal(date, entry)
+            return
+        
+        # 加载现有数据（包括尚未落盘的延迟写入，遗留的追加日志先合并）
+        if os.path.exists(self.get_journal_file(date)):
+            self.compact_run_journal(date)
+        data = self.load_daily_run_data(date)
+        
+        self.apply_run_op(data.setdefault('runs', []), entry)
+        
+        runs_file = os.path.join(self.runs_dir, f'runs_{date}.json')
+        self.write_document(runs_file, data)
+        self.cache.invalidate(('runs', date))
+    
+    @day_locked('runs')
+    def compact_run_journal(self, date):
+        """将指定日期的追加日志合并进当天文件"""
         try:
-            foods_file = os.path.join(self.foods_dir, f'foods_{date}.json')
+            journal_file = self.get_journal_file(date)
+            if not os.path.exists(journal_file):
+                return True
+            
+            # 当天文件必须先于删除日志落盘，不能走延迟写入
+            if self.write_queue:
+                self.write_queue.flush()
             
+            data = self.load_daily_run_data(date)
+            
+            runs_file = os.path.join(self.runs_dir, f'runs_{date}.json')
+            self.writer.write_json(runs_file, data)
+            
+            self.writer.remove(journal_file)
+            self.journal_counts.pop(date, None)
+            self.cache.invalidate(('runs', date))
+            
+            return True
+            
+        except Exception as e:
+            print(f"压缩跑步日志失败: {e}")
+            return False
+    
+    def compact_all_run_journals(self):
+        """压缩所有日期的跑步追加日志"""
+        for filename in os.listdir(self.runs_dir):
+            if filename.startswith('runs_') and filename.endswith('.jsonl'):
+                self.compact_run_journal(filename[len('runs_'):-len('.jsonl')])
+    
+    def list_run_dates(self, include_archive=True):
+        """列出有跑步数据文件（含追加日志）的日期"""
+        if self.sqlite:
+            from utils.sqlite_storage import RECORD_RUN
+            return self.sqlite.list_dates(RECORD_RUN)
+        
+        dates = set()
+        if include_archive:
+            for month in self.archived_months:
+                dates.update(self.get_archive(month).run_dates())
+        
+        for filename in os.listdir(self.runs_dir):
+            if filename.startswith('runs_') and filename.endswith('.json'):
+                dates.add(filename[len('runs_'):-len('.json')])
+            elif filename.startswith('runs_') and filename.endswith('.jsonl'):
+                dates.add(filename[len('runs_'):-len('.jsonl')])
+        return sorted(dates)
+    
+    def list_food_dates(self, include_archive=True):
+        """列出有食物数据文件的日期"""
+        if self.sqlite:
+            from utils.sqlite_storage import RECORD_FOOD_DAY
+            return self.sqlite.list_dates(RECORD_FOOD_DAY)
+        
+        dates = []
+        if include_archive:
+            for month in self.archived_months:
+                dates.extend(self.get_archive(month).food_dates())
+        
+        for filename in os.listdir(self.foods_dir):
+            if filename.startswith('foods_') and filename.endswith('.json'):
+                dates.append(filename[len('foods_'):-len('.json')])
+        return sorted(dates)
+    
+    @day_locked('foods', writable=True)
+    def save_daily_food_data(self, date, food_data):
+        """整体保存指定日期的食物数据（营养汇总按食物条目重新计算）"""
+        try:
             # 确保数据格式正确
             if 'date' not in food_data:
                 food_data['date'] = date
             
-            food_data['updated_at'] = datetime.now().isoformat()
+            # 统一食物条目格式，汇总由存储层维护
+            food_data['foods'] = [FoodEntry.coerce(food).to_dict()
+                                  for food in food_data.get('foods', [])]
+            food_data['nutrition'] = DayNutrition.from_entries(food_data['foods']).to_dict()
+            
+            # 旧数据用于计算累计统计的增量
+            old_data = self.load_daily_food_data(date)
             
-            with open(foods_file, 'w', encoding='utf-8') as f:
-                json.dump(food_data, f, ensure_ascii=False, indent=2)
+            self.write_food_day(date, food_data)
+            self.update_food_statistics(old_data, food_data)
             
             return True
             
@@ -125,26 +827,202 @@ class StorageManager:
             print(f"保存食物数据失败: {e}")
             return False
     
+    def write_food_day(self, date, food_data):
+        """写入一天的食物数据并更新日历索引"""
+        food_data['updated_at'] = datetime.now().isoformat()
+        
+        if self.sqlite:
+            self.sqlite.save_daily_food_data(date, food_data)
+        else:
+            foods_file = os.path.join(self.foods_dir, f'foods_{date}.json')
+            self.write_document(foods_file, food_data)
+            self.cache.invalidate(('foods', date))
+        
+        self.mark_calendar_date(date, 'foods', bool(food_data.get('foods')))
+        self.set_food_rollups(date, self.get_day_nutrition(food_data))
+    
+    def get_day_nutrition(self, food_data):
+        """获取一天的营养汇总（旧数据缺少汇总时按条目计算）"""
+        nutrition = food_data.get('nutrition')
+        if not nutrition and food_data.get('foods'):
+            return DayNutrition.from_entries(food_data['foods'])
+        return DayNutrition.from_dict(nutrition)
+    
+    def find_food_entry(self, food_data, timestamp):
+        """按时间戳查找食物条目的位置，找不到时返回-1"""
+        for i, food in enumerate(food_data.get('foods', [])):
+            if food.get('timestamp') == timestamp:
+                return i
+        return -1
+    
+    @day_locked('foods', writable=True)
+    def add_food_entry(self, date, entry):
+        """添加一个食物条目并增量更新当天营养汇总，返回更新后的当天数据"""
+        try:
+            entry = FoodEntry.coerce(entry)
+            if not entry.timestamp:
+                entry.timestamp = datetime.now().isoformat()
+            
+            food_data = self.load_daily_food_data(date)
+            food_data.setdefault('date', date)
+            food_data.setdefault('foods', [])
+            
+            nutrition = self.get_day_nutrition(food_data)
+            nutrition.add(entry)
+            
+            food_data['foods'].append(entry.to_dict())
+            food_data['nutrition'] = nutrition.to_dict()
+            
+            self.write_food_day(date, food_data)
+            self.update_statistics(total_foods=1, total_calories_consumed=entry.calories)
+            
+            return food_data
+            
+        except Exception as e:
+            print(f"添加食物条目失败: {e}")
+            return None
+    
+    @day_locked('foods', writable=True)
+    def update_food_entry(self, date, timestamp, entry):
+        """替换指定时间戳的食物条目并增量更新汇总，返回更新后的当天数据"""
+        try:
+            entry = FoodEntry.coerce(entry)
+            
+            food_data = self.load_daily_food_data(date)
+            index = self.find_food_entry(food_data, timestamp)
+            if index < 0:
+                print(f"未找到要修改的食物条目: {timestamp}")
+                return None
+            
+            old_entry = FoodEntry.from_dict(food_data['foods'][index])
+            
+            nutrition = self.get_day_nutrition(food_data)
+            nutrition.add(old_entry, sign=-1)
+            nutrition.add(entry)
+            
+            food_data['foods'][index] = entry.to_dict()
+            food_data['nutrition'] = nutrition.to_dict()
+            
+            self.write_food_day(date, food_data)
+            self.update_statistics(total_calories_consumed=entry.calories - old_entry.calories)
+            
+            return food_data
+            
+        except Exception as e:
+            print(f"修改食物条目失败: {e}")
+            return None
+    
+    @day_locked('foods', writable=True)
+    def delete_food_entry(self, date, timestamp):
+        """删除指定时间戳的食物条目并增量更新汇总，返回更新后的当天数据"""
+        try:
+            food_data = self.load_daily_food_data(date)
+            index = self.find_food_entry(food_data, timestamp)
+            if index < 0:
+                print(f"未找到要删除的食物条目: {timestamp}")
+                return None
+            
+            old_entry = FoodEntry.from_dict(food_data['foods'].pop(index))
+            
+            nutrition = self.get_day_nutrition(food_data)
+            nutrition.add(old_entry, sign=-1)
+            food_data['nutrition'] = nutrition.to_dict()
+            
+            self.write_food_day(date, food_data)
+            self.update_statistics(total_foods=-1, total_calories_consumed=-old_entry.calories)
+            
+            return food_data
+            
+        except Exception as e:
+            print(f"删除食物条目失败: {e}")
+            return None
+    
+    def check_daily_nutrition(self, date, repair=True):
+        """按食物条目重新汇总并与保存的营养汇总核对，返回是否一致
+        
+        repair为True时用重新汇总的结果修正保存的数据（只有不一致时才写入，
+        已归档月份此时才展开回每日文件）。
+        """
+        try:
+            mismatched = self.find_nutrition_mismatch(self.load_daily_food_data(date))
+            if not mismatched:
+                return True
+            
+            print(f"{date} 营养汇总与食物条目不一致: {mismatched}")
+            if repair:
+                self.repair_daily_nutrition(date)
+            return False
+            
+        except Exception as e:
+            print(f"核对营养汇总失败: {e}")
+            return False
+    
+    def find_nutrition_mismatch(self, food_data):
+        """返回保存的营养汇总与按条目重新汇总不一致的营养素"""
+        stored = DayNutrition.from_dict(food_data.get('nutrition'))
+        expected = DayNutrition.from_entries(food_data.get('foods', []))
+        return [name for name in NUTRIENTS
+                if abs(getattr(stored, name) - getattr(expected, name)) > 1e-6]
+    
+    @day_locked('foods', writable=True)
+    def repair_daily_nutrition(self, date):
+        """用按食物条目重新汇总的结果修正保存的营养汇总"""
+        food_data = self.load_daily_food_data(date)
+        stored = DayNutrition.from_dict(food_data.get('nutrition'))
+        expected = DayNutrition.from_entries(food_data.get('foods', []))
+        
+        food_data['nutrition'] = expected.to_dict()
+        self.write_food_day(date, food_data)
+        self.update_statistics(
+            total_calories_consumed=expected.calories - stored.calories
+        )
+    
     def load_daily_food_data(self, date):
         """加载指定日期的食物数据"""
         try:
             foods_file = os.path.join(self.foods_dir, f'foods_{date}.json')
             
-            if os.path.exists(foods_file):
-                with open(foods_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            # 已归档月份从归档读取（刚被展开时改读每日文件）
+            archived, data = False, None
+            if not self.sqlite and date[:7] in self.archived_months:
+                archived, data = self.load_archived_day('foods', date)
+            
+            if self.sqlite:
+                data = self.sqlite.load_daily_food_data(date)
+                if data is not None:
+                    return data
+            elif archived:
+                if data is not None:
+                    return data
             else:
-                return {
-                    'date': date,
-                    'foods': [],
-                    'nutrition': {
-                        'calories': 0,
-                        'protein': 0,
-                        'carbs': 0,
-                        'fat': 0
-                    }
-                }
+                # 尚未落盘的延迟写入优先
+                pending = self.get_pending_document(foods_file)
+                if pending is not None:
+                    return pending
+                
+                # 优先使用缓存（文件修改时间未变化时）
+                cache_key = ('foods', date)
+                version = self.get_file_version(foods_file)
+                cached = self.cache.get(cache_key, version)
+                if cached is not None:
+                    return cached
                 
+                if version[0] is not None:
+                    data = json_codec.load_file(foods_file)
+                    self.cache.put(cache_key, version, data)
+                    return data
+            
+            return {
+                'date': date,
+                'foods': [],
+                'nutrition': {
+                    'calories': 0,
+                    'protein': 0,
+                    'carbs': 0,
+                    'fat': 0
+                }
+            }
+            
         except Exception as e:
             print(f"加载食物数据失败: {e}")
             return {'date': date, 'foods': [], 'nutrition': {}}
@@ -153,73 +1031,157 @@ class StorageManager:
         """加载今日营养数据"""
         today = datetime.now().strftime('%Y-%m-%d')
         data = self.load_daily_food_data(today)
-        return data.get('nutrition', {
-            'calories': 0,
-            'protein': 0,
-            'carbs': 0,
-            'fat': 0
-        })
+        return self.get_day_nutrition(data).to_dict()
+    
+    def empty_statistics(self):
+        """空的累计统计数据"""
+        return {
+            'total_runs': 0,
+            'total_distance': 0,
+            'total_duration': 0,
+            'total_calories_burned': 0,
+            'total_foods': 0,
+            'total_calories_consumed': 0
+        }
     
-    def save_daily_nutrition(self, nutrition_data):
-        """保存今日营养数据"""
+    @state_locked
+    def load_statistics(self):
+        """加载持久化的累计统计（不存在时从头重建）"""
+        if self.statistics is not None:
+            return self.statistics
+        
         try:
-            today = datetime.now().strftime('%Y-%m-%d')
-            # 获取现有食物数据
-            food_data = self.load_daily_food_data(today)
-            
-            # 更新营养数据
-            food_data['nutrition'] = nutrition_data
-            food_data['updated_at'] = datetime.now().isoformat()
-            
-            # 保存到文件
-            return self.save_daily_food_data(today, food_data)
-            
+            if os.path.exists(self.stats_file):
+                stats = self.empty_statistics()
+                stats.update(json_codec.load_file(self.stats_file))
+                self.statistics = stats
+                return self.statistics
+        except Exception as e:
+            print(f"加载累计统计失败，将重新统计: {e}")
+        
+        return self.rebuild_statistics()
+    
+    def save_statistics(self):
+        """保存累计统计"""
+        try:
+            self.write_document(self.stats_file, self.statistics)
+            return True
         except Exception as e:
-            print(f"保存营养数据失败: {e}")
+            print(f"保存累计统计失败: {e}")
             return False
     
+    @state_locked
+    def update_statistics(self, **deltas):
+        """按增量更新累计统计"""
+        try:
+            stats = self.load_statistics()
+            for key, delta in deltas.items():
+                stats[key] = stats.get(key, 0) + delta
+            self.save_statistics()
+        except Exception as e:
+            print(f"更新累计统计失败: {e}")
+    
+    def update_run_statistics(self, run, sign=1):
+        """按一次跑步记录更新累计统计和趋势汇总（sign=-1 表示删除）"""
+        self.update_statistics(
+            total_runs=sign,
+            total_distance=sign * run.get('distance', 0),
+            total_duration=sign * run.get('duration', 0),
+            total_calories_burned=sign * run.get('calories', 0)
+        )
+        self.update_run_rollups(run, sign)
+    
+    def update_food_statistics(self, old_data, new_data):
+        """按一天食物数据的前后差值更新累计统计"""
+        old_nutrition = old_data.get('nutrition') or {}
+        new_nutrition = new_data.get('nutrition') or {}
+        self.update_statistics(
+            total_foods=len(new_data.get('foods', [])) - len(old_data.get('foods', [])),
+            total_calories_consumed=(new_nutrition.get('calories', 0) -
+                                     old_nutrition.get('calories', 0))
+        )
+    
     def get_user_statistics(self):
-        """获取用户统计数据"""
-        try:
-            stats = {
-                'total_runs': 0,
-                'total_distance': 0,
-                'total_duration': 0,
-                'total_calories_burned': 0,
-                'total_foods': 0,
-                'total_calories_consumed': 0
-            }
+        """获取用户统计数据（读取累计统计，O(1)）"""
+        try:
+            return dict(self.load_statistics())
+        except Exception as e:
+            print(f"获取统计数据失败: {e}")
+            return {}
+    
+    @state_locked
+    def rebuild_statistics(self):
+        """全量重新统计并与已保存的累计统计核对"""
+        stats = self.compute_statistics()
+        
+        previous = self.statistics
+        if previous is None and os.path.exists(self.stats_file):
+            try:
+                previous = json_codec.load_file(self.stats_file)
+            except Exception:
+                previous = None
+        
+        if previous is not None:
+            mismatched = [key for key in stats
+                          if abs(previous.get(key, 0) - stats[key]) > 1e-6]
+            if mismatched:
+                print(f"累计统计与全量统计不一致，已修正: {mismatched}")
+        
+        self.statistics = stats
+        self.save_statistics()
+        return self.statistics
+    
+    def compute_statistics(self):
+        """全量扫描所有数据文件计算统计数据"""
+        try:
+            stats = self.empty_statistics()
             
-            # 统计跑步数据
-            for filename in os.listdir(self.runs_dir):
-                if filename.startswith('runs_') and filename.endswith('.json'):
-                    filepath = os.path.join(self.runs_dir, filename)
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            runs = data.get('runs', [])
-                            
-                            for run in runs:
-                                stats['total_runs'] += 1
-                                stats['total_distance'] += run.get('distance', 0)
-                                stats['total_duration'] += run.get('duration', 0)
-                                stats['total_calories_burned'] += run.get('calories', 0)
-                    except:
-                        continue
+            if self.sqlite:
+                from utils.sqlite_storage import RECORD_RUN, RECORD_FOOD_DAY
+                
+                for _, run in self.sqlite.iter_records(RECORD_RUN):
+                    stats['total_runs'] += 1
+                    stats['total_distance'] += run.get('distance', 0)
+                    stats['total_duration'] += run.get('duration', 0)
+                    stats['total_calories_burned'] += run.get('calories', 0)
+                
+                for _, data in self.sqlite.iter_records(RECORD_FOOD_DAY):
+                    stats['total_foods'] += len(data.get('foods', []))
+                    stats['total_calories_consumed'] += data.get('nutrition', {}).get('calories', 0)
+                
+                return stats
+            
+            # 已归档月份直接对数值列求和
+            for month in self.archived_months:
+                archive = self.get_archive(month)
+                stats['total_runs'] += archive.run_count
+                stats['total_distance'] += archive.sum('run_distance')
+                stats['total_duration'] += archive.sum('run_duration')
+                stats['total_calories_burned'] += archive.sum('run_calories')
+                stats['total_foods'] += archive.sum('food_count')
+                stats['total_calories_consumed'] += archive.sum('food_calories')
+            
+            # 统计跑步数据（包括追加日志中的记录）
+            for date in self.list_run_dates(include_archive=False):
+                for run in self.load_daily_run_data(date).get('runs', []):
+                    stats['total_runs'] += 1
+                    stats['total_distance'] += run.get('distance', 0)
+                    stats['total_duration'] += run.get('duration', 0)
+                    stats['total_calories_burned'] += run.get('calories', 0)
             
             # 统计食物数据
             for filename in os.listdir(self.foods_dir):
                 if filename.startswith('foods_') and filename.endswith('.json'):
                     filepath = os.path.join(self.foods_dir, filename)
                     try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            foods = data.get('foods', [])
-                            nutrition = data.get('nutrition', {})
-                            
-                            stats['total_foods'] += len(foods)
-                            stats['total_calories_consumed'] += nutrition.get('calories', 0)
-                    except:
+                        data = json_codec.load_file(filepath)
+                        foods = data.get('foods', [])
+                        nutrition = data.get('nutrition', {})
+                        
+                        stats['total_foods'] += len(foods)
+                        stats['total_calories_consumed'] += nutrition.get('calories', 0)
+                    except Exception as e:
+                        print(f"跳过无法读取的食物文件 {filename}（可用 verify() 检查）: {e}")
                         continue
             
             return stats
@@ -228,7 +1190,200 @@ class StorageManager:
             print(f"获取统计数据失败: {e}")
             return {}
     
-    def get_date_range_data(self, start_date, end_date, data_type='both'):
+    @state_locked
+    def load_calendar_index(self):
+        """加载按月位图索引（不存在时全量重建）"""
+        if self.calendar_index is not None:
+            return self.calendar_index
+        
+        try:
+            if os.path.exists(self.calendar_index_file):
+                self.calendar_index = json_codec.load_file(self.calendar_index_file)
+                return self.calendar_index
+        except Exception as e:
+            print(f"加载日历索引失败，将重新建立: {e}")
+        
+        return self.rebuild_calendar_index()
+    
+    def save_calendar_index(self):
+        """保存按月位图索引"""
+        try:
+            self.write_document(self.calendar_index_file, self.calendar_index)
+            return True
+        except Exception as e:
+            print(f"保存日历索引失败: {e}")
+            return False
+    
+    @state_locked
+    def mark_calendar_date(self, date, data_type, has_data):
+        """更新某天在月索引中的标记（位 day-1 表示当月第day天）"""
+        try:
+            index = self.load_calendar_index()
+            month_key = date[:7]
+            bit = 1 << (int(date[8:10]) - 1)
+            
+            month = index.setdefault(month_key, {'runs': 0, 'foods': 0})
+            old_mask = month.get(data_type, 0)
+            new_mask = old_mask | bit if has_data else old_mask & ~bit
+            
+            if new_mask != old_mask:
+                month[data_type] = new_mask
+                self.save_calendar_index()
+                
+        except Exception as e:
+            print(f"更新日历索引失败: {e}")
+    
+    @state_locked
+    def rebuild_calendar_index(self):
+        """扫描全部数据重建按月位图索引"""
+        index = {}
+        
+        for data_type, dates, loader in [
+            ('runs', self.list_run_dates(), self.load_daily_run_data),
+            ('foods', self.list_food_dates(), self.load_daily_food_data)
+        ]:
+            for date in dates:
+                if not loader(date).get(data_type):
+                    continue
+                month = index.setdefault(date[:7], {'runs': 0, 'foods': 0})
+                month[data_type] |= 1 << (int(date[8:10]) - 1)
+        
+        self.calendar_index = index
+        self.save_calendar_index()
+        return self.calendar_index
+    
+    def dates_with_data(self, year, month, data_type='both'):
+        """获取某月有记录的日期集合（一次索引查找）"""
+        try:
+            month_key = f"{year:04d}-{month:02d}"
+            entry = self.load_calendar_index().get(month_key, {})
+            
+            mask = 0
+            if data_type in ['both', 'runs']:
+                mask |= entry.get('runs', 0)
+            if data_type in ['both', 'foods']:
+                mask |= entry.get('foods', 0)
+            
+            dates = set()
+            day = 1
+            while mask:
+                if mask & 1:
+                    dates.add(f"{month_key}-{day:02d}")
+                mask >>= 1
+                day += 1
+            return dates
+            
+        except Exception as e:
+            print(f"获取月度记录日期失败: {e}")
+            return set()
+    
+    @state_locked
+    def load_rollups(self):
+        """加载趋势汇总表（不存在时全量重建）"""
+        if self.rollups is not None:
+            return self.rollups
+        
+        try:
+            rollups = self.rollups_log.load(self.apply_rollups_op,
+                                            lambda loaded: {**empty_rollups(), **loaded})
+            if rollups is not None:
+                self.rollups = rollups
+                return self.rollups
+        except Exception as e:
+            print(f"加载趋势汇总失败，将重新汇总: {e}")
+        
+        return self.rebuild_rollups()
+    
+    def save_rollups(self):
+        """整份保存趋势汇总表（重建或清除后调用，平时的增量只追加日志）"""
+        try:
+            self.rollups_log.compact(self.rollups)
+            return True
+        except Exception as e:
+            print(f"保存趋势汇总失败: {e}")
+            return False
+    
+    def apply_rollups_op(self, rollups, entry):
+        """重放一行趋势汇总日志"""
+        add_to_rollups(rollups, entry['date'], entry['deltas'])
+    
+    def add_rollups(self, date, deltas):
+        """累加一天的指标增量并追加到汇总日志（调用方持有状态锁）"""
+        add_to_rollups(self.load_rollups(), date, deltas)
+        self.rollups_log.append({'date': date, 'deltas': deltas}, self.rollups)
+    
+    def run_rollup_deltas(self, run, sign=1):
+        """一次跑步记录对应的汇总指标增量"""
+        return {
+            metric: sign * (run.get(field, 0) if field else 1)
+            for metric, field in RUN_METRICS.items()
+        }
+    
+    @state_locked
+    def update_run_rollups(self, run, sign=1):
+        """按一次跑步记录增量更新趋势汇总（sign=-1 表示删除）"""
+        try:
+            self.add_rollups(run['date'], self.run_rollup_deltas(run, sign))
+        except Exception as e:
+            print(f"更新跑步趋势汇总失败: {e}")
+    
+    @state_locked
+    def set_food_rollups(self, date, nutrition):
+        """设置某天的饮食汇总，按与原值的差更新周、月汇总"""
+        try:
+            rollups = self.load_rollups()
+            day = rollups['day'].get(date, {})
+            deltas = {
+                metric: getattr(nutrition, field) - day.get(metric, 0)
+                for metric, field in FOOD_METRICS.items()
+            }
+            
+            if any(abs(delta) > 1e-9 for delta in deltas.values()):
+                self.add_rollups(date, deltas)
+                
+        except Exception as e:
+            print(f"更新饮食趋势汇总失败: {e}")
+    
+    @state_locked
+    def rebuild_rollups(self):
+        """扫描全部数据重建趋势汇总表"""
+        rollups = empty_rollups()
+        
+        try:
+            for date in self.list_run_dates():
+                for run in self.load_daily_run_data(date).get('runs', []):
+                    add_to_rollups(rollups, date, self.run_rollup_deltas(run))
+            
+            for date in self.list_food_dates():
+                nutrition = self.get_day_nutrition(self.load_daily_food_data(date))
+                add_to_rollups(rollups, date, {
+                    metric: getattr(nutrition, field)
+                    for metric, field in FOOD_METRICS.items()
+                })
+        except Exception as e:
+            print(f"重建趋势汇总失败: {e}")
+        
+        self.rollups = rollups
+        self.save_rollups()
+        return self.rollups
+    
+    def get_rollup(self, metric, granularity, start_date, end_date):
+        """获取日期范围内某指标按日/周/月的汇总
+        
+        返回 (周期键列表, array('d') 数值)，没有数据的周期为0；
+        周期键：日 2024-01-31，周 2024-W05（ISO周），月 2024-01
+        """
+        if metric not in METRICS:
+            raise ValueError(f"未知的汇总指标: {metric}")
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"未知的汇总粒度: {granularity}")
+        
+        buckets = self.load_rollups()[granularity]
+        periods = list(iter_periods(start_date, end_date, granularity))
+        values = array('d', (buckets.get(period, {}).get(metric, 0) for period in periods))
+        return periods, values
+    
+    def get_date_range_data(self, start_date, end_date, data_type='both', workers=0):
         """获取日期范围内的数据"""
         try:
             results = {
@@ -242,43 +1397,92 @@ class StorageManager:
             end = datetime.strptime(end_date, '%Y-%m-%d')
             
             while current <= end:
-                date_str = current.strftime('%Y-%m-%d')
-                results['dates'].append(date_str)
-                
-                if data_type in ['both', 'runs']:
-                    run_data = self.load_daily_run_data(date_str)
-                    results['runs'].extend(run_data.get('runs', []))
-                
-                if data_type in ['both', 'foods']:
-                    food_data = self.load_daily_food_data(date_str)
-                    results['foods'].extend(food_data.get('foods', []))
-                
+                results['dates'].append(current.strftime('%Y-%m-%d'))
                 current += timedelta(days=1)
             
+            if self.sqlite:
+                results.update(self.sqlite.get_date_range_data(start_date, end_date, data_type))
+                return results
+            
+            for _, day in self.iter_date_range_data(start_date, end_date, data_type, workers):
+                results['runs'].extend(day['runs'])
+                results['foods'].extend(day['foods'])
+            
             return results
             
         except Exception as e:
             print(f"获取范围数据失败: {e}")
             return {'runs': [], 'foods': [], 'dates': []}
     
+    def iter_date_range_data(self, start_date, end_date, data_type='both', workers=0):
+        """按日期顺序逐天产出范围内有数据的日期 (date, {'runs': [...], 'foods': [...]})
+        
+        只列一次目录，只加载实际存在的文件；workers>0 时使用线程池并行加载。
+        """
+        run_dates = set()
+        food_dates = set()
+        
+        if data_type in ['both', 'runs']:
+            run_dates = {d for d in self.list_run_dates() if start_date <= d <= end_date}
+        if data_type in ['both', 'foods']:
+            food_dates = {d for d in self.list_food_dates() if start_date <= d <= end_date}
+        
+        def load_day(date):
+            day = {'runs': [], 'foods': []}
+            if date in run_dates:
+                day['runs'] = self.load_daily_run_data(date).get('runs', [])
+            if date in food_dates:
+                day['foods'] = self.load_daily_food_data(date).get('foods', [])
+            return date, day
+        
+        dates = sorted(run_dates | food_dates)
+        
+        if workers and len(dates) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # map 保持日期顺序，结果按完成顺序逐个产出
+                for item in executor.map(load_day, dates):
+                    yield item
+        else:
+            for date in dates:
+                yield load_day(date)
+    
+    @day_locked('runs', writable=True)
     def delete_run_record(self, date, run_index):
         """删除跑步记录"""
         try:
+            if self.sqlite:
+                removed = self.sqlite.delete_run_record(date, run_index)
+                if removed is None:
+                    return False
+                self.update_run_statistics(removed, sign=-1)
+                self.delete_run_track(removed)
+                remaining = self.load_daily_run_data(date).get('runs', [])
+                self.mark_calendar_date(date, 'runs', bool(remaining))
+                return True
+            
             runs_file = os.path.join(self.runs_dir, f'runs_{date}.json')
             
-            if not os.path.exists(runs_file):
-                return False
+            # 先把追加日志合并进当天文件，保证序号与显示一致
+            if os.path.exists(self.get_journal_file(date)):
+                self.compact_run_journal(date)
             
-            with open(runs_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # 包括尚未落盘的延迟写入
+            data = self.load_daily_run_data(date)
             
             runs = data.get('runs', [])
             if 0 <= run_index < len(runs):
-                runs.pop(run_index)
+                removed = runs.pop(run_index)
                 
                 # 保存更新后的数据
-                with open(runs_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                self.write_document(runs_file, data)
+                self.cache.invalidate(('runs', date))
+                
+                self.update_run_statistics(removed, sign=-1)
+                self.delete_run_track(removed)
+                self.mark_calendar_date(date, 'runs', bool(runs))
+                self.unindex_run(removed.get('run_id'))
                 
                 return True
             
@@ -288,35 +1492,679 @@ class StorageManager:
             print(f"删除跑步记录失败: {e}")
             return False
     
-    def backup_data(self, backup_path):
-        """备份数据"""
+    @state_locked
+    def load_run_index(self):
+        """加载跑步ID索引 {跑步ID: 日期}（不存在时全量重建）"""
+        if self.run_index is not None:
+            return self.run_index
+        
+        try:
+            index = self.run_index_log.load(self.apply_run_index_op)
+            if index is not None:
+                self.run_index = index
+                return self.run_index
+        except Exception as e:
+            print(f"加载跑步索引失败，将重新建立: {e}")
+        
+        return self.rebuild_run_index()
+    
+    def save_run_index(self):
+        """整份保存跑步ID索引（重建或清除后调用，平时的增删只追加日志）"""
+        try:
+            self.run_index_log.compact(self.run_index)
+            return True
+        except Exception as e:
+            print(f"保存跑步索引失败: {e}")
+            return False
+    
+    def apply_run_index_op(self, index, entry):
+        """重放一行跑步索引日志：set 记录日期，del 移除"""
+        if entry.get('op') == 'set':
+            index[entry['run_id']] = entry['date']
+        elif entry.get('op') == 'del':
+            index.pop(entry['run_id'], None)
+    
+    @state_locked
+    def index_run(self, run_id, date):
+        """记录跑步ID所在的日期"""
+        if self.sqlite or not run_id:
+            return
+        
+        index = self.load_run_index()
+        if index.get(run_id) != date:
+            index[run_id] = date
+            self.run_index_log.append({'op': 'set', 'run_id': run_id, 'date': date}, index)
+    
+    @state_locked
+    def unindex_run(self, run_id):
+        """从索引中移除跑步ID"""
+        if self.sqlite or not run_id:
+            return
+        
+        index = self.load_run_index()
+        if index.pop(run_id, None) is not None:
+            self.run_index_log.append({'op': 'del', 'run_id': run_id}, index)
+    
+    @state_locked
+    def rebuild_run_index(self):
+        """扫描全部跑步数据重建跑步ID索引
+        
+        没有ID的旧记录不进入索引（由 backfill_run_ids 在打开或重新加载数据时补充ID）。
+        """
+        index = {}
+        
+        if not self.sqlite:
+            for date in self.list_run_dates():
+                for run in self.load_daily_run_data(date).get('runs', []):
+                    if run.get('run_id'):
+                        index[run['run_id']] = date
+        
+        self.run_index = index
+        self.save_run_index()
+        return self.run_index
+    
+    def backfill_run_ids(self):
+        """给没有ID的旧跑步记录分配ID并写回当天文件，返回补充ID的记录数
+        
+        跑步ID功能之前保存的记录没有ID，按ID查找、修改和删除都找不到它们。
+        ID随记录保存，之后每次打开都相同。
+        """
+        if self.sqlite:
+            return 0
+        
+        count = 0
+        for date in self.list_run_dates():
+            try:
+                if all(run.get('run_id') for run in self.load_daily_run_data(date).get('runs', [])):
+                    continue
+                
+                with self.document_lock('runs', date, writable=True):
+                    # 遗留的追加日志先合并，整天写回当天文件
+                    if os.path.exists(self.get_journal_file(date)):
+                        self.compact_run_journal(date)
+                    data = self.load_daily_run_data(date)
+                    for run in data.get('runs', []):
+                        if not run.get('run_id'):
+                            run['run_id'] = uuid.uuid4().hex
+                            count += 1
+                    
+                    runs_file = os.path.join(self.runs_dir, f'runs_{date}.json')
+                    self.write_document(runs_file, data)
+                    self.cache.invalidate(('runs', date))
+            except Exception as e:
+                print(f"补充跑步记录ID失败 {date}: {e}")
+        
+        if count:
+            print(f"已为 {count} 条旧跑步记录补充ID")
+        return count
+    
+    def find_run_in_day(self, date, run_id):
+        """在某天的跑步记录中按ID查找"""
+        for run in self.load_daily_run_data(date).get('runs', []):
+            if run.get('run_id') == run_id:
+                return run
+        return None
+    
+    def locate_run(self, run_id):
+        """查找跑步记录，返回 (日期, 记录)，不存在时返回None
+        
+        索引只指向日期，当天的几条记录按ID比对；索引过期时重建一次。
+        """
+        if self.sqlite:
+            run = self.sqlite.get_run(run_id)
+            return (run['date'], run) if run else None
+        
+        for attempt in range(2):
+            date = self.load_run_index().get(run_id)
+            if date is None:
+                return None
+            
+            run = self.find_run_in_day(date, run_id)
+            if run is not None:
+                return date, run
+            
+            if attempt == 0:
+                self.rebuild_run_index()
+        return None
+    
+    def get_run(self, run_id):
+        """按跑步ID获取跑步记录（不含轨迹，需要时用 get_run_track），不存在时返回None"""
+        try:
+            located = self.locate_run(run_id)
+            return dict(located[1]) if located else None
+        except Exception as e:
+            print(f"获取跑步记录失败: {e}")
+            return None
+    
+    def delete_run(self, run_id):
+        """按跑步ID删除跑步记录（只改写该记录所在的一天）"""
+        try:
+            located = self.locate_run(run_id)
+            if located is None:
+                return False
+            date = located[0]
+            
+            with self.document_lock('runs', date, writable=True):
+                if self.sqlite:
+                    removed = self.sqlite.delete_run(run_id)
+                else:
+                    removed = self.find_run_in_day(date, run_id)
+                    if removed is not None:
+                        self.apply_run_change(date, {'op': 'delete', 'run_id': run_id})
+                
+                if removed is None:
+                    return False
+                
+                self.update_run_statistics(removed, sign=-1)
+                self.delete_run_track(removed)
+                remaining = self.load_daily_run_data(date).get('runs', [])
+                self.mark_calendar_date(date, 'runs', bool(remaining))
+                self.unindex_run(run_id)
+                
+                return True
+            
+        except Exception as e:
+            print(f"删除跑步记录失败: {e}")
+            return False
+    
+    def update_run(self, run_id, changes):
+        """按跑步ID修改跑步记录，返回修改后的记录（不存在时返回None）
+        
+        changes 为要修改的字段（字典或RunRecord）；包含 route 时重写轨迹，
+        修改 date 时记录移到新的日期。
+        """
         try:
-            import shutil
+            if isinstance(changes, RunRecord):
+                changes = changes.to_dict()
             
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_dir = f"{backup_path}/health_app_backup_{timestamp}"
+            located = self.locate_run(run_id)
+            if located is None:
+                return None
+            old_date = located[0]
+            new_date = changes.get('date') or old_date
             
-            shutil.copytree(self.data_dir, backup_dir)
+            # 两天所在月份的归档要在持有任何一天的锁之前展开；
+            # 涉及两天时按日期顺序加锁，避免相反方向的移动互相等待
+            first, second = sorted((old_date, new_date))
+            with self.root_lock.shared():
+                self.ensure_month_writable(old_date)
+                self.ensure_month_writable(new_date)
+                with self.document_lock('runs', first), self.document_lock('runs', second):
+                    if self.sqlite:
+                        old = self.sqlite.get_run(run_id)
+                    else:
+                        old = self.find_run_in_day(old_date, run_id)
+                    if old is None:
+                        return None
+                    
+                    merged = dict(old)
+                    merged.update(changes)
+                    merged['run_id'] = run_id
+                    merged['date'] = new_date
+                    new = self.split_run_track(RunRecord.coerce(merged).to_dict())
+                    
+                    if self.sqlite:
+                        self.sqlite.update_run(run_id, new)
+                    elif new_date == old_date:
+                        self.apply_run_change(old_date, {'op': 'update', 'run': new})
+                    else:
+                        self.apply_run_change(old_date, {'op': 'delete', 'run_id': run_id})
+                        self.apply_run_change(new_date, {'op': 'add', 'run': new})
+                    
+                    self.update_run_statistics(old, sign=-1)
+                    self.update_run_statistics(new)
+                    
+                    if new_date != old_date:
+                        remaining = self.load_daily_run_data(old_date).get('runs', [])
+                        self.mark_calendar_date(old_date, 'runs', bool(remaining))
+                        self.mark_calendar_date(new_date, 'runs', True)
+                        self.index_run(run_id, new_date)
+                    
+                    return new
             
-            return backup_dir
+        except Exception as e:
+            print(f"修改跑步记录失败: {e}")
+            return None
+    
+    def scan_archived_months(self):
+        """扫描归档目录中已归档的月份"""
+        return {
+            filename[:-len(ARCHIVE_SUFFIX)] for filename in os.listdir(self.archive_dir)
+            if filename.endswith(ARCHIVE_SUFFIX)
+        }
+    
+    def get_archive_file(self, month):
+        """获取月归档文件路径"""
+        return os.path.join(self.archive_dir, f'{month}{ARCHIVE_SUFFIX}')
+    
+    @state_locked
+    def get_archive(self, month):
+        """打开（或复用已打开的）月归档"""
+        archive = self.archives.get(month)
+        if archive is None:
+            archive = MonthArchive(self.get_archive_file(month))
+            self.archives[month] = archive
+        return archive
+    
+    def close_archives(self):
+        """关闭所有已打开的月归档"""
+        for archive in self.archives.values():
+            archive.close()
+        self.archives = {}
+    
+    @state_locked
+    def load_archived_day(self, data_type, date):
+        """从月归档读取某天的文档副本，返回 (该月是否仍已归档, 文档或None)
+        
+        在状态锁内重新确认：该月归档可能刚被展开回每日文件，此时调用方改读每日文件。
+        """
+        if date[:7] not in self.archived_months:
+            return False, None
+        data = self.get_archive(date[:7]).get_day(data_type, date)
+        return True, (copy.deepcopy(data) if data is not None else None)
+    
+    def load_archive_cutoff(self):
+        """读取上次归档时的截止月份（没有归档过或之后展开过归档时返回None）"""
+        if not os.path.exists(self.archive_state_file):
+            return None
+        try:
+            return json_codec.load_file(self.archive_state_file).get('cutoff')
+        except Exception as e:
+            print(f"读取归档状态失败: {e}")
+            return None
+    
+    @exclusive
+    def archive_closed_months(self, keep_months=3):
+        """将早于最近 keep_months 个月的数据打包为月归档，返回归档的月数
+        
+        归档后当月的每日文件被删除，读取时透明地从归档获取；
+        之后若再写入该月，会先把归档展开回每日文件。截止月份与上次归档
+        相同时（没有新的月份结束，也没有展开过归档）直接返回。仅JSON后端。
+        """
+        if self.sqlite:
+            return 0
+        
+        try:
+            now = datetime.now()
+            index = now.year * 12 + now.month - 1 - keep_months
+            cutoff = f"{index // 12:04d}-{index % 12 + 1:02d}"
+            if self.load_archive_cutoff() == cutoff:
+                return 0
+            
+            # 合并追加日志并落盘，之后直接读写每日文件
+            self.compact_all_run_journals()
+            self.flush()
+            
+            run_dates = [d for d in self.list_run_dates(include_archive=False) if d[:7] <= cutoff]
+            food_dates = [d for d in self.list_food_dates(include_archive=False) if d[:7] <= cutoff]
+            months = sorted({d[:7] for d in run_dates + food_dates})
+            
+            for month in months:
+                run_days = {d: self.load_daily_run_data(d) for d in run_dates if d[:7] == month}
+                food_days = {d: self.load_daily_food_data(d) for d in food_dates if d[:7] == month}
+                
+                run_days = {d: data for d, data in run_days.items() if data.get('runs')}
+                food_days = {d: data for d, data in food_days.items() if data.get('foods')}
+                
+                self.writer.write_bytes(self.get_archive_file(month),
+                                        build_month_archive(month, run_days, food_days))
+                self.archived_months.add(month)
+                
+                # 归档写入后再删除每日文件
+                for date in [d for d in run_dates if d[:7] == month]:
+                    self.writer.remove(os.path.join(self.runs_dir, f'runs_{date}.json'))
+                    self.cache.invalidate(('runs', date))
+                for date in [d for d in food_dates if d[:7] == month]:
+                    self.writer.remove(os.path.join(self.foods_dir, f'foods_{date}.json'))
+                    self.cache.invalidate(('foods', date))
+            
+            self.writer.write_json(self.archive_state_file, {'cutoff': cutoff})
+            if months:
+                print(f"已归档 {len(months)} 个月的历史数据")
+            return len(months)
+            
+        except Exception as e:
+            print(f"归档历史数据失败: {e}")
+            return 0
+    
+    def ensure_month_writable(self, date):
+        """写入已归档月份前，先把该月归档展开回每日文件
+        
+        展开时按顺序持有该月有记录的各天的文档锁，因此不能在已持有该月某天的锁时
+        调用（写入方通过 document_lock 的 writable 参数在加锁前调用）。每日文件
+        写好后才在状态锁内切换，并发读取要么读到归档，要么读到完整的每日文件。
+        """
+        month = date[:7]
+        if month not in self.archived_months:
+            return
+        
+        # 全程持有根目录共享锁：期间不会有独占操作重新归档或关闭归档
+        with self.root_lock.shared():
+            with self.state_lock:
+                if month not in self.archived_months:
+                    return
+                documents = self.get_archive(month).documents()
+            
+            keys = sorted([('runs', day) for day in documents['runs']] +
+                          [('foods', day) for day in documents['foods']])
+            with ExitStack() as stack:
+                for key in keys:
+                    stack.enter_context(self.document_locks.get(key))
+                
+                with self.state_lock:
+                    # 等待锁期间可能已被其他线程展开
+                    if month not in self.archived_months:
+                        return
+                    
+                    for day, data in documents['runs'].items():
+                        self.writer.write_json(os.path.join(self.runs_dir, f'runs_{day}.json'), data)
+                    for day, data in documents['foods'].items():
+                        self.writer.write_json(os.path.join(self.foods_dir, f'foods_{day}.json'), data)
+                    
+                    self.get_archive(month).close()
+                    del self.archives[month]
+                    self.writer.remove(self.get_archive_file(month))
+                    self.archived_months.discard(month)
+                    
+                    # 下次归档时重新打包该月
+                    if os.path.exists(self.archive_state_file):
+                        self.writer.remove(self.archive_state_file)
+    
+    @exclusive
+    def verify(self, repair=False, quarantine=False, workers=None, progress_callback=None):
+        """检查全部数据的完整性，返回检查报告
+        
+        检查JSON能否解析、文档结构和记录格式、营养汇总与食物条目是否一致、
+        路线时间和距离是否单调、轨迹文件是否缺失或损坏。JSON后端按文件
+        用进程池并行检查，workers 为进程数（None 为CPU核数，0 为在当前
+        进程中逐个检查）；progress_callback(已检查文件数, 文件总数)。
+        
+        quarantine 为 True 时把无法读取的文件和无人引用的轨迹移到
+        quarantine/ 目录；repair 为 True 时就地修复可修复的问题（原文件
+        先复制到隔离目录）。有文件变动时重建累计统计和各项索引。
+        SQLite后端只检查不修复。
+        """
+        started = time.time()
+        report = {
+            'checked_at': datetime.now().isoformat(),
+            'backend': self.backend,
+            'files': 0,
+            'records': 0,
+            'issues': [],
+            'quarantined': [],
+            'repaired': []
+        }
+        
+        try:
+            self.flush()
+            
+            if self.sqlite:
+                results = self.verify_sqlite_records()
+            else:
+                results = self.verify_data_files(workers, progress_callback)
+            
+            for result in results:
+                report['files'] += 1
+                report['records'] += result['records']
+                report['issues'].extend(result['issues'])
+            
+            if not self.sqlite:
+                report['issues'].extend(self.find_orphan_tracks(results))
+                
+                stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                if quarantine:
+                    report['quarantined'] = self.quarantine_files(report['issues'], stamp)
+                if repair:
+                    report['repaired'] = self.repair_files(report['issues'], stamp)
+                
+                if report['quarantined'] or report['repaired']:
+                    self.reload_derived_state()
+            
+        except Exception as e:
+            print(f"数据完整性检查失败: {e}")
+            report['error'] = str(e)
+        
+        report['summary'] = integrity.summarize(report)
+        report['elapsed'] = time.time() - started
+        print(f"数据检查完成: {report['files']} 个文件, {len(report['issues'])} 个问题, "
+              f"用时 {report['elapsed']:.2f} 秒")
+        return report
+    
+    def verify_data_files(self, workers=None, progress_callback=None):
+        """并行检查数据目录中的每日文件、追加日志和月归档"""
+        paths = []
+        for directory in (self.runs_dir, self.foods_dir, self.archive_dir):
+            for filename in sorted(os.listdir(directory)):
+                path = os.path.join(directory, filename)
+                if os.path.isfile(path) and integrity.parse_data_file(path):
+                    paths.append(path)
+        
+        tasks = [(path, self.tracks_dir) for path in paths]
+        total = len(tasks)
+        results = []
+        
+        if workers is None:
+            workers = os.cpu_count() or 1
+        
+        # 文件很少时启动进程的开销大于检查本身
+        if workers > 1 and total >= workers * 4:
+            try:
+                from concurrent.futures import ProcessPoolExecutor
+                
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    chunksize = max(1, total // (workers * 8))
+                    for result in executor.map(integrity.verify_file, tasks, chunksize=chunksize):
+                        results.append(result)
+                        if progress_callback:
+                            progress_callback(len(results), total)
+                return results
+                
+            except Exception as e:
+                # 部分平台（如安卓）不支持多进程，退回逐个检查
+                print(f"无法使用进程池，改为逐个检查: {e}")
+                results = []
+        
+        for task in tasks:
+            results.append(integrity.verify_file(task))
+            if progress_callback:
+                progress_callback(len(results), total)
+        return results
+    
+    def verify_sqlite_records(self):
+        """检查SQLite数据库（数据库自检和逐天记录检查）"""
+        from utils.sqlite_storage import RECORD_RUN, RECORD_FOOD_DAY
+        
+        results = []
+        db_issues = [integrity.make_issue('sqlite', message)
+                     for message in self.sqlite.integrity_check()]
+        results.append({'path': self.sqlite_file, 'kind': 'sqlite', 'date': None,
+                        'issues': db_issues, 'records': 0, 'run_ids': []})
+        
+        run_days = {}
+        for date, run in self.sqlite.iter_records(RECORD_RUN):
+            run_days.setdefault(date, []).append(run)
+        
+        for date, runs in run_days.items():
+            issues, run_ids = integrity.check_run_day({'date': date, 'runs': runs},
+                                                      date, self.tracks_dir)
+            results.append({'path': self.sqlite_file, 'kind': 'runs', 'date': date,
+                            'issues': issues, 'records': len(runs), 'run_ids': run_ids})
+        
+        for date, data in self.sqlite.iter_records(RECORD_FOOD_DAY):
+            issues = integrity.check_food_day(data, date)
+            results.append({'path': self.sqlite_file, 'kind': 'foods', 'date': date,
+                            'issues': issues, 'records': len(data.get('foods', [])),
+                            'run_ids': []})
+        
+        for result in results:
+            for issue in result['issues']:
+                issue.setdefault('path', result['path'])
+                issue.setdefault('date', result['date'])
+                issue['kind'] = result['kind']
+                issue['repairable'] = False
+        return results
+    
+    def find_orphan_tracks(self, results):
+        """找出没有任何跑步记录引用的轨迹文件"""
+        referenced = set()
+        for result in results:
+            referenced.update(result['run_ids'])
+        
+        issues = []
+        for filename in sorted(os.listdir(self.tracks_dir)):
+            if filename.endswith('.trk') and filename[:-len('.trk')] not in referenced:
+                issue = integrity.make_issue('orphan_track', "轨迹文件没有对应的跑步记录")
+                issue.update(path=os.path.join(self.tracks_dir, filename), date=None, kind='track')
+                issues.append(issue)
+        return issues
+    
+    def get_quarantine_path(self, path, stamp):
+        """数据文件在隔离目录中的位置（保留相对数据目录的路径）"""
+        relative = os.path.relpath(path, self.data_dir)
+        target = os.path.join(self.quarantine_dir, stamp, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        return target
+    
+    def quarantine_files(self, issues, stamp):
+        """把无法读取的文件和无人引用的轨迹移到隔离目录，返回移动的文件列表"""
+        moved = []
+        
+        for issue in issues:
+            if issue['code'] not in integrity.FATAL_CODES + ('orphan_track',):
+                continue
+            path = issue['path']
+            if path in moved or not os.path.exists(path):
+                continue
+            
+            try:
+                if issue['kind'] == 'archive' and issue['code'] == 'bad_archive':
+                    month = issue['date']
+                    archive = self.archives.pop(month, None)
+                    if archive is not None:
+                        archive.close()
+                    self.archived_months.discard(month)
+                
+                os.replace(path, self.get_quarantine_path(path, stamp))
+                moved.append(path)
+                
+            except Exception as e:
+                print(f"隔离文件失败 {path}: {e}")
+        
+        if moved:
+            print(f"已隔离 {len(moved)} 个文件到: {os.path.join(self.quarantine_dir, stamp)}")
+        return moved
+    
+    def repair_files(self, issues, stamp):
+        """就地修复每日文件中可修复的问题，返回修复的文件列表
+        
+        只有确实改动的文件才把原文件复制到隔离目录。
+        """
+        targets = {}
+        for issue in issues:
+            if (issue['repairable'] and issue['code'] in integrity.REPAIRABLE_CODES and
+                    issue['kind'] in ('runs', 'foods', 'journal')):
+                targets.setdefault(issue['path'], issue)
+        
+        repaired = []
+        for path, issue in sorted(targets.items()):
+            if not os.path.exists(path):
+                continue
+            
+            try:
+                date = issue['date']
+                
+                if issue['kind'] == 'journal':
+                    # 压缩时跳过无法解析的行，日志文件随后被删除
+                    shutil.copy2(path, self.get_quarantine_path(path, stamp))
+                    self.compact_run_journal(date)
+                else:
+                    data, fixes = integrity.repair_document(
+                        issue['kind'], json_codec.load_file(path), date
+                    )
+                    if not fixes:
+                        continue
+                    shutil.copy2(path, self.get_quarantine_path(path, stamp))
+                    self.writer.write_json(path, data)
+                    self.cache.invalidate((issue['kind'], date))
+                
+                repaired.append(path)
+                
+            except Exception as e:
+                print(f"修复文件失败 {path}: {e}")
+        
+        if repaired:
+            print(f"已修复 {len(repaired)} 个文件")
+        return repaired
+    
+    def reload_derived_state(self):
+        """数据文件被隔离或修复后，重新建立缓存、累计统计和各项索引"""
+        self.cache.clear()
+        self.journal_counts = {}
+        self.journal_seqs = {}
+        self.archived_months = self.scan_archived_months()
+        self.statistics = None
+        self.rebuild_statistics()
+        self.rebuild_calendar_index()
+        self.rebuild_rollups()
+        self.backfill_run_ids()
+        self.rebuild_run_index()
+    
+    def backup_data(self, backup_path, incremental=False, progress_callback=None):
+        """备份数据到压缩归档，返回归档路径
+        
+        只在建立快照时独占根目录，压缩和写入归档期间其他读写照常进行。
+        progress_callback(已完成文件数, 文件总数)
+        """
+        snapshot_dir = None
+        try:
+            with self.root_lock.exclusive():
+                # 先让窗口内的写入落盘，SQLite把WAL合并回主库
+                self.flush()
+                if self.sqlite:
+                    self.sqlite.checkpoint()
+                snapshot_dir = self.backup_manager.create_snapshot()
+            
+            return self.backup_manager.create_backup(backup_path, incremental, progress_callback,
+                                                     source_dir=snapshot_dir)
             
         except Exception as e:
             print(f"数据备份失败: {e}")
             return None
+        finally:
+            if snapshot_dir:
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
     
-    def restore_data(self, backup_path):
-        """恢复数据"""
+    @exclusive
+    def restore_data(self, backup_path, progress_callback=None):
+        """从备份恢复数据（校验全部文件后原子替换数据目录）
+        
+        替换下来的旧数据目录（<数据目录>.before_restore_<时间>）保留到下次
+        打开数据目录成功时删除，也可以调用 remove_before_restore_copies 提前删除。
+        """
         try:
-            import shutil
+            self.flush()
+            if self.sqlite:
+                self.sqlite.close_all()
+            self.close_archives()
             
-            # 备份当前数据
-            current_backup = self.backup_data('.')
+            if os.path.isdir(backup_path):
+                # 兼容旧版目录备份
+                old_dir = self.backup_manager.restore_directory(backup_path)
+            else:
+                old_dir = self.backup_manager.restore_backup(backup_path, progress_callback)
             
-            # 清除当前数据
-            shutil.rmtree(self.data_dir)
+            if old_dir:
+                print(f"恢复前的数据暂时保留在: {old_dir}（下次打开数据目录时删除）")
             
-            # 恢复备份数据
-            shutil.copytree(backup_path, self.data_dir)
+            os.makedirs(self.runs_dir, exist_ok=True)
+            os.makedirs(self.foods_dir, exist_ok=True)
+            os.makedirs(self.tracks_dir, exist_ok=True)
+            os.makedirs(self.archive_dir, exist_ok=True)
+            if self.sqlite:
+                self.sqlite.init_schema()
+            
+            # 备份中的累计统计和日历索引可能已过期，重新统计
+            self.reload_derived_state()
             
             return True
             
@@ -324,10 +2172,50 @@ class StorageManager:
             print(f"数据恢复失败: {e}")
             return False
     
+    def backup_data_async(self, backup_path, incremental=False,
+                          progress_callback=None, done_callback=None):
+        """在后台线程中备份，完成后调用 done_callback(归档路径或None)
+        
+        回调在后台线程中执行，更新界面时需通过 Clock.schedule_once 转回主线程。
+        """
+        def backup_thread():
+            result = self.backup_data(backup_path, incremental, progress_callback)
+            if done_callback:
+                done_callback(result)
+        
+        thread = threading.Thread(target=backup_thread, daemon=True)
+        thread.start()
+        return thread
+    
+    def restore_data_async(self, backup_path, progress_callback=None, done_callback=None):
+        """在后台线程中恢复，完成后调用 done_callback(是否成功)"""
+        def restore_thread():
+            result = self.restore_data(backup_path, progress_callback)
+            if done_callback:
+                done_callback(result)
+        
+        thread = threading.Thread(target=restore_thread, daemon=True)
+        thread.start()
+        return thread
+    
+    def remove_before_restore_copies(self):
+        """删除恢复前保留的旧数据目录，返回删除的路径列表"""
+        try:
+            return self.backup_manager.remove_before_restore_copies()
+        except Exception as e:
+            print(f"删除恢复前的数据失败: {e}")
+            return []
+    
+    @exclusive
     def clear_all_data(self):
         """清除所有数据"""
         try:
-            import shutil
+            # 先写完队列中的内容，避免删除后又被写回
+            self.flush()
+            
+            if self.sqlite:
+                self.sqlite.close_all()
+            self.close_archives()
             
             if os.path.exists(self.data_dir):
                 shutil.rmtree(self.data_dir)
@@ -335,6 +2223,27 @@ class StorageManager:
             self.ensure_data_dir()
             os.makedirs(self.runs_dir, exist_ok=True)
             os.makedirs(self.foods_dir, exist_ok=True)
+            os.makedirs(self.tracks_dir, exist_ok=True)
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self.archived_months = set()
+            
+            # 追加日志已随数据目录删除，按天的日志行数和序号从头开始
+            with self.state_lock:
+                self.journal_counts = {}
+                self.journal_seqs = {}
+            
+            if self.sqlite:
+                self.sqlite.init_schema()
+            
+            self.cache.clear()
+            self.statistics = self.empty_statistics()
+            self.save_statistics()
+            self.calendar_index = {}
+            self.save_calendar_index()
+            self.rollups = empty_rollups()
+            self.save_rollups()
+            self.run_index = {}
+            self.save_run_index()
             
             return True
             
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+跑步轨迹紧凑编码
+将路线点（经纬度、时间、距离、精度、来源、海拔）按列做差分定点编码，
+可选zlib压缩；轨迹保存为独立文件
+"""
+
+import sys
+import zlib
+import struct
+from array import array
+from datetime import datetime
+from itertools import accumulate
+
+# 格式标识
+TRACK_FORMAT = 'trk1'
+MAGIC = b'TRK1'
+
+# 头部：魔数、标志位、点数、起始时间（毫秒）
+HEADER = struct.Struct('<4sBIq')
+FLAG_COMPRESSED = 0x01
+FLAG_ALTITUDE = 0x02      # 末尾附加海拔列（早期轨迹没有）
+FLAG_WIDE_TIME = 0x04     # 时间差分列为64位（有超出32位范围的时间差时）
+
+# 定点精度
+COORD_SCALE = 10 ** 7     # 经纬度 1e-7 度（约1厘米）
+DISTANCE_SCALE = 100      # 距离 厘米
+ACCURACY_SCALE = 10       # 精度 分米
+ALTITUDE_SCALE = 10       # 海拔 分米
+
+# 数据来源编码
+SOURCES = ['gps', 'pedometer']
+
+# 32位差分列的取值范围
+INT32_MIN = -2 ** 31
+INT32_MAX = 2 ** 31 - 1
+
+
+def _timestamp_ms(value):
+    """将时间戳（datetime / ISO字符串 / 秒）转换为毫秒"""
+    if value is None:
+        return 0
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, str):
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    return int(float(value) * 1000)
+
+
+def _wrap_lon(fixed):
+    """定点经度（或经度差）换算到 [-180, 180) 度：跨越180度经线的差分取较短方向"""
+    return (fixed + 180 * COORD_SCALE) % (360 * COORD_SCALE) - 180 * COORD_SCALE
+
+
+def _coord(value, limit):
+    """经纬度转换为定点整数：纬度截断到 ±90 度，经度换算到 [-180, 180) 度"""
+    fixed = int(round(float(value or 0) * COORD_SCALE))
+    if limit == 90:
+        return max(-90 * COORD_SCALE, min(fixed, 90 * COORD_SCALE))
+    return _wrap_lon(fixed)
+
+
+def _to_bytes(arr):
+    """按小端序输出数组字节"""
+    if sys.byteorder == 'big':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_bytes(typecode, data, offset, count):
+    """从字节中按小端序读取数组，返回 (数组, 新偏移)"""
+    arr = array(typecode)
+    size = arr.itemsize * count
+    arr.frombytes(data[offset:offset + size])
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr, offset + size
+
+
+def pack_route(route, compress=True):
+    """将路线点列表打包为字节
+
+    缺少时间的点沿用上一个点的时间；相邻时间差超出32位范围（如时间为0的点
+    夹在真实时间之间）时时间列按64位保存。
+    """
+    count = len(route)
+
+    times = array('q')
+    lats = array('i')
+    lons = array('i')
+    distances = array('i')
+    accuracies = array('H')
+    sources = array('B')
+    steps = array('i')
+    altitudes = array('i')
+
+    # 只有GPS点有海拔，缺失时沿用上一个值
+    has_altitude = any(point.get('altitude') is not None for point in route)
+    prev_altitude = 0
+
+    base_time = _timestamp_ms(route[0].get('timestamp')) if count else 0
+    prev = [base_time, 0, 0, 0, 0]
+    prev_time = base_time
+
+    for point in route:
+        source = point.get('source', 'gps')
+        if source == 'pedometer':
+            distance = point.get('estimated_distance', 0)
+        else:
+            distance = point.get('distance', 0)
+
+        timestamp = point.get('timestamp')
+        current = [
+            _timestamp_ms(timestamp) if timestamp is not None else prev_time,
+            _coord(point.get('lat', 0), 90),
+            _coord(point.get('lon', 0), 180),
+            int(round(distance * DISTANCE_SCALE)),
+            int(point.get('steps', 0))
+        ]
+        prev_time = current[0]
+
+        times.append(current[0] - prev[0])
+        lats.append(current[1] - prev[1])
+        lons.append(_wrap_lon(current[2] - prev[2]))
+        distances.append(current[3] - prev[3])
+        steps.append(current[4] - prev[4])
+        accuracy = int(round((point.get('accuracy') or 0) * ACCURACY_SCALE))
+        accuracies.append(max(0, min(accuracy, 0xFFFF)))
+        sources.append(SOURCES.index(source) if source in SOURCES else 0)
+
+        if has_altitude:
+            altitude = point.get('altitude')
+            current_altitude = (int(round(altitude * ALTITUDE_SCALE)) if altitude is not None
+                                else prev_altitude)
+            altitudes.append(current_altitude - prev_altitude)
+            prev_altitude = current_altitude
+
+        prev = current
+
+    flags = 0
+    if all(INT32_MIN <= value <= INT32_MAX for value in times):
+        times = array('i', times)
+    else:
+        flags |= FLAG_WIDE_TIME
+
+    columns = [times, lats, lons, distances, steps, accuracies, sources]
+    if has_altitude:
+        columns.append(altitudes)
+        flags |= FLAG_ALTITUDE
+
+    body = b''.join(_to_bytes(column) for column in columns)
+
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_COMPRESSED
+
+    return HEADER.pack(MAGIC, flags, count, base_time) + body
+
+
+def unpack_columns(data):
+    """将字节解包为按列的数组，不构造逐点字典（轨迹分析等批量计算使用）
+
+    返回 {'time': 毫秒, 'lat', 'lon': 度, 'distance': 米（步数点为估算距离）,
+    'steps', 'accuracy': 米, 'source': SOURCES中的序号, 'altitude': 米或None}
+    """
+    magic, flags, count, base_time = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("不是有效的轨迹数据")
+
+    body = data[HEADER.size:]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+
+    offset = 0
+    times, offset = _from_bytes('q' if flags & FLAG_WIDE_TIME else 'i', body, offset, count)
+    lats, offset = _from_bytes('i', body, offset, count)
+    lons, offset = _from_bytes('i', body, offset, count)
+    distances, offset = _from_bytes('i', body, offset, count)
+    steps, offset = _from_bytes('i', body, offset, count)
+    accuracies, offset = _from_bytes('H', body, offset, count)
+    sources, offset = _from_bytes('B', body, offset, count)
+
+    altitude = None
+    if flags & FLAG_ALTITUDE:
+        altitudes, offset = _from_bytes('i', body, offset, count)
+        altitude = array('d', (value / ALTITUDE_SCALE for value in accumulate(altitudes)))
+
+    # 差分还原为绝对值
+    return {
+        'time': array('q', (base_time + value for value in accumulate(times))),
+        'lat': array('d', (value / COORD_SCALE for value in accumulate(lats))),
+        'lon': array('d', (_wrap_lon(value) / COORD_SCALE for value in accumulate(lons))),
+        'distance': array('d', (value / DISTANCE_SCALE for value in accumulate(distances))),
+        'steps': array('q', accumulate(steps)),
+        'accuracy': array('d', (value / ACCURACY_SCALE for value in accuracies)),
+        'source': sources,
+        'altitude': altitude
+    }
+
+
+def unpack_route(data):
+    """将字节解包为路线点列表"""
+    columns = unpack_columns(data)
+    altitudes = columns['altitude']
+
+    route = []
+    for i, t in enumerate(columns['time']):
+        timestamp = datetime.fromtimestamp(t / 1000).isoformat()
+        source = SOURCES[columns['source'][i]]
+
+        if source == 'pedometer':
+            route.append({
+                'steps': columns['steps'][i],
+                'estimated_distance': columns['distance'][i],
+                'timestamp': timestamp,
+                'source': source
+            })
+        else:
+            point = {
+                'lat': columns['lat'][i],
+                'lon': columns['lon'][i],
+                'timestamp': timestamp,
+                'distance': columns['distance'][i],
+                'accuracy': columns['accuracy'][i],
+                'source': source
+            }
+            if altitudes is not None:
+                point['altitude'] = altitudes[i]
+            route.append(point)
+
+    return route
+
+
+def get_run_route(run_record):
+    """获取记录中内嵌的路线点列表（轨迹尚未拆分为独立文件的旧记录）"""
+    return run_record.get('route') or []
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+跑步轨迹分析
+按列（数组）计算累计距离、每公里分段、移动/停止时间、配速序列、
+最大速度和累计爬升。安装了NumPy时一次向量化计算完成，
+否则使用结果相同的纯Python实现。
+
+运行 python tests/benchmarks.py metrics 比较两种实现在5万点轨迹上的耗时
+"""
+
+import math
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS = 6371000      # 地球半径（米）
+SPLIT_DISTANCE = 1000.0     # 分段距离（米）
+STOP_SPEED = 0.5            # 低于此速度（米/秒）视为停止
+SPEED_WINDOW = 10.0         # 配速序列按最近10秒的平均速度计算
+MIN_SPEED_SPAN = 3.0        # 最大速度只取时间跨度不少于3秒的窗口，避免单点漂移
+ALTITUDE_SMOOTHING = 5      # 海拔按5点滑动平均后再累计爬升
+
+# 数据来源序号（与 track_codec.SOURCES 一致）
+SOURCE_GPS = 0
+SOURCE_PEDOMETER = 1
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """两点间的球面距离（米）"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _seconds(value):
+    """路线点时间（datetime / ISO字符串 / 秒）转换为秒"""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value or 0)
+
+
+def route_columns(route):
+    """将路线点列表拆成分析所需的列
+
+    返回 (时间秒, 纬度, 经度, 海拔, 来源, 距离)；海拔缺失为NaN，
+    步数点的距离为估算的累计距离。
+    """
+    times = array('d')
+    lats = array('d')
+    lons = array('d')
+    altitudes = array('d')
+    sources = array('B')
+    distances = array('d')
+    nan = float('nan')
+
+    for point in route:
+        pedometer = point.get('source') == 'pedometer'
+        times.append(_seconds(point.get('timestamp')))
+        lats.append(point.get('lat') or 0.0)
+        lons.append(point.get('lon') or 0.0)
+        altitude = point.get('altitude')
+        altitudes.append(nan if pedometer or altitude is None else altitude)
+        sources.append(SOURCE_PEDOMETER if pedometer else SOURCE_GPS)
+        distances.append((point.get('estimated_distance') if pedometer
+                          else point.get('distance')) or 0.0)
+
+    return times, lats, lons, altitudes, sources, distances
+
+
+def route_distance_source(route):
+    """路线累计距离的来源：'gps'、'pedometer'，两种都有时为 'mixed'
+
+    步数点的估算距离在每次切换到步数模式时从0开始，切回GPS后GPS点的
+    累计距离也接在步数估算值之后，只有 'gps' 的累计距离可以逐点比较。
+    """
+    sources = {'pedometer' if isinstance(point, dict) and point.get('source') == 'pedometer'
+               else 'gps' for point in route}
+    if len(sources) > 1:
+        return 'mixed'
+    return sources.pop() if sources else 'gps'
+
+
+def analyze_route(route, **kwargs):
+    """分析路线点列表（字典形式，时间可以是datetime或ISO字符串）"""
+    return analyze_track(*route_columns(route), **kwargs)
+
+
+def analyze_columns(columns, **kwargs):
+    """分析 track_codec.unpack_columns 解出的轨迹列"""
+    if np is not None:
+        times = np.asarray(columns['time'], dtype=float) / 1000.0
+    else:
+        times = array('d', (t / 1000.0 for t in columns['time']))
+
+    altitudes = columns.get('altitude')
+    if altitudes is not None:
+        # 步数点没有海拔
+        nan = float('nan')
+        altitudes = array('d', (nan if source == SOURCE_PEDOMETER else altitude
+                                for altitude, source in zip(altitudes, columns['source'])))
+
+    return analyze_track(times, columns['lat'], columns['lon'], altitudes,
+                         columns['source'], columns['distance'], **kwargs)
+
+
+def analyze_track(times, lats, lons, altitudes=None, sources=None, distances=None,
+                  split_distance=SPLIT_DISTANCE, stop_speed=STOP_SPEED, use_numpy=None):
+    """计算轨迹指标
+
+    times 为秒，lats/lons 为度，altitudes 为米（缺失为NaN），
+    sources 为来源序号（缺省全部为GPS），distances 为步数点的估算累计距离。
+    GPS点之间按球面距离、步数点之间按估算距离差计算，两种来源切换处不计距离。
+
+    返回 {'points', 'distance', 'duration', 'moving_time', 'stopped_time',
+    'max_speed'（米/秒）, 'average_pace'（移动配速，分钟/公里）,
+    'elevation_gain', 'elevation_loss', 'splits': [{'distance', 'duration', 'pace'}],
+    'cumulative_distance': array('d'), 'pace': array('d')（分钟/公里，停止时为0）}
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+
+    if len(times) < 2:
+        return empty_metrics(len(times))
+
+    if use_numpy:
+        return _analyze_numpy(times, lats, lons, altitudes, sources, distances,
+                              split_distance, stop_speed)
+    return _analyze_python(times, lats, lons, altitudes, sources, distances,
+                           split_distance, stop_speed)
+
+
+def empty_metrics(points=0):
+    """少于两个点时的空结果"""
+    return {
+        'points': points,
+        'distance': 0.0,
+        'duration': 0.0,
+        'moving_time': 0.0,
+        'stopped_time': 0.0,
+        'max_speed': 0.0,
+        'average_pace': 0.0,
+        'elevation_gain': 0.0,
+        'elevation_loss': 0.0,
+        'splits': [],
+        'cumulative_distance': array('d', [0.0] * points),
+        'pace': array('d', [0.0] * points)
+    }
+
+
+def _pace(speed, stop_speed):
+    """速度（米/秒）换算为配速（分钟/公里），停止时为0"""
+    return 1000.0 / 60.0 / speed if speed >= stop_speed else 0.0
+
+
+def _build_splits(crossings, start_time, end_time, total_distance, split_distance):
+    """由每个分段终点的时刻生成分段列表（最后不足一段的部分单独列出）"""
+    boundaries = [start_time] + list(crossings)
+    splits = []
+
+    for i in range(len(crossings)):
+        duration = boundaries[i + 1] - boundaries[i]
+        splits.append({
+            'distance': split_distance,
+            'duration': duration,
+            'pace': duration / 60.0 / (split_distance / 1000.0)
+        })
+
+    remaining = total_distance - split_distance * len(crossings)
+    if remaining >= 1.0:
+        duration = end_time - boundaries[-1]
+        splits.append({
+            'distance': remaining,
+            'duration': duration,
+            'pace': duration / 60.0 / (remaining / 1000.0)
+        })
+
+    return splits
+
+
+def _finish(points, cumulative, times, moving_time, max_speed, gain, loss,
+            crossings, pace, split_distance):
+    """汇总两种实现的公共结果"""
+    total = cumulative[-1]
+    duration = times[-1] - times[0]
+    return {
+        'points': points,
+        'distance': total,
+        'duration': duration,
+        'moving_time': moving_time,
+        'stopped_time': duration - moving_time,
+        'max_speed': max_speed,
+        'average_pace': (moving_time / 60.0) / (total / 1000.0) if total > 0 else 0.0,
+        'elevation_gain': gain,
+        'elevation_loss': loss,
+        'splits': _build_splits(crossings, times[0], times[-1], total, split_distance),
+        'cumulative_distance': cumulative,
+        'pace': pace
+    }
+
+
+def _analyze_numpy(times, lats, lons, altitudes, sources, distances,
+                   split_distance, stop_speed):
+    """NumPy向量化实现"""
+    n = len(times)
+    # GPS时间偶有倒退，按单调不减处理
+    t = np.maximum.accumulate(np.asarray(times, dtype=float))
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+
+    if sources is None:
+        gps = np.ones(n, dtype=bool)
+    else:
+        gps = np.asarray(sources) != SOURCE_PEDOMETER
+
+    # 每段距离
+    a = (np.sin((lat[1:] - lat[:-1]) / 2) ** 2 +
+         np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin((lon[1:] - lon[:-1]) / 2) ** 2)
+    segment = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    both_gps = gps[1:] & gps[:-1]
+    segment = np.where(both_gps, segment, 0.0)
+    if distances is not None:
+        estimated = np.asarray(distances, dtype=float)
+        both_pedometer = ~gps[1:] & ~gps[:-1]
+        segment = np.where(both_pedometer,
+                           np.maximum(estimated[1:] - estimated[:-1], 0.0), segment)
+
+    cumulative = np.concatenate(([0.0], np.cumsum(segment)))
+
+    # 移动时间：段平均速度不低于停止阈值
+    dt = np.diff(t)
+    moving = (dt > 0) & (segment >= stop_speed * dt)
+    moving_time = float(dt[moving].sum())
+
+    # 最近 SPEED_WINDOW 秒的平均速度
+    start = np.searchsorted(t, t - SPEED_WINDOW, side='left')
+    span = t - t[start]
+    speed = np.divide(cumulative - cumulative[start], span,
+                      out=np.zeros(n), where=span > 0)
+    valid = span >= MIN_SPEED_SPAN
+    max_speed = float(speed[valid].max()) if valid.any() else 0.0
+    pace = np.divide(1000.0 / 60.0, speed, out=np.zeros(n), where=speed >= stop_speed)
+
+    # 累计爬升
+    gain = loss = 0.0
+    if altitudes is not None:
+        alt = np.asarray(altitudes, dtype=float)
+        alt = alt[~np.isnan(alt)]
+        if len(alt) >= ALTITUDE_SMOOTHING:
+            window = np.ones(ALTITUDE_SMOOTHING) / ALTITUDE_SMOOTHING
+            alt = np.convolve(alt, window, mode='valid')
+        if len(alt) >= 2:
+            change = np.diff(alt)
+            gain = float(change[change > 0].sum())
+            loss = float(-change[change < 0].sum())
+
+    # 分段：每个整公里处按相邻两点线性插值得到时刻
+    total = cumulative[-1]
+    marks = np.arange(1, int(total // split_distance) + 1) * split_distance
+    after = np.searchsorted(cumulative, marks, side='left')
+    before = after - 1
+    fraction = (marks - cumulative[before]) / (cumulative[after] - cumulative[before])
+    crossings = (t[before] + fraction * (t[after] - t[before])).tolist()
+
+    return _finish(n, array('d', cumulative.tobytes()), t.tolist(), moving_time, max_speed,
+                   gain, loss, crossings, array('d', pace.tobytes()), split_distance)
+
+
+def _analyze_python(times, lats, lons, altitudes, sources, distances,
+                    split_distance, stop_speed):
+    """纯Python实现（没有NumPy时使用）"""
+    n = len(times)
+
+    t = array('d')
+    latest = float('-inf')
+    for value in times:
+        latest = max(latest, value)
+        t.append(latest)
+
+    cumulative = array('d', [0.0])
+    moving_time = 0.0
+    for i in range(1, n):
+        gps_prev = sources is None or sources[i - 1] != SOURCE_PEDOMETER
+        gps_curr = sources is None or sources[i] != SOURCE_PEDOMETER
+
+        if gps_prev and gps_curr:
+            segment = haversine_distance(lats[i - 1], lons[i - 1], lats[i], lons[i])
+        elif not gps_prev and not gps_curr and distances is not None:
+            segment = max(distances[i] - distances[i - 1], 0.0)
+        else:
+            segment = 0.0
+
+        cumulative.append(cumulative[-1] + segment)
+
+        dt = t[i] - t[i - 1]
+        if dt > 0 and segment >= stop_speed * dt:
+            moving_time += dt
+
+    # 滑动窗口平均速度（双指针）
+    pace = array('d')
+    max_speed = 0.0
+    start = 0
+    for i in range(n):
+        while t[start] < t[i] - SPEED_WINDOW:
+            start += 1
+        span = t[i] - t[start]
+        speed = (cumulative[i] - cumulative[start]) / span if span > 0 else 0.0
+        if span >= MIN_SPEED_SPAN:
+            max_speed = max(max_speed, speed)
+        pace.append(_pace(speed, stop_speed))
+
+    gain = loss = 0.0
+    if altitudes is not None:
+        alt = [value for value in altitudes if not math.isnan(value)]
+        k = ALTITUDE_SMOOTHING
+        if len(alt) >= k:
+            alt = [sum(alt[i:i + k]) / k for i in range(len(alt) - k + 1)]
+        for i in range(1, len(alt)):
+            change = alt[i] - alt[i - 1]
+            if change > 0:
+                gain += change
+            else:
+                loss -= change
+
+    crossings = []
+    total = cumulative[-1]
+    for k in range(1, int(total // split_distance) + 1):
+        mark = k * split_distance
+        after = bisect_left(cumulative, mark)
+        before = after - 1
+        fraction = (mark - cumulative[before]) / (cumulative[after] - cumulative[before])
+        crossings.append(t[before] + fraction * (t[after] - t[before]))
+
+    return _finish(n, cumulative, list(t), moving_time, max_speed,
+                   gain, loss, crossings, pace, split_distance)
+
+
+def run_summary(metrics):
+    """保存到跑步记录中的指标（不含逐点序列）"""
+    return {
+        'moving_time': round(metrics['moving_time'], 1),
+        'max_speed': round(metrics['max_speed'], 2),
+        'elevation_gain': round(metrics['elevation_gain'], 1),
+        'elevation_loss': round(metrics['elevation_loss'], 1),
+        'splits': [{'distance': round(split['distance'], 1),
+                    'duration': round(split['duration'], 1)}
+                   for split in metrics['splits']]
+    }
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+延迟写入队列
+合并短时间内对同一文件的多次写入，由后台线程统一落盘
+"""
+
+import threading
+import time
+
+
+class WriteBehindQueue:
+    """延迟写入队列
+
+    submit() 只记录待写入的内容（同一路径后写覆盖先写），后台线程在
+    delay 秒的合并窗口后调用 write_func(path, data) 写入；flush() 在
+    调用线程中立即写完所有待写内容。
+    """
+
+    def __init__(self, write_func, delay=0.5):
+        self.write_func = write_func
+        self.delay = delay
+
+        self._pending = {}
+        self._first_submit_time = None
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._running = True
+
+        # 统计
+        self.submitted = 0
+        self.written = 0
+
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, path, data):
+        """提交一次写入"""
+        with self._condition:
+            if not self._pending:
+                self._first_submit_time = time.time()
+            self._pending[path] = data
+            self.submitted += 1
+            self._condition.notify()
+
+    def get_pending(self, path):
+        """获取尚未落盘的内容（没有时返回None）"""
+        with self._condition:
+            return self._pending.get(path)
+
+    def _write_pending(self):
+        """写入当前全部待写内容
+
+        条目写入成功后才从队列移除（期间读取仍能拿到最新内容）；
+        写入期间被新内容覆盖或写入失败的条目留待下一轮。
+        """
+        with self._condition:
+            snapshot = dict(self._pending)
+
+        for path, data in snapshot.items():
+            try:
+                self.write_func(path, data)
+                self.written += 1
+            except Exception as e:
+                print(f"延迟写入失败 {path}: {e}")
+                continue
+
+            with self._condition:
+                if self._pending.get(path) is data:
+                    del self._pending[path]
+
+        with self._condition:
+            self._first_submit_time = time.time() if self._pending else None
+
+    def _writer_loop(self):
+        """后台写入线程"""
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    return
+
+                # 等待合并窗口结束
+                remaining = self._first_submit_time + self.delay - time.time()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+
+            with self._write_lock:
+                self._write_pending()
+
+    def flush(self):
+        """立即写入所有待写内容（阻塞直到写完）"""
+        with self._write_lock:
+            self._write_pending()
+
+    def stop(self):
+        """写完剩余内容并停止后台线程"""
+        self.flush()
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout=5)